@@ -0,0 +1,239 @@
+# Motor analitico en memoria: la tabla obras se lee una vez a arreglos de NumPy por columna (las lookups quedan como
+# codigos categoricos, que son sus ids) y los indicadores, filtros y agrupamientos se calculan sobre esos arreglos sin
+# volver a la base. Cuando cambia version_datos la copia se refresca leyendo solo las obras de obras_cambios.
+#
+#   motor = Implementacion.analitica()
+#   motor.indicadores()                                            # mismos resultados que calcular_indicadores
+#   motor.agrupar(('comuna', 'etapa'), {'monto': ('monto_contrato', 'sum')}, tipo=['Escuelas'], plazo_meses=(12, 36))
+import numpy as np
+from peewee import chunked
+from modelo_orm import (sqlite_db, Obra, Etapa, Tipo, AreaResponsable, Comuna, Barrio, VersionDatos, ObraCambio,
+                        clave_lookup)
+import indicadores
+from indicadores import en_memoria, ETAPA_FINALIZADA, COMUNAS_SELECCIONADAS
+
+# Columna -> tabla lookup (codigo = id de la lookup)
+COLUMNAS_CATEGORICAS = {'etapa': Etapa, 'tipo': Tipo, 'area_responsable': AreaResponsable, 'comuna': Comuna,
+                        'barrio': Barrio}
+# Columna -> (tipo SQL para el CAST, dtype del arreglo); lat y lng pueden ser NULL y quedan en NaN
+COLUMNAS_NUMERICAS = {
+    'monto_contrato': ('REAL', np.float64),
+    'plazo_meses': ('INTEGER', np.int64),
+    'porcentaje_avance': ('REAL', np.float64),
+    'mano_obra': ('INTEGER', np.int64),
+    'licitacion_anio': ('INTEGER', np.int64),
+    'lat': ('REAL', np.float64),
+    'lng': ('REAL', np.float64),
+}
+# Con mas de esta proporcion de obras cambiadas conviene releer la tabla entera
+PROPORCION_RECARGA = 0.25
+
+
+class AnaliticaObras:
+    def __init__(self):
+        self.version = None
+        self.columnas = {}
+        # Columna categorica -> arreglo de nombres indexado por codigo (None donde no hay id)
+        self.nombres = {}
+
+    def __len__(self):
+        return len(self.columnas.get('id', ()))
+
+    def leer_obras(self, ids=None):
+        # Todas las columnas numericas; el CAST evita que un valor mal cargado (texto en una FK) rompa el arreglo
+        campos = [Obra.id] + [getattr(Obra, columna).cast('INTEGER') for columna in COLUMNAS_CATEGORICAS]
+        campos += [getattr(Obra, columna).cast(tipo) for columna, (tipo, _) in COLUMNAS_NUMERICAS.items()]
+        filas = []
+        if ids is None:
+            filas = sqlite_db.execute(Obra.select(*campos).tuples()).fetchall()
+        else:
+            for lote in chunked(ids, 900):
+                filas += sqlite_db.execute(Obra.select(*campos).where(Obra.id.in_(lote)).tuples()).fetchall()
+        datos = np.array(filas, dtype=np.float64).reshape(len(filas), len(campos))
+        columnas = {'id': datos[:, 0].astype(np.int64)}
+        for posicion, columna in enumerate(COLUMNAS_CATEGORICAS, start=1):
+            columnas[columna] = np.nan_to_num(datos[:, posicion]).astype(np.int32)
+        for posicion, (columna, (_, dtype)) in enumerate(COLUMNAS_NUMERICAS.items(), start=1 + len(COLUMNAS_CATEGORICAS)):
+            valores = datos[:, posicion]
+            columnas[columna] = valores if dtype is np.float64 else np.nan_to_num(valores).astype(dtype)
+        return columnas
+
+    def leer_nombres(self):
+        for columna, clase in COLUMNAS_CATEGORICAS.items():
+            filas = list(clase.select(clase.id, clase.nombre).tuples())
+            # Tambien cubre codigos que apuntan a una fila inexistente (quedan sin nombre)
+            codigos = self.columnas.get(columna)
+            maximo = max(max((id_ for id_, _ in filas), default=0),
+                         int(codigos.max()) if codigos is not None and len(codigos) else 0)
+            nombres = np.full(maximo + 1, None, dtype=object)
+            for id_, nombre in filas:
+                nombres[id_] = nombre
+            self.nombres[columna] = nombres
+
+    def refrescar(self):
+        # Devuelve False si la copia ya estaba al dia. La lectura va en una transaccion para que la version y las
+        # filas correspondan al mismo estado de la base
+        with sqlite_db.atomic():
+            version = VersionDatos.select(VersionDatos.version).where(VersionDatos.id == 1).scalar() or 0
+            if version == self.version:
+                return False
+            cambiadas = None
+            if self.version is not None:
+                cambiadas = np.array([obra_id for (obra_id,) in ObraCambio.select(ObraCambio.obra_id)
+                                      .where(ObraCambio.version > self.version).tuples()], dtype=np.int64)
+            if cambiadas is None or len(cambiadas) > PROPORCION_RECARGA * max(len(self), 1):
+                self.columnas = self.leer_obras()
+            elif len(cambiadas):
+                # Saco las cambiadas (las borradas no vuelven) y agrego su version actual
+                nuevas = self.leer_obras(cambiadas.tolist())
+                conservar = ~np.isin(self.columnas['id'], cambiadas)
+                columnas = {columna: np.concatenate([valores[conservar], nuevas[columna]])
+                            for columna, valores in self.columnas.items()}
+                orden = np.argsort(columnas['id'], kind='stable')
+                self.columnas = {columna: valores[orden] for columna, valores in columnas.items()}
+            # Las lookups son chicas, se releen enteras (un cambio de nombre no pasa por obras_cambios)
+            self.leer_nombres()
+            self.version = version
+        return True
+
+    def codigos(self, columna, nombres):
+        # Codigos de los nombres pedidos por forma canonica, como resuelve la base (la comuna 1 y "1" son la misma,
+        # "finalizada" y "Finalizada" tambien)
+        clase = COLUMNAS_CATEGORICAS[columna]
+        buscados = {clave_lookup(clase, nombre) for nombre in nombres}
+        return np.array([codigo for codigo, nombre in enumerate(self.nombres[columna])
+                         if nombre is not None and clave_lookup(clase, nombre) in buscados], dtype=np.int32)
+
+    def mascara(self, **filtros):
+        # Categoricas: nombre o lista de nombres. Numericas: valor, lista de valores o tupla (minimo, maximo) inclusiva
+        # (None en un extremo lo deja abierto)
+        mascara = np.ones(len(self), dtype=bool)
+        for columna, valor in filtros.items():
+            valores = self.columnas[columna]
+            if columna in COLUMNAS_CATEGORICAS:
+                nombres = valor if isinstance(valor, (list, set, tuple)) else [valor]
+                mascara &= np.isin(valores, self.codigos(columna, nombres))
+            elif isinstance(valor, tuple):
+                minimo, maximo = valor
+                if minimo is not None:
+                    mascara &= valores >= minimo
+                if maximo is not None:
+                    mascara &= valores <= maximo
+            elif isinstance(valor, (list, set)):
+                mascara &= np.isin(valores, list(valor))
+            else:
+                mascara &= valores == valor
+        return mascara
+
+    def agrupar(self, por, valores=None, **filtros):
+        # por: columna o columnas (categoricas o enteras). valores: {alias: (columna, 'count'|'sum'|'mean'|'min'|'max')}
+        # Devuelve {columna o alias: arreglo} con un elemento por grupo, ordenado por codigo como los GROUP BY de SQL
+        por = [por] if isinstance(por, str) else list(por)
+        valores = valores or {'cantidad_obras': ('id', 'count')}
+        mascara = self.mascara(**filtros)
+
+        # Clave unica por grupo combinando los codigos en base mixta
+        clave = np.zeros(int(mascara.sum()), dtype=np.int64)
+        for columna in por:
+            codigos = self.columnas[columna][mascara].astype(np.int64)
+            if len(codigos):
+                minimo = codigos.min()
+                clave = clave * (int(codigos.max() - minimo) + 1) + (codigos - minimo)
+        _, primeras, grupo = np.unique(clave, return_index=True, return_inverse=True)
+        cantidades = np.bincount(grupo, minlength=len(primeras))
+
+        resultado = {}
+        for columna in por:
+            codigos = self.columnas[columna][mascara][primeras]
+            resultado[columna] = self.nombres[columna][codigos] if columna in COLUMNAS_CATEGORICAS else codigos
+        for alias, (columna, funcion) in valores.items():
+            datos = self.columnas[columna][mascara]
+            if funcion == 'count':
+                resultado[alias] = cantidades
+            elif funcion in ('sum', 'mean'):
+                sumas = np.bincount(grupo, weights=datos, minlength=len(primeras))
+                resultado[alias] = sumas if funcion == 'sum' else sumas / np.maximum(cantidades, 1)
+            elif funcion in ('min', 'max'):
+                orden = np.argsort(grupo, kind='stable')
+                inicios = np.concatenate([[0], np.cumsum(cantidades)[:-1]]) if len(cantidades) else cantidades
+                reduccion = np.minimum if funcion == 'min' else np.maximum
+                resultado[alias] = reduccion.reduceat(datos[orden], inicios) if len(cantidades) else datos[:0]
+            else:
+                raise ValueError(f"Funcion de agregacion desconocida: {funcion}")
+        return resultado
+
+    def indicadores(self, nombres=None):
+        # Los indicadores del registro de indicadores.py (mismos resultados que calcular_indicadores): los que tienen
+        # version en memoria (@en_memoria, abajo) se calculan sobre los arreglos y el resto con su consulta sobre obras
+        return {actual.nombre: actual.en_memoria(self) if actual.en_memoria else actual.calcular(resumen=False)
+                for actual in indicadores.seleccionar(nombres)}
+
+
+'''
+    INDICADORES EN MEMORIA
+'''
+
+def lookup_ordenada(motor, columna):
+    return tuple(sorted({nombre for nombre in motor.nombres[columna] if nombre is not None}))
+
+
+def suma_positivos(motor, columna):
+    valores = motor.columnas[columna][motor.columnas[columna] > 0]
+    return valores.sum().item() if len(valores) else None
+
+
+@en_memoria('areas_responsables')
+def areas_responsables(motor):
+    return lookup_ordenada(motor, 'area_responsable')
+
+
+@en_memoria('tipos_obra')
+def tipos_obra(motor):
+    return lookup_ordenada(motor, 'tipo')
+
+
+@en_memoria('obras_por_etapa')
+def obras_por_etapa(motor):
+    grupos = motor.agrupar('etapa')
+    return tuple(zip(grupos['etapa'].tolist(), grupos['cantidad_obras'].tolist()))
+
+
+@en_memoria('obras_por_tipo')
+def obras_por_tipo(motor):
+    grupos = motor.agrupar('tipo', {'cantidad_obras': ('id', 'count'),
+                                    'monto_total_inversion': ('monto_contrato', 'sum')})
+    return tuple(zip(grupos['tipo'].tolist(), grupos['cantidad_obras'].tolist(),
+                     grupos['monto_total_inversion'].tolist()))
+
+
+@en_memoria('barrios_comunas')
+def barrios_comunas(motor):
+    return tuple(motor.agrupar(('barrio', 'comuna'), comuna=COMUNAS_SELECCIONADAS)['barrio'])
+
+
+@en_memoria('finalizadas_comuna_1')
+def finalizadas_comuna_1(motor):
+    mascara = motor.mascara(comuna=1, etapa=ETAPA_FINALIZADA)
+    if not mascara.any():
+        return {'cantidad_obras': 0, 'monto_inversion': None}
+    return {'cantidad_obras': int(mascara.sum()), 'monto_inversion': float(motor.columnas['monto_contrato'][mascara].sum())}
+
+
+@en_memoria('finalizadas_menos_24_meses')
+def finalizadas_menos_24_meses(motor):
+    return int(motor.mascara(etapa=ETAPA_FINALIZADA, plazo_meses=(None, 23)).sum())
+
+
+@en_memoria('porcentaje_finalizadas')
+def porcentaje_finalizadas(motor):
+    return float((motor.columnas['porcentaje_avance'] == 100).sum()) / len(motor) * 100 if len(motor) else 0
+
+
+@en_memoria('total_mano_obra')
+def total_mano_obra(motor):
+    return suma_positivos(motor, 'mano_obra')
+
+
+@en_memoria('total_inversion')
+def total_inversion(motor):
+    return suma_positivos(motor, 'monto_contrato')
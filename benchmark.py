@@ -0,0 +1,663 @@
+# Mediciones de rendimiento de GestionarObra
+#   python benchmark.py                                 -> pipeline e indicadores con 1k y 10k obras sinteticas
+#   python benchmark.py --tamanios 1000 100000 1000000  -> otros tamaños
+#   python benchmark.py --comparar anterior.json        -> compara contra una corrida anterior
+#   python benchmark.py --conexion                      -> SQLite por defecto contra PRAGMAS_SQLITE
+#   python benchmark.py --arranque --filas N            -> tiempo de cada comando de la CLI desde que arranca
+#   python benchmark.py --esquema --filas N             -> lectura del csv todo como texto contra esquema_csv
+#   python benchmark.py --escritura --productores N     -> altas concurrentes directas contra el escritor unico
+#   python benchmark.py --indicadores --filas N         -> indicadores en una conexion contra el pool de hilos
+#   python benchmark.py --listado --filas N             -> pagina por OFFSET contra keyset a varias profundidades
+#   python benchmark.py --generar obras.csv --filas N   -> solo genera un csv sintetico
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
+from datetime import date, datetime, timedelta
+import pandas as pd
+import escritura
+import listado
+from indicadores import INDICADORES, HILOS
+from gestionar_obras import GestionarObra
+from modelo_orm import sqlite_db, Obra, ResumenGeneral, OperationalError
+
+
+class Benchmark(GestionarObra):
+    pass
+
+
+'''
+    GENERADOR DE DATASETS SINTETICOS
+    Mismo formato que observatorio-de-obras-urbanas.csv: 36 columnas (mas la vacia del final), separador ";"
+    e ISO-8859-1, con cardinalidades y valores sucios parecidos a los del export real
+'''
+
+COLUMNAS_CSV = [
+    "id", "entorno", "nombre", "etapa", "tipo", "area_responsable", "descripcion", "monto_contrato",
+    "comuna", "barrio", "direccion", "lat", "lng", "fecha_inicio", "fecha_fin_inicial", "plazo_meses",
+    "porcentaje_avance", "imagen_1", "imagen_2", "imagen_3", "imagen_4", "licitacion_oferta_empresa",
+    "licitacion_anio", "contratacion_tipo", "nro_contratacion", "cuit_contratista", "beneficiarios",
+    "mano_obra", "compromiso", "destacada", "ba_elige", "link_interno", "pliego_descarga", "expediente-numero",
+    "estudio_ambiental_descarga", "financiamiento"
+]
+
+# (valor, peso): la gran mayoria finalizadas y algunas variantes de mayusculas y acentos como en el export real
+ETAPAS = [("Finalizada", 850), ("En ejecución", 40), ("Finalizado", 20), ("Desestimada", 12), ("En obra", 10),
+          ("En Ejecución", 8), ("En licitación", 5), ("Adjudicada", 4), ("Neutralizada", 4), ("Rescindida", 2),
+          ("Finalizada/desestimada", 2), ("En proyecto", 2), ("Paralizada", 1), ("Proyecto", 1)]
+TIPOS = ["Arquitectura", "Escuelas", "Espacio Público", "Hidráulica e Infraestructura", "Salud", "Transporte",
+         "Vivienda", "Vivienda Nueva", "Infraestructura", "Instalaciones", "Espacio público", "Hidráulica",
+         "Mobiliario Urbano", "Vial"]
+AREAS = ["Ministerio de Educación", "Ministerio de Salud", "Instituto de la Vivienda",
+         "Ministerio de Justicia y Seguridad", "Ministerio de Desarrollo Humano y Hábitat",
+         "Secretaría de Transporte y Obras Públicas", "Corporación Buenos Aires Sur", "Ministerio de Cultura",
+         "Subsecretaría de Obras", "Jefatura de Gabinete de Ministros"]
+BARRIOS = ["Agronomía", "Almagro", "Balvanera", "Barracas", "Belgrano", "Boedo", "Caballito", "Chacarita",
+           "Coghlan", "Colegiales", "Constitución", "Flores", "Floresta", "La Boca", "La Paternal", "Liniers",
+           "Mataderos", "Monte Castro", "Montserrat", "Nueva Pompeya", "Núñez", "Palermo", "Parque Avellaneda",
+           "Parque Chacabuco", "Parque Chas", "Parque Patricios", "Puerto Madero", "Recoleta", "Retiro",
+           "Saavedra", "San Cristóbal", "San Nicolás", "San Telmo", "Vélez Sársfield", "Versalles", "Villa Crespo",
+           "Villa del Parque", "Villa Devoto", "Villa General Mitre", "Villa Lugano", "Villa Luro",
+           "Villa Ortúzar", "Villa Pueyrredón", "Villa Real", "Villa Riachuelo", "Villa Santa Rita",
+           "Villa Soldati", "Villa Urquiza"]
+CONTRATACIONES = ["Licitación Pública", "Licitación Privada", "Contratación Directa", "Contratación Menor",
+                  "Licitacion Publica", "Convenio", "Obra Pública", "Adjudicación Simple"]
+FINANCIAMIENTOS = ["Nación", "PPI", "F11", "Préstamo BID AR-L1260", "CAF-Nación-GCBA", "Préstamo BIRF 8706-AR"]
+PALABRAS = ["puesta en valor", "remodelación", "construcción", "ampliación", "mejoramiento", "espacio verde",
+            "plaza", "escuela", "hospital", "centro de salud", "vivienda", "red pluvial", "iluminación",
+            "veredas", "accesibilidad", "polideportivo", "jardín maternal", "señalización", "mobiliario urbano"]
+
+
+def vacio_o(valor, proporcion, azar):
+    return "" if azar.random() < proporcion else valor
+
+
+def numero_sucio(numero, decimales, azar):
+    # Coma decimal como en el export ("205800503,6"), algunos ceros
+    if azar.random() < 0.02:
+        return "0"
+    if decimales and azar.random() < 0.2:
+        return f"{numero:.{decimales}f}".replace('.', ',')
+    return str(int(numero))
+
+
+def filas_sinteticas(filas, semilla=0):
+    azar = random.Random(semilla)
+    etapas, pesos_etapas = zip(*ETAPAS)
+    # La cantidad de empresas y de entornos crece con el dataset (en el export real ~1 empresa cada 3 obras)
+    empresas = [f"Constructora {azar.choice(['Del Sur', 'Norte', 'Urbana', 'Río', 'Pampa'])} {n} S.A."
+                for n in range(max(filas // 3, 10))]
+    entornos = [f"Plan {azar.choice(PALABRAS)} {n}" for n in range(max(filas // 5, 10))]
+    inicio_base = date(2010, 1, 1)
+
+    for i in range(1, filas + 1):
+        barrio = azar.choice(BARRIOS)
+        tipo = azar.choice(TIPOS)
+        plazo = azar.randint(1, 60)
+        inicio = inicio_base + timedelta(days=azar.randint(0, 5000))
+        fin = inicio + timedelta(days=plazo * 30)
+        lat = -34.7 + azar.random() * 0.17
+        lng = -58.53 + azar.random() * 0.19
+        # Coordenadas: coma decimal y algunas sin separador (-34662281) como en el export
+        lat_texto = str(int(lat * 1e6)) if azar.random() < 0.02 else f"{lat:.8f}".replace('.', ',')
+        comuna = str(azar.randint(1, 15)) if azar.random() > 0.01 else "14, 2 , 1 "
+        yield [
+            i,
+            azar.choice(entornos),
+            f"{azar.choice(PALABRAS).capitalize()} {barrio} {i}",
+            azar.choices(etapas, pesos_etapas)[0],
+            vacio_o(tipo, 0.02, azar),
+            azar.choice(AREAS),
+            f"{azar.choice(PALABRAS).capitalize()} y {azar.choice(PALABRAS)} en el barrio {barrio}.",
+            vacio_o(numero_sucio(azar.uniform(1e5, 5e9), 1, azar), 0.08, azar),
+            comuna,
+            barrio,
+            f"{azar.choice(['Av.', 'Calle', 'Pje.'])} {azar.choice(BARRIOS)} {azar.randint(1, 9000)}",
+            vacio_o(lat_texto, 0.05, azar),
+            vacio_o(f"{lng:.8f}".replace('.', ','), 0.05, azar),
+            vacio_o(inicio.isoformat(), 0.05, azar),
+            vacio_o(fin.isoformat(), 0.05, azar),
+            vacio_o(numero_sucio(plazo + (0.5 if azar.random() < 0.05 else 0), 1, azar), 0.07, azar),
+            vacio_o(numero_sucio(100 if azar.random() < 0.8 else azar.uniform(1, 99), 2, azar), 0.02, azar),
+            vacio_o(f"https://cdn.buenosaires.gob.ar/datosabiertos/datasets/ba-obras/fotos/{i}.jpg", 0.3, azar),
+            vacio_o(f"https://cdn.buenosaires.gob.ar/datosabiertos/datasets/ba-obras/fotos/{i}-2.jpg", 0.6, azar),
+            vacio_o(f"https://cdn.buenosaires.gob.ar/datosabiertos/datasets/ba-obras/fotos/{i}-3.jpg", 0.8, azar),
+            vacio_o(f"https://cdn.buenosaires.gob.ar/datosabiertos/datasets/ba-obras/fotos/{i}-4.jpg", 0.9, azar),
+            vacio_o(azar.choice(empresas), 0.07, azar),
+            vacio_o(str(inicio.year - azar.randint(0, 1)), 0.1, azar),
+            vacio_o(azar.choice(CONTRATACIONES), 0.37, azar),
+            vacio_o(f"{azar.randint(1, 9999)}-SIGAF-{inicio.year}", 0.2, azar),
+            vacio_o(str(azar.randint(20000000000, 34999999999)), 0.15, azar),
+            vacio_o(numero_sucio(azar.uniform(100, 200000), 1, azar), 0.64, azar),
+            # mano_obra es la columna mas vacia del export (77%), aca un poco menos para que queden filas
+            vacio_o(numero_sucio(azar.randint(1, 300), 0, azar), 0.3, azar),
+            vacio_o("SI", 0.9, azar),
+            vacio_o("SI", 0.98, azar),
+            vacio_o(azar.choice(["SI", "NO", "-"]), 0.99, azar),
+            vacio_o(f"https://www.buenosaires.gob.ar/baobras/obra-{i}", 0.5, azar),
+            vacio_o(f"https://www.buenosaires.gob.ar/areas/planeamiento_obras/licitations/{i}", 0.6, azar),
+            vacio_o(f"EX-{inicio.year}-{azar.randint(1000000, 99999999)}-MGEYA", 0.4, azar),
+            vacio_o(f"https://www.buenosaires.gob.ar/estudios/{i}.pdf", 0.95, azar),
+            vacio_o(azar.choice(FINANCIAMIENTOS), 0.99, azar),
+        ]
+
+
+def generar_csv_sintetico(ruta, filas, semilla=0):
+    # Escribe de a una fila para que generar 1M de obras no ocupe memoria
+    with open(ruta, 'w', newline='', encoding='ISO-8859-1', errors='replace') as archivo:
+        escritor = csv.writer(archivo, delimiter=';')
+        # El export real termina cada linea con ";" (columna vacia al final)
+        escritor.writerow(COLUMNAS_CSV + [""])
+        for fila in filas_sinteticas(filas, semilla):
+            escritor.writerow(fila + [""])
+    return ruta
+
+
+'''
+    EJECUCION Y COMPARACION
+'''
+
+def medir(funcion, filas, trazar=False):
+    # Tiempo y filas por segundo de una etapa; con `trazar` solo el pico de memoria (tracemalloc multiplica los
+    # tiempos, por eso se mide en una pasada aparte)
+    if trazar:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion()
+    duracion = time.perf_counter() - inicio
+    if trazar:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return resultado, {'memoria_pico_mb': pico / 2 ** 20}
+    return resultado, {'segundos': duracion, 'filas': filas,
+                       'filas_por_segundo': filas / duracion if duracion > 0 else None}
+
+
+def medir_pipeline(directorio, tamanio, trazar=False):
+    Benchmark.configurar_db(os.path.join(directorio, f"benchmark_{'memoria' if trazar else 'tiempos'}.db"))
+    Benchmark.mapear_orm()
+
+    etapas = {}
+    df, etapas['extraer_datos'] = medir(Benchmark.extraer_datos, tamanio, trazar)
+    df, etapas['limpiar_datos'] = medir(lambda: Benchmark.limpiar_datos(df), tamanio, trazar)
+    _, etapas['cargar_datos'] = medir(lambda: Benchmark.cargar_datos(df), len(df), trazar)
+
+    # Cada indicador por separado, sin cache, leyendo los resumenes y recorriendo obras
+    indicadores = {}
+    for nombre in INDICADORES:
+        for usar_resumen, clave in ((True, 'resumen'), (False, 'obras')):
+            Benchmark.cache_indicadores.clear()
+            _, indicadores[f"{nombre}[{clave}]"] = medir(
+                lambda: Benchmark.calcular_indicadores([nombre], usar_resumen), len(df), trazar)
+
+    Benchmark.cerrar_db(forzar=True)
+    return len(df), etapas, indicadores
+
+
+def ejecutar_benchmark(tamanios, salida=None, semilla=0, memoria=True):
+    ruta_original = sqlite_db.database
+    resultados = {}
+    try:
+        for tamanio in tamanios:
+            with tempfile.TemporaryDirectory() as directorio:
+                inicio = time.perf_counter()
+                Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'), tamanio, semilla)
+                print(f"csv sintetico de {tamanio} filas generado en {time.perf_counter() - inicio:.1f}s")
+                Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+
+                filas_limpias, etapas, indicadores = medir_pipeline(directorio, tamanio)
+                if memoria:
+                    _, etapas_memoria, indicadores_memoria = medir_pipeline(directorio, tamanio, trazar=True)
+                    for medidas, picos in ((etapas, etapas_memoria), (indicadores, indicadores_memoria)):
+                        for nombre, pico in picos.items():
+                            medidas[nombre].update(pico)
+                resultados[str(tamanio)] = {'filas_limpias': filas_limpias, 'etapas': etapas,
+                                            'indicadores': indicadores}
+    finally:
+        del Benchmark.archivo_csv, Benchmark.archivo_limpio
+        Benchmark.configurar_db(ruta_original, persistente=True)
+
+    reporte = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'resultados': resultados,
+    }
+    if salida:
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(reporte, archivo, indent=2)
+    return reporte
+
+
+def mostrar_reporte(reporte):
+    for tamanio, resultado in reporte['resultados'].items():
+        print(f"\n== {tamanio} filas ({resultado['filas_limpias']} limpias) ==")
+        for nombre, medida in list(resultado['etapas'].items()) + list(resultado['indicadores'].items()):
+            memoria = f"{medida['memoria_pico_mb']:8.2f} MB" if 'memoria_pico_mb' in medida else ""
+            print(f"{nombre:45} {medida['segundos'] * 1000:10.2f} ms  {memoria}")
+
+
+def comparar_resultados(anterior, actual, tolerancia=0.10, minimo_s=0.005):
+    # Marca como regresion todo lo que tarde mas de `tolerancia` respecto de la corrida anterior (y al menos
+    # `minimo_s` mas, para no marcar el ruido de las consultas de menos de un milisegundo)
+    regresiones = []
+    for tamanio, resultado in actual['resultados'].items():
+        previo = anterior['resultados'].get(tamanio)
+        if previo is None:
+            continue
+        print(f"\n== {tamanio} filas: anterior ({anterior['fecha']}) vs actual ==")
+        medidas_previas = {**previo['etapas'], **previo['indicadores']}
+        for nombre, medida in {**resultado['etapas'], **resultado['indicadores']}.items():
+            if nombre not in medidas_previas or not medidas_previas[nombre]['segundos']:
+                continue
+            cambio = medida['segundos'] / medidas_previas[nombre]['segundos'] - 1
+            diferencia = medida['segundos'] - medidas_previas[nombre]['segundos']
+            marca = "  REGRESION" if cambio > tolerancia and diferencia > minimo_s else ""
+            print(f"{nombre:45} {medidas_previas[nombre]['segundos'] * 1000:10.2f} ms -> "
+                  f"{medida['segundos'] * 1000:10.2f} ms ({cambio:+.0%}){marca}")
+            if marca:
+                regresiones.append((tamanio, nombre))
+    return regresiones
+
+
+def multiplicar_dataset(df, veces):
+    # Repite el dataset limpio con ids nuevos para tener un volumen medible
+    copias = []
+    for i in range(veces):
+        copia = df.copy()
+        copia['id'] = copia['id'] + i * (int(df['id'].max()) + 1)
+        copias.append(copia)
+    return pd.concat(copias, ignore_index=True)
+
+
+def medir_conexion(df, repeticiones=50, escrituras=200):
+    # Compara carga, indicadores y escrituras sueltas con SQLite por defecto (abriendo y cerrando la conexion en cada
+    # operacion) contra los pragmas de PRAGMAS_SQLITE con conexion persistente
+    ruta_original = sqlite_db.database
+    resultados = {}
+    for nombre, pragmas, persistente in (('sin ajustes', {}, False), ('con ajustes', None, True)):
+        with tempfile.TemporaryDirectory() as directorio:
+            Benchmark.configurar_db(os.path.join(directorio, 'benchmark.db'), pragmas, persistente)
+            Benchmark.mapear_orm()
+
+            inicio = time.perf_counter()
+            Benchmark.cargar_datos(df.copy())
+            carga = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                # Sin cache, para medir las consultas y no el acierto del cache
+                Benchmark.cache_indicadores.clear()
+                Benchmark.calcular_indicadores(usar_resumen=False)
+            indicadores = (time.perf_counter() - inicio) / repeticiones
+
+            # Escrituras individuales en autocommit, como las de nueva_obra
+            Benchmark.conectar_db()
+            ids = [id_ for (id_,) in Obra.select(Obra.id).limit(escrituras).tuples()]
+            Benchmark.cerrar_db()
+            inicio = time.perf_counter()
+            for id_ in ids:
+                Benchmark.conectar_db()
+                Obra.update(mano_obra=Obra.mano_obra + 1).where(Obra.id == id_).execute()
+                Benchmark.cerrar_db()
+            escritura = (time.perf_counter() - inicio) / max(len(ids), 1)
+
+            Benchmark.cerrar_db(forzar=True)
+        resultados[nombre] = {'carga_s': carga, 'indicadores_s': indicadores, 'escritura_s': escritura}
+
+    Benchmark.configurar_db(ruta_original, persistente=True)
+    return resultados
+
+
+def medir_almacenamiento(filas=100000, repeticiones=5, semilla=0):
+    # Tamaño de la base y tiempo de recorrer la tabla obras completa (consultas sin indice que las cubra)
+    ruta_original = sqlite_db.database
+    with tempfile.TemporaryDirectory() as directorio:
+        Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'), filas, semilla)
+        Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+        ruta = os.path.join(directorio, 'benchmark.db')
+        Benchmark.configurar_db(ruta)
+        Benchmark.mapear_orm()
+        Benchmark.cargar_datos(Benchmark.limpiar_datos(Benchmark.extraer_datos()))
+
+        Benchmark.conectar_db()
+        sqlite_db.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        sqlite_db.execute_sql("VACUUM")
+        tablas = {}
+        try:
+            # dbstat solo existe si SQLite se compilo con SQLITE_ENABLE_DBSTAT_VTAB
+            for nombre, paginas in sqlite_db.execute_sql(
+                    "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC LIMIT 8"):
+                tablas[nombre] = paginas
+        except OperationalError:
+            pass
+        recorridos = {
+            'suma_monto_avance': f"SELECT SUM(monto_contrato * porcentaje_avance) FROM {Obra._meta.table_name}",
+            'mano_obra_por_plazo': f"SELECT plazo_meses, SUM(mano_obra) FROM {Obra._meta.table_name} "
+                                   f"WHERE licitacion_anio > 0 GROUP BY plazo_meses",
+        }
+        tiempos = {}
+        for nombre, sql in recorridos.items():
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                sqlite_db.execute_sql(sql).fetchall()
+            tiempos[nombre] = (time.perf_counter() - inicio) / repeticiones
+        cantidad = Obra.select().count()
+        Benchmark.cerrar_db(forzar=True)
+        tamanio = os.path.getsize(ruta)
+    del Benchmark.archivo_csv, Benchmark.archivo_limpio
+    Benchmark.configurar_db(ruta_original, persistente=True)
+    return {'obras': cantidad, 'tamanio_mb': tamanio / 2 ** 20, 'tablas_mb': {nombre: paginas / 2 ** 20 for nombre, paginas in tablas.items()},
+            'recorridos_ms': {nombre: segundos * 1000 for nombre, segundos in tiempos.items()}}
+
+
+def medir_esquema(filas=100000, semilla=0):
+    # Lectura y limpieza del csv con todas las columnas como texto (como antes) y con los tipos de esquema_csv:
+    # tiempo, pico de memoria (tracemalloc, en una pasada aparte) y memoria del DataFrame leido y del limpio
+    def leer_texto():
+        return pd.read_csv(Benchmark.archivo_csv, delimiter=';', usecols=Benchmark.columnas_csv,
+                           encoding='ISO-8859-1', dtype=str)
+
+    def megas(df):
+        return df.memory_usage(deep=True).sum() / 2 ** 20
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'), filas, semilla)
+        Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+        for nombre, leer in (('texto (antes)', leer_texto), ('esquema', Benchmark.extraer_datos)):
+            df, lectura = medir(leer, filas)
+            _, pico_lectura = medir(leer, filas, trazar=True)
+            memoria_leido = megas(df)
+            limpio, limpieza = medir(lambda: Benchmark.limpiar_datos(df), filas)
+            copia = leer()
+            _, pico_limpieza = medir(lambda: Benchmark.limpiar_datos(copia), filas, trazar=True)
+            resultados[nombre] = {'lectura_s': lectura['segundos'], 'limpieza_s': limpieza['segundos'],
+                                  'pico_lectura_mb': pico_lectura['memoria_pico_mb'],
+                                  'pico_limpieza_mb': pico_limpieza['memoria_pico_mb'],
+                                  'leido_mb': memoria_leido, 'limpio_mb': megas(limpio)}
+    del Benchmark.archivo_csv, Benchmark.archivo_limpio
+    return resultados
+
+
+def medir_escritura(productores=16, obras_por_productor=100, semilla=0):
+    # Prueba de carga de altas concurrentes: `productores` hilos crean obras_por_productor obras cada uno (y actualizan
+    # el avance de una de cada diez), primero cada hilo escribiendo en su propia transaccion como nueva_obra y despues
+    # a traves del escritor unico. Verifica que no se pierda ninguna escritura confirmada: las obras de la base, los
+    # ids devueltos y el resumen general tienen que coincidir con las altas que el productor vio como exitosas
+    ruta_original = sqlite_db.database
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'),
+                                                      productores * obras_por_productor * 3, semilla)
+        Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+        df = Benchmark.limpiar_datos(Benchmark.extraer_datos()).drop(columns='id')
+        df.columns = [columna.replace('-', '_') for columna in df.columns]
+        registros = df.to_dict('records')
+        registros = (registros * (productores * obras_por_productor // max(len(registros), 1) + 1))
+        tandas = [registros[i * obras_por_productor:(i + 1) * obras_por_productor] for i in range(productores)]
+
+        for modo in ('directo', 'escritor unico'):
+            Benchmark.configurar_db(os.path.join(directorio, f"{modo.replace(' ', '_')}.db"))
+            Benchmark.mapear_orm()
+            ids, errores = [], []
+            bloqueo = threading.Lock()
+            escritor = Benchmark.escritor_obras() if modo == 'escritor unico' else None
+
+            def producir(tanda):
+                propios = []
+                for numero, campos in enumerate(tanda):
+                    try:
+                        if escritor is None:
+                            with sqlite_db.connection_context():
+                                propios.append(escritura.insertar_obra(campos))
+                                if numero % 10 == 0:
+                                    escritura.modificar_obra(propios[-1], {'porcentaje_avance': 50})
+                        else:
+                            propios.append(escritor.crear_obra(campos).result())
+                            if numero % 10 == 0:
+                                escritor.actualizar_obra(propios[-1], porcentaje_avance=50)
+                    except OperationalError as e:
+                        with bloqueo:
+                            errores.append(str(e))
+                with bloqueo:
+                    ids.extend(propios)
+
+            hilos = [threading.Thread(target=producir, args=(tanda,)) for tanda in tandas]
+            inicio = time.perf_counter()
+            if escritor is not None:
+                escritor.iniciar()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            if escritor is not None:
+                escritor.detener()
+            duracion = time.perf_counter() - inicio
+
+            Benchmark.conectar_db()
+            en_base = {obra_id for (obra_id,) in Obra.select(Obra.id).tuples()}
+            resumen = ResumenGeneral.select(ResumenGeneral.cantidad_obras).scalar() or 0
+            Benchmark.cerrar_db(forzar=True)
+            resultados[modo] = {
+                'segundos': duracion, 'obras_por_segundo': len(ids) / duracion if duracion > 0 else None,
+                'confirmadas': len(ids), 'errores': len(errores), 'error_ejemplo': errores[0] if errores else None,
+                # Altas confirmadas al productor que no estan en la base (tiene que ser 0) y ids repetidos
+                'perdidas': len(set(ids) - en_base), 'repetidas': len(ids) - len(set(ids)),
+                'resumen_correcto': resumen == len(en_base),
+                'transacciones': escritor.transacciones if escritor is not None else len(ids) + len(ids) // 10,
+            }
+    del Benchmark.archivo_csv, Benchmark.archivo_limpio
+    Benchmark.configurar_db(ruta_original, persistente=True)
+    return resultados
+
+
+def medir_indicadores(filas=100000, hilos=HILOS, repeticiones=5, semilla=0):
+    # Todos los indicadores sin cache, en orden en una conexion contra el pool de conexiones de solo lectura, y el
+    # indicador mas lento solo (el minimo al que puede bajar el pool), leyendo los resumenes y recorriendo obras
+    ruta_original = sqlite_db.database
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'), filas, semilla)
+        Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+        Benchmark.configurar_db(os.path.join(directorio, 'benchmark.db'))
+        Benchmark.mapear_orm()
+        Benchmark.cargar_datos(Benchmark.limpiar_datos(Benchmark.extraer_datos()))
+        Benchmark.conectar_db()
+
+        def mediana(funcion):
+            tiempos = []
+            for _ in range(repeticiones):
+                Benchmark.cache_indicadores.clear()
+                inicio = time.perf_counter()
+                resultado = funcion()
+                tiempos.append(time.perf_counter() - inicio)
+            return statistics.median(tiempos), resultado
+
+        for usar_resumen, clave in ((False, 'obras'), (True, 'resumen')):
+            secuencial, esperado = mediana(lambda: Benchmark.calcular_indicadores(usar_resumen=usar_resumen, hilos=1))
+            concurrente, obtenido = mediana(lambda: Benchmark.calcular_indicadores(usar_resumen=usar_resumen,
+                                                                                   hilos=hilos))
+            individuales = {nombre: mediana(lambda: Benchmark.calcular_indicadores([nombre], usar_resumen, hilos=1))[0]
+                            for nombre in INDICADORES}
+            mas_lento = max(individuales, key=individuales.get)
+            resultados[clave] = {'secuencial_s': secuencial, 'concurrente_s': concurrente,
+                                 'mas_lento': mas_lento, 'mas_lento_s': individuales[mas_lento],
+                                 'iguales': esperado == obtenido}
+        Benchmark.cerrar_db(forzar=True)
+    del Benchmark.archivo_csv, Benchmark.archivo_limpio
+    Benchmark.configurar_db(ruta_original, persistente=True)
+    return resultados
+
+
+def medir_listado(filas=100000, limite=50, repeticiones=5, semilla=0):
+    # Latencia de una pagina de obras ordenadas por fecha_inicio a distintas profundidades: OFFSET con instancias de
+    # Obra completas y las lookups leidas por fila (obra.etapa.nombre) contra listar_obras con el cursor de esa pagina
+    ruta_original = sqlite_db.database
+    columnas = ['id', 'nombre', 'etapa', 'tipo', 'comuna', 'barrio', 'fecha_inicio']
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        Benchmark.archivo_csv = generar_csv_sintetico(os.path.join(directorio, 'obras.csv'), filas, semilla)
+        Benchmark.archivo_limpio = os.path.join(directorio, 'csv_limpiado.csv')
+        Benchmark.configurar_db(os.path.join(directorio, 'benchmark.db'))
+        Benchmark.mapear_orm()
+        Benchmark.cargar_datos(Benchmark.limpiar_datos(Benchmark.extraer_datos()))
+
+        Benchmark.conectar_db()
+        claves = list(Obra.select(Obra.fecha_inicio, Obra.id).order_by(Obra.fecha_inicio, Obra.id).tuples())
+        paginas = len(claves) // limite
+        profundidades = sorted({1} | {p for p in (10, 100, 1000, 10000) if p <= paginas} | {max(paginas, 1)})
+
+        def pagina_offset(pagina):
+            obras = Obra.select().order_by(Obra.fecha_inicio, Obra.id).offset((pagina - 1) * limite).limit(limite)
+            return [(obra.id, obra.nombre, obra.etapa.nombre, obra.tipo.nombre, obra.comuna.nombre,
+                     obra.barrio.nombre, obra.fecha_inicio) for obra in obras]
+
+        def pagina_keyset(pagina):
+            cursor = listado.codificar_cursor(*claves[(pagina - 1) * limite - 1]) if pagina > 1 else None
+            return Benchmark.listar_obras(columnas, orden='fecha_inicio', cursor=cursor, limite=limite,
+                                          formato='tupla')['obras']
+
+        for pagina in profundidades:
+            medida = {}
+            for nombre, funcion in (('offset', pagina_offset), ('keyset', pagina_keyset)):
+                tiempos = []
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    obras = funcion(pagina)
+                    tiempos.append(time.perf_counter() - inicio)
+                medida[nombre] = statistics.median(tiempos)
+                medida[f'ids_{nombre}'] = [obra[0] for obra in obras]
+            # Las dos tienen que devolver la misma pagina
+            medida['iguales'] = medida.pop('ids_offset') == medida.pop('ids_keyset')
+            resultados[pagina] = medida
+        Benchmark.cerrar_db(forzar=True)
+    del Benchmark.archivo_csv, Benchmark.archivo_limpio
+    Benchmark.configurar_db(ruta_original, persistente=True)
+    return resultados
+
+
+# Lo que hacia el __main__ de gestionar_obras antes de aceptar cualquier comando
+PIPELINE_COMPLETO = ("from gestionar_obras import GestionarObra\n"
+                     "GestionarObra.conectar_db()\n"
+                     "GestionarObra.mapear_orm()\n"
+                     "GestionarObra.cargar_datos(GestionarObra.obtener_datos_limpios())\n"
+                     "GestionarObra.obtener_indicadores()\n")
+
+
+def medir_arranque(filas=1000, repeticiones=5, semilla=0):
+    # Tiempo de pared de cada comando de la CLI en un proceso nuevo (interprete, importaciones, apertura de la base y
+    # el comando), con la base ya cargada. Devuelve {comando: {'mediana_s', 'minimo_s'}}
+    modulo = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gestionar_obras.py')
+    entorno = dict(os.environ, PYTHONPATH=os.path.dirname(modulo))
+    comandos = {
+        'pipeline completo (antes)': [sys.executable, '-c', PIPELINE_COMPLETO],
+        'indicadores': [sys.executable, modulo, 'indicadores'],
+        'buscar': [sys.executable, modulo, 'buscar', 'escuela'],
+        'cargar (sin cambios)': [sys.executable, modulo, 'cargar'],
+    }
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        # La CLI usa las rutas por defecto relativas al directorio actual
+        generar_csv_sintetico(os.path.join(directorio, os.path.basename(GestionarObra.archivo_csv)), filas, semilla)
+        subprocess.run([sys.executable, modulo, 'cargar'], cwd=directorio, env=entorno, check=True,
+                       stdout=subprocess.DEVNULL)
+        for nombre, comando in comandos.items():
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                subprocess.run(comando, cwd=directorio, env=entorno, check=True, stdout=subprocess.DEVNULL)
+                tiempos.append(time.perf_counter() - inicio)
+            resultados[nombre] = {'mediana_s': statistics.median(tiempos), 'minimo_s': min(tiempos)}
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de obras")
+    parser.add_argument('--tamanios', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--salida', default='benchmark_resultados.json')
+    parser.add_argument('--comparar', help="json de una corrida anterior")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--sin-memoria', action='store_true', help="omite la pasada con tracemalloc")
+    parser.add_argument('--conexion', action='store_true', help="compara SQLite por defecto contra PRAGMAS_SQLITE")
+    parser.add_argument('--almacenamiento', action='store_true',
+                        help="tamaño de la base y tiempo de recorrer obras con --filas obras sinteticas")
+    parser.add_argument('--arranque', action='store_true',
+                        help="tiempo de los comandos de la CLI en un proceso nuevo con --filas obras sinteticas")
+    parser.add_argument('--esquema', action='store_true',
+                        help="lectura y limpieza del csv como texto contra esquema_csv con --filas obras sinteticas")
+    parser.add_argument('--escritura', action='store_true',
+                        help="altas desde --productores hilos concurrentes, directas y con el escritor unico")
+    parser.add_argument('--productores', type=int, default=16)
+    parser.add_argument('--indicadores', action='store_true',
+                        help="indicadores en orden contra --hilos conexiones de solo lectura con --filas obras")
+    parser.add_argument('--hilos', type=int, default=HILOS, help="por defecto indicadores.HILOS (segun los nucleos)")
+    parser.add_argument('--listado', action='store_true',
+                        help="latencia de una pagina por OFFSET contra keyset a varias profundidades con --filas obras")
+    parser.add_argument('--generar', help="solo genera un csv sintetico en esta ruta")
+    parser.add_argument('--filas', type=int, default=1000)
+    argumentos = parser.parse_args()
+
+    if argumentos.generar:
+        generar_csv_sintetico(argumentos.generar, argumentos.filas, argumentos.semilla)
+    elif argumentos.almacenamiento:
+        medida = medir_almacenamiento(argumentos.filas, semilla=argumentos.semilla)
+        print(f"{medida['obras']} obras: base de {medida['tamanio_mb']:.1f} MB")
+        for nombre, megas in medida['tablas_mb'].items():
+            print(f"  {nombre:40} {megas:8.1f} MB")
+        for nombre, milisegundos in medida['recorridos_ms'].items():
+            print(f"  recorrido {nombre:30} {milisegundos:8.1f} ms")
+    elif argumentos.arranque:
+        for comando, tiempos in medir_arranque(argumentos.filas, semilla=argumentos.semilla).items():
+            print(f"{comando:30} mediana {tiempos['mediana_s'] * 1000:8.1f} ms | minimo {tiempos['minimo_s'] * 1000:8.1f} ms")
+    elif argumentos.esquema:
+        for lectura, medida in medir_esquema(argumentos.filas, argumentos.semilla).items():
+            print(f"{lectura:14} leer {medida['lectura_s']:6.2f}s (pico {medida['pico_lectura_mb']:7.1f} MB, "
+                  f"df {medida['leido_mb']:7.1f} MB) | limpiar {medida['limpieza_s']:6.2f}s "
+                  f"(pico {medida['pico_limpieza_mb']:7.1f} MB, df {medida['limpio_mb']:7.1f} MB)")
+    elif argumentos.escritura:
+        for modo, medida in medir_escritura(argumentos.productores, max(argumentos.filas // argumentos.productores, 1),
+                                            argumentos.semilla).items():
+            print(f"{modo:15} {medida['confirmadas']:6} obras en {medida['segundos']:6.2f}s "
+                  f"({medida['obras_por_segundo']:8.0f} obras/s, {medida['transacciones']} transacciones) | "
+                  f"errores {medida['errores']} | perdidas {medida['perdidas']} | repetidas {medida['repetidas']} | "
+                  f"resumen {'ok' if medida['resumen_correcto'] else 'DESVIADO'}")
+            if medida['error_ejemplo']:
+                print(f"{'':15} {medida['error_ejemplo']}")
+    elif argumentos.indicadores:
+        for clave, medida in medir_indicadores(argumentos.filas, argumentos.hilos, semilla=argumentos.semilla).items():
+            print(f"{clave:8} en orden {medida['secuencial_s'] * 1000:8.2f} ms | {argumentos.hilos} hilos "
+                  f"{medida['concurrente_s'] * 1000:8.2f} ms | mas lento ({medida['mas_lento']}) "
+                  f"{medida['mas_lento_s'] * 1000:8.2f} ms | {'mismos resultados' if medida['iguales'] else 'RESULTADOS DISTINTOS'}")
+    elif argumentos.listado:
+        for pagina, medida in medir_listado(argumentos.filas, semilla=argumentos.semilla).items():
+            print(f"pagina {pagina:6} | offset {medida['offset'] * 1000:8.2f} ms | keyset {medida['keyset'] * 1000:8.2f} ms"
+                  f" | {'misma pagina' if medida['iguales'] else 'PAGINAS DISTINTAS'}")
+    elif argumentos.conexion:
+        datos = multiplicar_dataset(Benchmark.obtener_datos_limpios(), 20)
+        for configuracion, tiempos in medir_conexion(datos).items():
+            print(f"{configuracion}: carga {tiempos['carga_s']:.2f}s | "
+                  f"indicadores {tiempos['indicadores_s'] * 1000:.2f}ms | "
+                  f"escritura suelta {tiempos['escritura_s'] * 1000:.2f}ms")
+    else:
+        # Leo la corrida anterior antes de que la salida la pise
+        anterior = None
+        if argumentos.comparar:
+            with open(argumentos.comparar, encoding='utf-8') as archivo:
+                anterior = json.load(archivo)
+        reporte = ejecutar_benchmark(argumentos.tamanios, argumentos.salida, argumentos.semilla,
+                                     not argumentos.sin_memoria)
+        mostrar_reporte(reporte)
+        if anterior:
+            comparar_resultados(anterior, reporte)
@@ -0,0 +1,181 @@
+# Escritor unico para altas y modificaciones concurrentes de obras. SQLite admite un solo escritor a la vez: en lugar
+# de que cada hilo abra su propia transaccion (y compita por el lock hasta el "database is locked"), los productores
+# encolan las escrituras y un hilo escritor las agrupa en transacciones de hasta tamanio_grupo operaciones. Cada
+# operacion va en un savepoint: si una falla solo su futuro recibe la excepcion. Los futuros se resuelven recien
+# despues del COMMIT, el id que devuelven ya esta en la base.
+#
+#   with Implementacion.escritor_obras() as escritor:
+#       futuro = escritor.crear_obra({'nombre': 'Plaza', 'etapa': 'En obra', 'comuna': 4, ...})
+#       escritor.actualizar_obra(futuro.result(), porcentaje_avance=30)
+#
+# Tambien se puede encolar cualquier funcion que escriba con escritor.enviar(funcion, *args), por ejemplo
+# escritor.enviar(Obra.finalizar_obra_masivo, Obra.porcentaje_avance >= 100)
+import queue
+import threading
+from concurrent.futures import Future
+from modelo_orm import (sqlite_db, Obra, Etapa, Tipo, AreaResponsable, Comuna, Barrio, LicitacionEmpresa,
+                        ContratacionTipo, Financiamiento, cache_lookups, clave_lookup)
+
+# Campos de obras que se reciben con el nombre de la lookup (como en nueva_obra) y se guardan con su id
+LOOKUPS = {'etapa': Etapa, 'tipo': Tipo, 'area_responsable': AreaResponsable, 'comuna': Comuna, 'barrio': Barrio,
+           'licitacion_oferta_empresa': LicitacionEmpresa, 'contratacion_tipo': ContratacionTipo,
+           'financiamiento': Financiamiento}
+TAMANIO_GRUPO = 500
+# Espera maxima (segundos) por mas operaciones antes de cerrar un grupo que todavia no se lleno
+ESPERA_GRUPO = 0.002
+# Marca de fin en la cola
+FIN = object()
+
+
+def resolver_campos(campos, resueltas=None):
+    # resueltas: {(tabla lookup, forma canonica): id} de la transaccion en curso. Dentro de una transaccion
+    # cache_lookups no guarda ids nuevos, sin este memo cada obra volveria a buscar sus ocho lookups en la base
+    resueltas = {} if resueltas is None else resueltas
+    valores = {}
+    for campo, valor in campos.items():
+        if campo in LOOKUPS and valor is not None:
+            clave = (LOOKUPS[campo], clave_lookup(LOOKUPS[campo], valor))
+            if clave not in resueltas:
+                resueltas[clave] = Obra.resolver_lookup(LOOKUPS[campo], valor)
+            valor = resueltas[clave]
+        valores[campo] = valor
+    return valores
+
+
+def insertar_obra(campos, resueltas=None):
+    return Obra.create(**resolver_campos(campos, resueltas)).id
+
+
+def modificar_obra(obra_id, campos, resueltas=None):
+    # Los campos de detalle pasan por el modelo (van a obras_detalles); devuelve 1 o 0 si la obra no existe
+    obra = Obra.get_or_none(Obra.id == obra_id)
+    if obra is None:
+        return 0
+    for campo, valor in resolver_campos(campos, resueltas).items():
+        setattr(obra, campo, valor)
+    obra.save()
+    return 1
+
+
+class EscritorObras:
+    def __init__(self, tamanio_grupo=TAMANIO_GRUPO, espera=ESPERA_GRUPO):
+        self.tamanio_grupo = tamanio_grupo
+        self.espera = espera
+        self.cola = queue.Queue()
+        self.hilo = None
+        self.bloqueo = threading.Lock()
+        # Lookups resueltas en el grupo en curso (solo las toca el hilo escritor)
+        self.resueltas = {}
+        # Estadisticas: operaciones confirmadas, fallidas y transacciones usadas
+        self.confirmadas = self.fallidas = self.transacciones = 0
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.detener()
+        return False
+
+    def iniciar(self):
+        with self.bloqueo:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self.escribir, name='escritor-obras', daemon=True)
+                self.hilo.start()
+
+    def detener(self):
+        # Espera a que se escriba todo lo encolado antes de la llamada
+        with self.bloqueo:
+            if self.hilo is None:
+                return
+            self.cola.put(FIN)
+            hilo, self.hilo = self.hilo, None
+        hilo.join()
+
+    def enviar(self, funcion, *args, **kwargs):
+        # Encola funcion(*args, **kwargs), que corre en el hilo escritor dentro de una transaccion; devuelve un Future
+        # con su resultado
+        if self.hilo is None:
+            raise RuntimeError("El escritor de obras no esta iniciado")
+        futuro = Future()
+        self.cola.put((futuro, funcion, args, kwargs))
+        return futuro
+
+    def crear_obra(self, campos):
+        # campos: columnas de Obra (y de detalle) con las lookups por nombre; el futuro devuelve el id de la obra
+        return self.enviar(insertar_obra, campos, self.resueltas)
+
+    def nuevo_proyecto(self, campos):
+        # Alta en etapa "Proyecto", como Obra.nuevo_proyecto
+        return self.enviar(insertar_obra, dict(campos, etapa="Proyecto"), self.resueltas)
+
+    def actualizar_obra(self, obra_id, **campos):
+        # El futuro devuelve 1, o 0 si la obra no existe
+        return self.enviar(modificar_obra, obra_id, campos, self.resueltas)
+
+    def siguiente_grupo(self):
+        # Bloquea hasta la primera operacion y junta las que lleguen hasta llenar el grupo o pasar `espera` sin nada
+        grupo = [self.cola.get()]
+        while grupo[-1] is not FIN and len(grupo) < self.tamanio_grupo:
+            try:
+                grupo.append(self.cola.get(timeout=self.espera))
+            except queue.Empty:
+                break
+        return grupo
+
+    def escribir_grupo(self, operaciones):
+        resultados = []
+        try:
+            with sqlite_db.atomic():
+                for futuro, funcion, args, kwargs in operaciones:
+                    if not futuro.set_running_or_notify_cancel():
+                        continue
+                    anteriores = set(self.resueltas)
+                    try:
+                        with sqlite_db.atomic():
+                            resultados.append((futuro, funcion(*args, **kwargs), None))
+                    except Exception as e:
+                        # El rollback del savepoint tambien deshace las lookups que creo esta operacion
+                        for clave in set(self.resueltas) - anteriores:
+                            del self.resueltas[clave]
+                        resultados.append((futuro, None, e))
+        except Exception as e:
+            # Fallo el BEGIN o el COMMIT (por ejemplo otro proceso tiene el lock): no quedo nada escrito
+            resultados = [(futuro, None, e) for futuro, _, _, _ in operaciones if not futuro.cancelled()]
+        else:
+            # Confirmadas: las lookups del grupo ya sirven para el resto del proceso
+            for (clase, clave), id_ in self.resueltas.items():
+                cache_lookups.guardar(clase, {clave: id_})
+        self.resueltas.clear()
+        self.transacciones += 1
+        for futuro, resultado, error in resultados:
+            if error is None:
+                self.confirmadas += 1
+                futuro.set_result(resultado)
+            else:
+                self.fallidas += 1
+                futuro.set_exception(error)
+
+    def escribir(self):
+        # Hilo escritor: usa su propia conexion (peewee tiene una por hilo). Si no puede abrirla, sigue vaciando la
+        # cola con el error en cada futuro para que ningun productor quede esperando
+        try:
+            sqlite_db.connect(reuse_if_open=True)
+            error = None
+        except Exception as e:
+            error = e
+        try:
+            while True:
+                grupo = self.siguiente_grupo()
+                fin = grupo[-1] is FIN
+                operaciones = grupo[:-1] if fin else grupo
+                if operaciones and error is None:
+                    self.escribir_grupo(operaciones)
+                elif operaciones:
+                    for futuro, _, _, _ in operaciones:
+                        self.fallidas += 1
+                        futuro.set_exception(error)
+                if fin:
+                    return
+        finally:
+            sqlite_db.close()
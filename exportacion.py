@@ -0,0 +1,178 @@
+# Exportacion en streaming de obras y de los indicadores. Las obras se leen con .tuples().iterator() (peewee no guarda
+# las filas ya recorridas) con los nombres de las lookups y los textos de obras_detalles, y se escriben por bloques en
+# csv, JSON Lines o Parquet: la memoria usada depende del tamaño del bloque y no del de la tabla.
+#
+#   Implementacion.exportar_obras('finalizadas.csv', etapa='Finalizada', comuna=[1, 2], desde='2020-01-01')
+#   Implementacion.exportar_indicadores('indicadores.jsonl')
+import csv
+import itertools
+import json
+import os
+from peewee import JOIN, fn
+from modelo_orm import (sqlite_db, Obra, ObraDetalle, Etapa, Tipo, AreaResponsable, Comuna, Barrio, LicitacionEmpresa,
+                        ContratacionTipo, Financiamiento, CAMPOS_DETALLE, TEXTO_NO_DISPONIBLE, coincide_lookup)
+
+# Extension del archivo -> formato
+FORMATOS = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet'}
+FORMATOS_INDICADORES = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'json'}
+TAMANIO_BLOQUE = 5000
+# Foreign keys de obras -> lookup cuyo nombre se exporta en lugar del id
+LOOKUPS = {'etapa': Etapa, 'tipo': Tipo, 'area_responsable': AreaResponsable, 'comuna': Comuna, 'barrio': Barrio,
+           'licitacion_oferta_empresa': LicitacionEmpresa, 'contratacion_tipo': ContratacionTipo,
+           'financiamiento': Financiamiento}
+# Mismo orden de columnas que el csv original
+COLUMNAS = ['id', 'entorno', 'nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'monto_contrato', 'comuna',
+            'barrio', 'direccion', 'lat', 'lng', 'fecha_inicio', 'fecha_fin_inicial', 'plazo_meses',
+            'porcentaje_avance', 'imagen_1', 'imagen_2', 'imagen_3', 'imagen_4', 'licitacion_oferta_empresa',
+            'licitacion_anio', 'contratacion_tipo', 'nro_contratacion', 'cuit_contratista', 'beneficiarios',
+            'mano_obra', 'compromiso', 'destacada', 'ba_elige', 'link_interno', 'pliego_descarga', 'expediente_numero',
+            'estudio_ambiental_descarga', 'financiamiento']
+# Tipos de las columnas no textuales en Parquet (el resto va como string); fijarlos evita que un bloque donde una
+# columna es toda NULL (como lat) quede con otro esquema que el primero
+TIPOS_PARQUET = {'id': 'int64', 'monto_contrato': 'float64', 'comuna': 'int64', 'lat': 'float64', 'lng': 'float64',
+                 'plazo_meses': 'int64', 'porcentaje_avance': 'float64', 'licitacion_anio': 'int64', 'mano_obra': 'int64'}
+
+
+def formato_de(ruta, formatos, formato=None):
+    formato = formato or formatos.get(os.path.splitext(ruta)[1].lower())
+    if formato not in formatos.values():
+        raise ValueError(f"Formato de exportacion desconocido para {ruta} (opciones: {', '.join(formatos.values())})")
+    return formato
+
+
+def como_lista(valor):
+    return list(valor) if isinstance(valor, (list, set, tuple)) else [valor]
+
+
+def consulta_obras(etapa=None, comuna=None, desde=None, hasta=None, campo_fecha='fecha_inicio'):
+    # SELECT de obras con los nombres de las lookups; etapa y comuna son un nombre o una lista, desde y hasta fechas
+    # ISO (inclusivas) sobre campo_fecha. Los textos de detalle sin valor salen como en el modelo ("no disponible")
+    expresiones = []
+    for columna in COLUMNAS:
+        if columna in LOOKUPS:
+            expresiones.append(LOOKUPS[columna].nombre.alias(columna))
+        elif columna in CAMPOS_DETALLE:
+            expresiones.append(fn.COALESCE(getattr(ObraDetalle, columna), TEXTO_NO_DISPONIBLE).alias(columna))
+        else:
+            expresiones.append(getattr(Obra, columna))
+    consulta = Obra.select(*expresiones)
+    for columna, clase in LOOKUPS.items():
+        consulta = consulta.join_from(Obra, clase, JOIN.LEFT_OUTER, on=(getattr(Obra, columna) == clase.id))
+    consulta = consulta.join_from(Obra, ObraDetalle, JOIN.LEFT_OUTER, on=(ObraDetalle.obra == Obra.id))
+    if etapa is not None:
+        consulta = consulta.where(coincide_lookup(Etapa, como_lista(etapa)))
+    if comuna is not None:
+        consulta = consulta.where(Comuna.nombre.in_(como_lista(comuna)))
+    fecha = getattr(Obra, campo_fecha)
+    if desde is not None:
+        consulta = consulta.where(fecha >= str(desde))
+    if hasta is not None:
+        consulta = consulta.where(fecha <= str(hasta))
+    return consulta.order_by(Obra.id)
+
+
+def bloques(filas, tamanio_bloque):
+    while True:
+        bloque = list(itertools.islice(filas, tamanio_bloque))
+        if not bloque:
+            return
+        yield bloque
+
+
+def escribir_csv(archivo, columnas, bloques_filas):
+    # Mismo separador que csv_limpiado.csv
+    escritor = csv.writer(archivo, delimiter=';')
+    escritor.writerow(columnas)
+    for bloque in bloques_filas:
+        escritor.writerows(bloque)
+
+
+def escribir_jsonl(archivo, columnas, bloques_filas):
+    # Las fechas van como texto ISO
+    for bloque in bloques_filas:
+        archivo.write(''.join(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False, default=str) + '\n'
+                              for fila in bloque))
+
+
+def escribir_parquet(ruta, columnas, bloques_filas):
+    # pyarrow es opcional, solo hace falta para este formato; cada bloque es un row group del archivo
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Exportar a Parquet requiere pyarrow (pip install pyarrow)") from None
+    esquema = pa.schema([(columna, getattr(pa, TIPOS_PARQUET.get(columna, 'string'))()) for columna in columnas])
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for bloque in bloques_filas:
+            datos = {columna: list(valores) if columna in TIPOS_PARQUET else
+                     [None if v is None else str(v) for v in valores]
+                     for columna, valores in zip(columnas, zip(*bloque))}
+            escritor.write_table(pa.Table.from_pydict(datos, schema=esquema))
+
+
+def escribir(ruta, formato, columnas, filas, tamanio_bloque=TAMANIO_BLOQUE):
+    # Escribe en un archivo temporal y lo renombra al terminar: una exportacion cortada no deja un archivo a medias
+    temporal = ruta + '.parcial'
+    escritas = 0
+
+    def contar(bloques_filas):
+        nonlocal escritas
+        for bloque in bloques_filas:
+            escritas += len(bloque)
+            yield bloque
+
+    try:
+        if formato == 'parquet':
+            escribir_parquet(temporal, columnas, contar(bloques(filas, tamanio_bloque)))
+        else:
+            with open(temporal, 'w', newline='' if formato == 'csv' else None, encoding='utf-8') as archivo:
+                escritor = escribir_csv if formato == 'csv' else escribir_jsonl
+                escritor(archivo, columnas, contar(bloques(filas, tamanio_bloque)))
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return escritas
+
+
+def exportar_obras(ruta, formato=None, tamanio_bloque=TAMANIO_BLOQUE, **filtros):
+    # Devuelve la cantidad de obras exportadas. La lectura va en una transaccion para exportar un estado consistente
+    # de la base aunque otra conexion escriba mientras tanto (en WAL los lectores no bloquean a los escritores)
+    formato = formato_de(ruta, FORMATOS, formato)
+    with sqlite_db.atomic():
+        filas = consulta_obras(**filtros).tuples().iterator()
+        return escribir(ruta, formato, COLUMNAS, filas, tamanio_bloque)
+
+
+def filas_indicador(valor):
+    # Resultado de un indicador -> filas: un escalar es una fila, un diccionario una fila por clave y una tupla de
+    # tuplas (como obras_por_tipo) una fila por elemento
+    if isinstance(valor, dict):
+        return [[clave, dato] for clave, dato in valor.items()]
+    if isinstance(valor, (list, tuple)):
+        return [list(elemento) if isinstance(elemento, (list, tuple)) else [elemento] for elemento in valor]
+    return [[valor]]
+
+
+def exportar_indicadores(indicadores, ruta, formato=None):
+    # indicadores: {nombre: resultado} como lo devuelve calcular_indicadores. json escribe un unico documento, jsonl
+    # una linea por indicador y csv una fila por elemento con el nombre del indicador en la primera columna
+    formato = formato_de(ruta, FORMATOS_INDICADORES, formato)
+    temporal = ruta + '.parcial'
+    try:
+        with open(temporal, 'w', newline='' if formato == 'csv' else None, encoding='utf-8') as archivo:
+            if formato == 'json':
+                json.dump(indicadores, archivo, ensure_ascii=False, indent=2, default=str)
+            elif formato == 'jsonl':
+                for nombre, valor in indicadores.items():
+                    archivo.write(json.dumps({'indicador': nombre, 'valor': valor}, ensure_ascii=False, default=str) + '\n')
+            else:
+                escritor = csv.writer(archivo, delimiter=';')
+                escritor.writerow(['indicador', 'valores'])
+                for nombre, valor in indicadores.items():
+                    escritor.writerows([nombre] + fila for fila in filas_indicador(valor))
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return len(indicadores)
@@ -1,13 +1,112 @@
+import time
+# Referencia para medir el arranque (--tiempo), antes de cualquier otra importacion
+INICIO_PROCESO = time.perf_counter()
 # Cargo la info del modelo de BBDD
 from modelo_orm import *
+from instrumentacion import Perfil, etapa, medir_etapa
+import exportacion
+import escritura
+import indicadores
+import listado
 # Ahora cargo los modulos que preciso para este modulo
 from abc import ABC, abstractmethod
-import pandas as pd
+from contextlib import contextmanager, nullcontext
+import argparse
+import glob
+import hashlib
+import importlib.util
+import itertools
+import json
+import math
+import operator
+import os
+import re
+import sys
+from functools import reduce
 from unidecode import unidecode
 
+
+def importar_diferido(nombre):
+    # El modulo se ejecuta recien cuando se usa por primera vez uno de sus atributos: los comandos que no tocan
+    # pandas (indicadores, buscar, ...) arrancan sin pagar su importacion
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.find_spec(nombre)
+    cargador = importlib.util.LazyLoader(spec.loader)
+    spec.loader = cargador
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    cargador.exec_module(modulo)
+    return modulo
+
+
+pd = importar_diferido('pandas')
+
 # Clase abstracta para gestionar obras
 class GestionarObra(ABC):
     archivo_csv = "./observatorio-de-obras-urbanas.csv"
+    archivo_limpio = "./csv_limpiado.csv"
+    # Cache del dataset limpio, se invalida sola si cambia el csv o la version de las reglas de limpieza
+    directorio_cache = "./cache_limpieza"
+    # Incrementar cada vez que se modifique limpiar_datos
+    version_limpieza = 5
+    # Version del esquema (tablas, indices, triggers y migraciones de mapear_orm), se guarda en PRAGMA user_version;
+    # incrementarla cada vez que cambie alguno para que las bases existentes se migren en el proximo arranque
+    version_esquema = 3
+    # Formatos de fecha aceptados, en orden; el csv trae ISO, dd/mm/yyyy y mm/yy (este ultimo queda en el dia 1)
+    formatos_fecha = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%y']
+    # Resultados de los indicadores: {(indicador, usar_resumen): (version_datos, resultado)}
+    cache_indicadores = {}
+    estadisticas_cache = {'aciertos': 0, 'fallos': 0}
+    # Copia en memoria de obras para analisis vectorizado (ver analitica), se crea en el primer uso
+    motor_analitico = None
+    # Reutilizar la conexion entre operaciones en lugar de abrir y cerrar en cada una
+    conexion_persistente = True
+    # Cantidad de filas por cada insert_many (36 columnas x 500 filas queda debajo del limite de variables de SQLite)
+    tamanio_lote = 500
+
+    # Validacion de importar_obras: columna -> regla de nueva_obra ('texto', 'entero', 'flotante' o 'fecha')
+    reglas_obra_nueva = {
+        'entorno': 'texto', 'nombre': 'texto', 'etapa': 'texto', 'tipo': 'texto', 'area_responsable': 'texto',
+        'descripcion': 'texto', 'monto_contrato': 'flotante', 'comuna': 'entero', 'barrio': 'texto',
+        'direccion': 'texto', 'lat': 'flotante', 'lng': 'flotante', 'fecha_inicio': 'fecha',
+        'fecha_fin_inicial': 'fecha', 'plazo_meses': 'entero', 'porcentaje_avance': 'flotante',
+        'imagen_1': 'texto', 'imagen_2': 'texto', 'imagen_3': 'texto', 'imagen_4': 'texto',
+        'licitacion_oferta_empresa': 'texto', 'licitacion_anio': 'entero', 'contratacion_tipo': 'texto',
+        'nro_contratacion': 'texto', 'cuit_contratista': 'texto', 'beneficiarios': 'texto', 'mano_obra': 'entero',
+        'compromiso': 'texto', 'destacada': 'texto', 'ba_elige': 'texto', 'link_interno': 'texto',
+        'pliego_descarga': 'texto', 'expediente_numero': 'texto', 'estudio_ambiental_descarga': 'texto',
+        'financiamiento': 'texto'
+    }
+    # Los campos que nueva_obra no pregunta; quedan sin dato (NULL en obras_detalles)
+    valores_por_defecto = dict.fromkeys(['imagen_1', 'imagen_2', 'imagen_3', 'imagen_4', 'link_interno',
+                                         'pliego_descarga', 'estudio_ambiental_descarga'], TEXTO_NO_DISPONIBLE)
+
+    # Columnas del csv del observatorio (el archivo trae ademas una columna vacia que no se lee)
+    columnas_csv = [
+        "id", "entorno", "nombre", "etapa", "tipo", "area_responsable", "descripcion", "monto_contrato",
+        "comuna", "barrio", "direccion", "lat", "lng", "fecha_inicio", "fecha_fin_inicial", "plazo_meses",
+        "porcentaje_avance", "imagen_1", "imagen_2", "imagen_3", "imagen_4", "licitacion_oferta_empresa",
+        "licitacion_anio", "contratacion_tipo", "nro_contratacion", "cuit_contratista", "beneficiarios",
+        "mano_obra", "compromiso", "destacada", "ba_elige", "link_interno", "pliego_descarga", "expediente-numero",
+        "estudio_ambiental_descarga", "financiamiento"
+    ]
+    # Reales con un valor casi distinto en cada fila: como category no ahorran nada, se leen como texto
+    columnas_continuas = ['monto_contrato', 'lat', 'lng']
+    # Textos con pocos valores distintos (banderas SI/NO, entorno): se leen como category
+    columnas_repetidas = ['entorno', 'compromiso', 'destacada', 'ba_elige', 'estudio_ambiental_descarga']
+
+    # Columnas del csv que son foreign keys a las tablas lookup
+    clases_lookup = {
+        'etapa': Etapa,
+        'tipo': Tipo,
+        'area_responsable': AreaResponsable,
+        'comuna': Comuna,
+        'barrio': Barrio,
+        'licitacion_oferta_empresa': LicitacionEmpresa,
+        'contratacion_tipo': ContratacionTipo,
+        'financiamiento': Financiamiento
+    }
 
     @classmethod
     @abstractmethod
@@ -23,12 +122,12 @@ class GestionarObra(ABC):
     @abstractmethod
     def verificando_entero(cls, numero):
         while True:
-            try:
-                opcion = int(numero)
-                return opcion
-            except ValueError:
-                print("El valor ingresado no es un numero.")
-                numero = input("Ingreselo nuevamente: ")
+            # Misma regla que importar_obras (ver parsear_enteros)
+            opcion = cls.parsear_enteros(pd.Series([numero])).iloc[0]
+            if pd.notna(opcion):
+                return int(opcion)
+            print("El valor ingresado no es un numero.")
+            numero = input("Ingreselo nuevamente: ")
     @classmethod
     @abstractmethod
     def verificando_flotante(cls, numero):
@@ -39,22 +138,95 @@ class GestionarObra(ABC):
             except ValueError:
                 print("El valor ingresado no es un numero.")
                 numero = input("Ingreselo nuevamente: ")
+    @classmethod
+    @abstractmethod
+    def verificando_fecha(cls, fecha):
+        while True:
+            iso = cls.parsear_fechas(pd.Series([fecha.strip()])).iloc[0]
+            if pd.notna(iso):
+                return iso.strftime('%Y-%m-%d')
+            print("La fecha ingresada no es valida.")
+            fecha = input("Ingresela nuevamente: ")
+
+    @classmethod
+    @abstractmethod
+    def parsear_fechas(cls, valores):
+        # Serie de textos -> datetime probando cada formato de formatos_fecha solo sobre lo que todavia no se pudo
+        # interpretar (NaT si no coincide ninguno); con formato explicito pandas no adivina fila por fila
+        valores = valores.astype(object).where(valores.notna(), None).astype(str).str.strip()
+        fechas = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[ns]')
+        for formato in cls.formatos_fecha:
+            faltantes = fechas.isna()
+            if not faltantes.any():
+                break
+            fechas[faltantes] = pd.to_datetime(valores[faltantes], format=formato, errors='coerce')
+        return fechas
+
+    @classmethod
+    @abstractmethod
+    def parsear_enteros(cls, valores):
+        # Serie de textos -> Int64 con lo que acepta int(): espacios alrededor, signo y guiones bajos entre digitos
+        # ("1_000"); <NA> si no es un entero (tampoco "1.0" ni "1e3", que int() rechaza). Solo digitos ASCII
+        textos = valores.astype('string').str.strip()
+        validos = textos.str.fullmatch(r'[+-]?[0-9]+(?:_[0-9]+)*').fillna(False).astype(bool)
+        numeros = pd.to_numeric(textos.where(validos).str.replace('_', '', regex=False), errors='coerce')
+        # Fuera de rango de SQLite (enteros de 64 bits) tampoco se acepta
+        return numeros.where(numeros.abs() < 2 ** 63).astype('Int64')
 
     @classmethod
     @abstractmethod
-    def extraer_datos(cls):
+    def esquema_csv(cls):
+        # Columna del csv -> (dtype para read_csv, conversion en limpiar_datos), segun el campo del modelo:
+        #   foreign keys: category, cada nombre se guarda una vez y las filas tienen un codigo (la comuna es un numero)
+        #   enteros, reales y fechas: category tambien, vienen como texto sucio ("1,234", "A/D") y asi limpiar_datos
+        #   convierte cada valor distinto una sola vez; salvo columnas_continuas y las coordenadas (nullables)
+        #   resto: texto (str, para que un cuit no se lea como numero en un bloque y como texto en otro), category
+        #   para columnas_repetidas
+        esquema = {}
+        for columna in cls.columnas_csv:
+            nombre = columna.replace('-', '_')
+            campo = Obra._meta.fields.get(nombre) or ObraDetalle._meta.fields.get(nombre)
+            if isinstance(campo, AutoField):
+                esquema[columna] = (None, 'id')
+            elif isinstance(campo, ForeignKeyField):
+                numerica = isinstance(campo.rel_model.nombre, IntegerField)
+                esquema[columna] = ('category', 'entero' if numerica else 'lookup')
+            elif isinstance(campo, DateField):
+                esquema[columna] = ('category', 'fecha')
+            elif isinstance(campo, (IntegerField, FloatField)):
+                if campo.null:
+                    esquema[columna] = (str, 'coordenada')
+                else:
+                    esquema[columna] = (str if nombre in cls.columnas_continuas else 'category',
+                                        'entero' if isinstance(campo, IntegerField) else 'real')
+            else:
+                esquema[columna] = ('category' if nombre in cls.columnas_repetidas else str, 'texto')
+        return esquema
+
+    @classmethod
+    @abstractmethod
+    def convertir_valores(cls, serie, conversion):
+        # Aplica conversion (Serie -> Serie, vectorizada) a la columna; si es category la aplica solo a sus categorias
+        # y la expande con los codigos, el costo depende de los valores distintos y no de las filas
+        if not isinstance(serie.dtype, pd.CategoricalDtype):
+            return conversion(serie)
+        convertidas = conversion(pd.Series(serie.cat.categories.astype(object)))
+        # El codigo -1 (nulo) queda como faltante (NaN o NaT)
+        valores = pd.api.extensions.take(convertidas.to_numpy(), serie.cat.codes.to_numpy(), allow_fill=True)
+        return pd.Series(valores, index=serie.index)
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='resultado')
+    def extraer_datos(cls, tamanio_bloque=None):
         # Usamos una excepcion en caso de no poder leer el csv con pandas
+        # Con tamanio_bloque devuelve un iterador de DataFrames de ese tamaño en lugar del csv completo
         try:
-            columnas_validas = [
-                "id", "entorno", "nombre", "etapa", "tipo", "area_responsable", "descripcion", "monto_contrato",
-                "comuna", "barrio", "direccion", "lat", "lng", "fecha_inicio", "fecha_fin_inicial", "plazo_meses",
-                "porcentaje_avance", "imagen_1", "imagen_2", "imagen_3", "imagen_4", "licitacion_oferta_empresa",
-                "licitacion_anio", "contratacion_tipo", "nro_contratacion", "cuit_contratista", "beneficiarios",
-                "mano_obra", "compromiso", "destacada", "ba_elige", "link_interno", "pliego_descarga", "expediente-numero",
-                "estudio_ambiental_descarga", "financiamiento"
-            ]
             # Nota a memoria, el archivo trae una columna vacia, se restringe a las 36 de estructura
-            df = pd.read_csv(cls.archivo_csv, delimiter=';', usecols=columnas_validas, encoding='ISO-8859-1')
+            # Tipos de esquema_csv: nada queda librado a lo que pandas infiera en cada bloque (salvo el id)
+            tipos = {columna: tipo for columna, (tipo, _) in cls.esquema_csv().items() if tipo is not None}
+            df = pd.read_csv(cls.archivo_csv, delimiter=';', usecols=cls.columnas_csv, encoding='ISO-8859-1',
+                             dtype=tipos, chunksize=tamanio_bloque)
             # df = pd.read_csv(cls.archivo_csv, sep=";", encoding='ISO-8859-1')
             # nota a memoria:     campo='Urbanización'.encode('ISO-8859-1').decode('utf-8'), antes de cargar bbdd
 
@@ -67,19 +239,47 @@ class GestionarObra(ABC):
             # print(df)
             return df
 
+    @classmethod
+    @abstractmethod
+    def perfilar(cls, cantidad_lentas=10):
+        # with Implementacion.perfilar() as perfil: ... -> perfil.reporte() / perfil.mostrar()
+        # Tiempo y filas por etapa del pipeline, sentencias SQL y las consultas mas lentas (ver instrumentacion.py)
+        return Perfil(cantidad_lentas)
+
     @classmethod
     @abstractmethod
     def conectar_db(cls):
-        # conecto a la base de datos
+        # conecto a la base de datos (los pragmas de PRAGMAS_SQLITE se aplican al abrir la conexion)
         if sqlite_db.is_closed():
             try:
                 sqlite_db.connect()
             except OperationalError as e:
                 print("Error al conectar con la BD.", e)
                 exit()
-        else:
+        elif not cls.conexion_persistente:
             print("La conexión a la BD ya está abierta.")
 
+    @classmethod
+    @abstractmethod
+    def cerrar_db(cls, forzar=False):
+        # Con conexion_persistente la conexion queda abierta para la siguiente operacion (peewee usa una por hilo)
+        if (forzar or not cls.conexion_persistente) and not sqlite_db.is_closed():
+            sqlite_db.close()
+
+    @classmethod
+    @abstractmethod
+    def configurar_db(cls, ruta=None, pragmas=None, persistente=None):
+        # Cambia el archivo de la BD, los pragmas (None = PRAGMAS_SQLITE, {} = valores por defecto de SQLite)
+        # y si la conexion se reutiliza entre operaciones
+        cls.cerrar_db(forzar=True)
+        sqlite_db.init(ruta or sqlite_db.database, pragmas=PRAGMAS_SQLITE if pragmas is None else pragmas)
+        if persistente is not None:
+            cls.conexion_persistente = persistente
+        cls.cache_indicadores.clear()
+        cls.motor_analitico = None
+        cache_lookups.limpiar()
+        indicadores.cerrar_pool()
+
     @classmethod
     @abstractmethod
     def mapear_orm(cls):
@@ -89,7 +289,31 @@ class GestionarObra(ABC):
         # Método para mapear la estructura de la base de datos utilizando peewee
         # Creamos las tablas correspondientes a las clases del modelo
         try:
-            sqlite_db.create_tables([Etapa, Tipo, AreaResponsable, Comuna, Barrio, LicitacionEmpresa, ContratacionTipo,Financiamiento, Obra])
+            # Base al dia con este modelo: los comandos no pagan las migraciones ni la creacion de tablas y triggers
+            if sqlite_db.pragma('user_version') == cls.version_esquema and Obra.table_exists():
+                # Una carga masiva que se corto (el proceso murio) deja los triggers apagados: se rehace lo derivado
+                if CargaMasiva.select().exists():
+                    print("Habia una carga masiva sin terminar, se reconstruyen resumenes e indice de texto")
+                    cls.rehacer_derivados()
+                return
+            # Las bases creadas con versiones anteriores del modelo se migran antes de crear indices y triggers
+            if Obra.table_exists():
+                cls.migrar_lookups()
+                cls.migrar_duplicados_lookups()
+                cls.migrar_coordenadas()
+                cls.migrar_detalles()
+                cls.migrar_rellenos()
+                cls.migrar_fechas()
+            sqlite_db.create_tables([Etapa, Tipo, AreaResponsable, Comuna, Barrio, LicitacionEmpresa, ContratacionTipo,Financiamiento, Obra,
+                                     ObraDetalle, ObraHuella, ResumenEtapa, ResumenTipo, ResumenComuna, ResumenPlazo, ResumenGeneral,
+                                     ResumenMensual, ResumenAnual, VersionDatos, ObraCambio, ObraFechaInvalida, CargaMasiva])
+            cls.crear_triggers_resumen()
+            cls.crear_triggers_version()
+            with sqlite_db.atomic():
+                for sql in list(triggers_celda().values()) + list(triggers_detalle().values()):
+                    sqlite_db.execute_sql(sql)
+            cls.crear_indice_busqueda()
+            sqlite_db.pragma('user_version', cls.version_esquema)
         except OperationalError as e:
             print("Error al crear las tablas:", e)
             sqlite_db.close()
@@ -97,15 +321,304 @@ class GestionarObra(ABC):
         else:
             print("tablas creadas exitosamente")
         finally:
-            if not sqlite_db.is_closed():
-                # Cerrar la conexión a la base de datos cuando hayamos terminado
-                sqlite_db.close()
+            cls.cerrar_db()
+
+
+
+    @classmethod
+    @abstractmethod
+    def coordenada(cls, valor, limite):
+        # Convierte una coordenada con coma o punto decimal, None si no es un numero valido o esta fuera de rango
+        try:
+            numero = float(str(valor).replace(',', '.'))
+        except ValueError:
+            return None
+        return numero if abs(numero) <= limite else None
+
+    @classmethod
+    @abstractmethod
+    def migrar_coordenadas(cls):
+        # lat y lng eran CharField: paso las columnas a REAL, convierto los textos y agrego la celda de la grilla
+        tabla = Obra._meta.table_name
+        columnas = {columna.name: columna for columna in sqlite_db.get_columns(tabla)}
+        migrator = SqliteMigrator(sqlite_db)
+        operaciones = []
+        if 'celda' not in columnas:
+            operaciones.append(migrator.add_column(tabla, 'celda', IntegerField(null=True)))
+        texto = [nombre for nombre in ('lat', 'lng') if columnas[nombre].data_type.upper() != 'REAL']
+        operaciones += [migrator.alter_column_type(tabla, nombre, FloatField(null=True)) for nombre in texto]
+        if not operaciones:
+            return
+
+        with sqlite_db.atomic():
+            # Recrear la tabla borra sus triggers, mapear_orm los vuelve a crear despues
+            migrate(*operaciones)
+            filas = sqlite_db.execute_sql(f"SELECT id, lat, lng FROM {tabla} WHERE typeof(lat) = 'text' OR typeof(lng) = 'text'")
+            valores = [(cls.coordenada(lat, 90), cls.coordenada(lng, 180), id_) for id_, lat, lng in filas.fetchall()]
+            for lote in chunked(valores, cls.tamanio_lote):
+                sqlite_db.cursor().executemany(f"UPDATE {tabla} SET lat = ?, lng = ? WHERE id = ?", lote)
+            sqlite_db.execute_sql(f"UPDATE {tabla} SET celda = {EXPRESION_CELDA.format(f=tabla)} "
+                                  f"WHERE lat IS NOT NULL AND lng IS NOT NULL")
+        print(f"Coordenadas migradas a REAL ({len(valores)} obras convertidas)")
+
+    @classmethod
+    @abstractmethod
+    def migrar_detalles(cls):
+        # Bases anteriores a la particion vertical: paso los textos largos y links a obras_detalles y los saco de obras
+        tabla = Obra._meta.table_name
+        columnas = {columna.name for columna in sqlite_db.get_columns(tabla)}
+        movidas = [campo for campo in CAMPOS_DETALLE if campo in columnas]
+        if not movidas:
+            return
+
+        with sqlite_db.atomic():
+            ObraDetalle.create_table()
+            # Los triggers de busqueda viejos leen descripcion de obras y no dejarian borrar la columna;
+            # crear_indice_busqueda los vuelve a crear leyendo obras_detalles
+            for nombre in triggers_busqueda():
+                sqlite_db.execute_sql(f"DROP TRIGGER IF EXISTS {nombre}")
+            # Los rellenos pasan tal cual; migrar_rellenos los deja en NULL
+            sqlite_db.execute_sql(f"INSERT OR IGNORE INTO {ObraDetalle._meta.table_name} (obra_id, {', '.join(movidas)}) "
+                                  f"SELECT id, {', '.join(movidas)} FROM {tabla}")
+            for campo in movidas:
+                sqlite_db.execute_sql(f"ALTER TABLE {tabla} DROP COLUMN {campo}")
+        # DROP COLUMN deja las paginas libres dentro del archivo, VACUUM las devuelve
+        sqlite_db.execute_sql("VACUUM")
+        print(f"Textos y links de obras movidos a {ObraDetalle._meta.table_name} ({len(movidas)} columnas)")
+
+    @classmethod
+    @abstractmethod
+    def migrar_rellenos(cls):
+        # Hasta la version 2 del esquema solo "no disponible" se guardaba como NULL: los demas rellenos (ver RELLENOS)
+        # quedaban repetidos como texto en obras_detalles
+        if not ObraDetalle.table_exists():
+            return
+        tabla = ObraDetalle._meta.table_name
+        cambiadas = 0
+        with sqlite_db.atomic():
+            for campo in CAMPOS_DETALLE:
+                cambiadas += sqlite_db.execute_sql(f"UPDATE {tabla} SET {campo} = NULL "
+                                                   f"WHERE {condicion_relleno(campo)}").rowcount
+        if cambiadas:
+            print(f"Rellenos de {tabla} pasados a NULL ({cambiadas} valores)")
+
+    @classmethod
+    @abstractmethod
+    def migrar_lookups(cls):
+        # Las obras dadas de alta con versiones anteriores de nueva_obra guardaban el nombre de la etapa, el tipo, el area
+        # o el financiamiento en lugar del id; las tablas resumen no pueden agrupar por esas claves, asi que las resuelvo
+        for columna, clase in cls.clases_lookup.items():
+            campo = getattr(Obra, columna)
+            nombres = [nombre for (nombre,) in Obra.select(campo).where(fn.typeof(campo) == 'text').distinct().tuples()]
+            if not nombres:
+                continue
+            with sqlite_db.atomic():
+                for nombre in nombres:
+                    Obra.update({campo: Obra.resolver_lookup(clase, nombre)}).where(campo == nombre).execute()
+            print(f"Obras con {columna} guardado como nombre corregidas ({len(nombres)} nombres)")
+
+    @classmethod
+    @abstractmethod
+    def migrar_duplicados_lookups(cls):
+        # Antes de resolver las lookups por forma canonica cada variante de un nombre ("Finalizada", "finalizada",
+        # "FInalizada") tenia su fila: paso las obras a la de menor id y borro las demas. Los triggers de las tablas
+        # resumen mueven los grupos al cambiar las foreign keys de obras
+        fusionadas = 0
+        with sqlite_db.atomic():
+            for columna, clase in cls.clases_lookup.items():
+                if not isinstance(clase.nombre, CharField):
+                    continue
+                repetidas = (clase.select(fn.canonica(clase.nombre)).group_by(fn.canonica(clase.nombre))
+                             .having(fn.COUNT(clase.id) > 1))
+                grupos = {}
+                for id_, nombre in (clase.select(clase.id, clase.nombre)
+                                    .where(fn.canonica(clase.nombre).in_(repetidas)).order_by(clase.id).tuples()):
+                    grupos.setdefault(forma_canonica(nombre), []).append(id_)
+                campo = getattr(Obra, columna)
+                for conservado, *duplicados in grupos.values():
+                    Obra.update({campo: conservado}).where(campo.in_(duplicados)).execute()
+                    clase.delete().where(clase.id.in_(duplicados)).execute()
+                    fusionadas += len(duplicados)
+        if fusionadas:
+            cache_lookups.limpiar()
+            print(f"Lookups duplicadas por acentos, mayusculas o espacios fusionadas ({fusionadas} filas)")
+
+    @classmethod
+    @abstractmethod
+    def migrar_fechas(cls):
+        # Las obras cargadas antes de version_limpieza 3 (o con nueva_obra) pueden tener fechas en dd-mm-yyyy u otro
+        # formato de texto; las paso a ISO. Las que no se pueden interpretar quedan como estaban y se anotan en
+        # ObraFechaInvalida para no volver a leerlas
+        sqlite_db.create_tables([ObraFechaInvalida])
+        iso = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+        condicion = (SQL(f"NOT (fecha_inicio GLOB {iso} AND fecha_fin_inicial GLOB {iso})")
+                     & Obra.id.not_in(ObraFechaInvalida.select(ObraFechaInvalida.obra_id)))
+        filas = list(Obra.select(Obra.id, Obra.fecha_inicio, Obra.fecha_fin_inicial).where(condicion).tuples())
+        if not filas:
+            return
+        df = pd.DataFrame(filas, columns=['id', 'fecha_inicio', 'fecha_fin_inicial']).astype(str)
+        convertidas, invalidas = set(), set()
+        with sqlite_db.atomic():
+            for campo in ('fecha_inicio', 'fecha_fin_inicial'):
+                fechas = cls.parsear_fechas(df[campo])
+                iso_texto = fechas.dt.strftime('%Y-%m-%d')
+                cambiadas = fechas.notna() & (iso_texto != df[campo].str.strip())
+                for obra_id, fecha in zip(df['id'][cambiadas], iso_texto[cambiadas]):
+                    Obra.update({getattr(Obra, campo): fecha}).where(Obra.id == int(obra_id)).execute()
+                convertidas.update(int(obra_id) for obra_id in df['id'][cambiadas])
+                invalidas.update(int(obra_id) for obra_id in df['id'][fechas.isna()])
+            if invalidas:
+                (ObraFechaInvalida.insert_many([(obra_id,) for obra_id in invalidas], fields=[ObraFechaInvalida.obra_id])
+                 .on_conflict_ignore().execute())
+        if convertidas:
+            print(f"Fechas de {len(convertidas)} obras pasadas a ISO")
+
+    @classmethod
+    @abstractmethod
+    def crear_triggers(cls, triggers):
+        # Crea los triggers {nombre: sql} que faltan y reemplaza los que tienen otra definicion; devuelve los nombres
+        # de los que no estaban o cambiaron
+        existentes = dict(sqlite_db.execute_sql("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+        # SQLite guarda la definicion sin el IF NOT EXISTS
+        distintos = [nombre for nombre, sql in triggers.items()
+                     if existentes.get(nombre) != sql.replace(' IF NOT EXISTS', '', 1).rstrip(';')]
+        with sqlite_db.atomic():
+            for nombre in distintos:
+                sqlite_db.execute_sql(f"DROP TRIGGER IF EXISTS {nombre}")
+            for sql in triggers.values():
+                sqlite_db.execute_sql(sql)
+        return distintos
+
+    @classmethod
+    @abstractmethod
+    def crear_triggers_resumen(cls):
+        # Crea los triggers que mantienen las tablas resumen; si faltaba alguno o su definicion cambio (por ejemplo
+        # al agregar una tabla resumen) lo reemplazo y reconstruyo los resumenes desde obras
+        if cls.crear_triggers(triggers_resumen()):
+            cls.reconstruir_resumenes()
+
+    @classmethod
+    @abstractmethod
+    def crear_triggers_version(cls):
+        # Fila unica del contador y triggers que lo incrementan con cada escritura
+        with sqlite_db.atomic():
+            VersionDatos.insert(id=1, version=0).on_conflict_ignore().execute()
+            cls.crear_triggers({**triggers_version(), **triggers_cambios()})
+
+    @classmethod
+    @abstractmethod
+    def crear_indice_busqueda(cls):
+        # Tabla FTS5 y sus triggers; si faltaba algun trigger reconstruyo el indice desde obras
+        if not ObraBusqueda.fts5_installed():
+            print("SQLite no tiene FTS5, la busqueda de texto no esta disponible")
+            return
+        with sqlite_db.atomic():
+            ObraBusqueda.create_table()
+            if cls.crear_triggers(triggers_busqueda()):
+                cls.reconstruir_busqueda()
+
+    @classmethod
+    @abstractmethod
+    def reconstruir_busqueda(cls):
+        # Vuelve a llenar el indice de texto desde obras y obras_detalles
+        if not ObraBusqueda.table_exists():
+            return
+        with sqlite_db.atomic():
+            ObraBusqueda.delete().execute()
+            sqlite_db.execute_sql(consulta_reconstruccion_busqueda())
+            # Fusiona los segmentos del indice (el borrado deja marcas que ocupan lugar)
+            ObraBusqueda.optimize()
+
+    @classmethod
+    @abstractmethod
+    def reconstruir_resumenes(cls, comparar=True):
+        # Recalcula todas las tablas resumen desde obras e informa las filas que se habian desviado. Con
+        # comparar=False (despues de una carga sin triggers, donde todo esta desviado) solo recalcula
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        desvios = {}
+        try:
+            with sqlite_db.atomic():
+                # Una tabla puede recibir varias especificaciones (las series por evento), se vacia una sola vez
+                especificaciones = {}
+                for modelo, claves, valores in RESUMENES:
+                    especificaciones.setdefault(modelo, []).append((claves, valores))
+                for modelo, lista in especificaciones.items():
+                    claves, valores = lista[0]
+                    columnas = [getattr(modelo, campo.replace('_id', '')) if campo.endswith('_id') else getattr(modelo, campo)
+                                for campo in list(claves) + list(valores)]
+                    # Redondeo los montos para no contar como desvio el error de punto flotante de las sumas parciales
+                    # (las filas con cantidad_obras en 0 equivalen a no tener fila)
+                    consulta = modelo.select(*columnas).where(modelo.cantidad_obras != 0).tuples()
+                    if comparar:
+                        antes = {tuple(round(v, 2) if isinstance(v, float) else v for v in fila) for fila in consulta}
+                    modelo.delete().execute()
+                    for claves, valores in lista:
+                        sqlite_db.execute_sql(consulta_reconstruccion(modelo, claves, valores))
+                    if comparar:
+                        despues = {tuple(round(v, 2) if isinstance(v, float) else v for v in fila)
+                                   for fila in consulta.clone()}
+                        if antes != despues:
+                            desvios[modelo._meta.table_name] = len(antes ^ despues)
+        finally:
+            if not abierta:
+                cls.cerrar_db()
+        if not comparar:
+            return desvios
+        if desvios:
+            print("Resumenes reconstruidos, filas desviadas:", desvios)
+        else:
+            print("Resumenes reconstruidos, sin desvios")
+        return desvios
 
+    @classmethod
+    @abstractmethod
+    @contextmanager
+    def carga_sin_triggers(cls):
+        # with cls.carga_sin_triggers(): ... para cargas masivas sobre obras vacia. Con la marca de carga_masiva los
+        # triggers por fila no hacen nada (cada obra insertada los pagaba: resumenes, version, obras_cambios e indice de
+        # texto) y al salir se rehacen por conjuntos en una sola transaccion. La marca se ve desde todas las
+        # conexiones: lo que escriban otras mientras tanto tambien queda cubierto por la reconstruccion del final
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            CargaMasiva.insert(id=1).on_conflict_ignore().execute()
+            try:
+                yield
+            finally:
+                cls.rehacer_derivados()
+        finally:
+            if not abierta:
+                cls.cerrar_db()
 
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def rehacer_derivados(cls):
+        # Quita la marca de carga masiva y recalcula desde obras lo que mantienen los triggers
+        with sqlite_db.atomic():
+            CargaMasiva.delete().execute()
+            cls.reconstruir_resumenes(comparar=False)
+            cls.reconstruir_busqueda()
+            # Una version nueva para toda la carga y todas las obras marcadas en ella (analitica relee completo)
+            VersionDatos.update(version=VersionDatos.version + 1).where(VersionDatos.id == 1).execute()
+            sqlite_db.execute_sql(
+                f"INSERT INTO {ObraCambio._meta.table_name} (obra_id, version) "
+                f"SELECT id, (SELECT version FROM {VersionDatos._meta.table_name} WHERE id = 1) "
+                f"FROM {Obra._meta.table_name} WHERE true "
+                f"ON CONFLICT(obra_id) DO UPDATE SET version = excluded.version")
 
     @classmethod
     @abstractmethod
-    def limpiar_datos(cls, df):
+    @medir_etapa(filas='entrada')
+    def limpiar_datos(cls, df, estadisticas=None, encabezado=True):
+        # estadisticas: diccionario opcional donde se acumulan los conteos de limpieza (sirve para procesar por bloques)
+        # encabezado: en False agrega el bloque al csv limpio en lugar de sobreescribirlo
+        filas_leidas = len(df)
+        esquema = cls.esquema_csv()
+
         # 1) Primero vamos a limpiar los campos vacios de las columnas necesarias para los indicadores
 
         # NOTA A PROFESOR: mano_obra me baja de 1325 aprox 301 registros y elimina una cantidad importante de datos
@@ -116,17 +629,35 @@ class GestionarObra(ABC):
         # print(df)
         # Eliminar filas con NaN en columnas a verificar
         df.dropna(subset=columnas_a_verificar, inplace=True)
+        filas_sin_nulos = len(df)
 
 
         # Columnas numéricas que deben limpiarse de texto y valores cero
-        columnas_numericas = ['monto_contrato', 'comuna', 'plazo_meses', 'porcentaje_avance', 'licitacion_anio', 'mano_obra']
+        columnas_numericas = [col for col, (_, conversion) in esquema.items() if conversion in ('entero', 'real')]
 
         # Convertir columnas específicas a tipo numérico, forzando errores como NaN
         for col in columnas_numericas:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
+            df[col] = cls.convertir_valores(df[col], lambda valores: pd.to_numeric(valores.astype(str).str.replace(',', ''),
+                                                                                   errors='coerce'))
 
         # Eliminar filas con NaN o valores cero en columnas numéricas
-        df = df[~(df[columnas_numericas].isna() | (df[columnas_numericas] == 0)).any(axis=1)]
+        df = df[~(df[columnas_numericas].isna() | (df[columnas_numericas] == 0)).any(axis=1)].copy()
+        filas_con_numeros = len(df)
+
+        # Fechas a ISO (yyyy-mm-dd) para que la base las pueda comparar y agrupar; las que no tienen un formato
+        # conocido (como "A/D") se descartan
+        columnas_fecha = [col for col, (_, conversion) in esquema.items() if conversion == 'fecha']
+        fechas = {col: cls.convertir_valores(df[col], cls.parsear_fechas) for col in columnas_fecha}
+        validas = reduce(operator.and_, (valores.notna() for valores in fechas.values()))
+        df = df[validas].copy()
+        for col in columnas_fecha:
+            df[col] = fechas[col][validas].dt.strftime('%Y-%m-%d')
+        if estadisticas is not None:
+            estadisticas['filas_leidas'] = estadisticas.get('filas_leidas', 0) + filas_leidas
+            estadisticas['descartadas_nulos'] = estadisticas.get('descartadas_nulos', 0) + filas_leidas - filas_sin_nulos
+            estadisticas['descartadas_numericos'] = estadisticas.get('descartadas_numericos', 0) + filas_sin_nulos - filas_con_numeros
+            estadisticas['descartadas_fechas'] = estadisticas.get('descartadas_fechas', 0) + filas_con_numeros - len(df)
+            estadisticas['filas_limpias'] = estadisticas.get('filas_limpias', 0) + len(df)
 
 
 
@@ -137,37 +668,357 @@ class GestionarObra(ABC):
         # df["mano_obra"] = df["mano_obra"].astype(int)
 
         # 2) Hago el rellenado de datos que no quiero eliminar
-        conversiones = {
-            "id": "integer",
-            "monto_contrato": "float",
-            "comuna": "integer",
-            "plazo_meses": "integer",
-            "porcentaje_avance": "integer",
-            "licitacion_anio": "integer",
-            "mano_obra": "integer"
-        }
+        conversiones = [col for col, (_, conversion) in esquema.items() if conversion in ('id', 'entero', 'real')]
+        # Coordenadas a numero (vienen con coma decimal), las invalidas quedan en NaN y se guardan como NULL
+        # (el csv trae algunas sin separador decimal o en notacion cientifica, fuera de rango)
+        limites_coordenadas = {'lat': 90, 'lng': 180}
+        columnas_coordenadas = [col for col, (_, conversion) in esquema.items() if conversion == 'coordenada']
+        for col in columnas_coordenadas:
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce')
+            df[col] = df[col].where(df[col].abs() <= limites_coordenadas[col])
+
         for columna in df.columns:
-            if columna in conversiones.keys():
+            if columna in conversiones:
                 df.loc[:, columna] = df[columna].fillna(0)
-            elif columna not in columnas_a_verificar:
-                if df[columna].dtype == "object":
-                    df.loc[:, columna] = df[columna].fillna("no disponible")
+            elif columna not in columnas_a_verificar and columna not in columnas_coordenadas:
+                # El resto son campos de texto del modelo: los relleno aunque pandas los haya leido como float
+                # (pasa con columnas vacias en todo el archivo o en todo un bloque); las category siguen siendo category
+                # Los rellenos conocidos ("-", "N/a", ...) tambien quedan como TEXTO_NO_DISPONIBLE
+                rellenos = df[columna].isna() | df[columna].astype(str).str.strip().str.lower().isin(RELLENOS)
+                if isinstance(df[columna].dtype, pd.CategoricalDtype):
+                    if TEXTO_NO_DISPONIBLE not in df[columna].cat.categories:
+                        df[columna] = df[columna].cat.add_categories([TEXTO_NO_DISPONIBLE])
+                    df[columna] = df[columna].mask(rellenos, TEXTO_NO_DISPONIBLE)
+                else:
+                    df[columna] = df[columna].astype(object).mask(rellenos, TEXTO_NO_DISPONIBLE)
+
+        # Tipos fijos para que el resultado (y su huella) no dependa de lo que pandas infiera en cada bloque; los
+        # enteros del modelo entran en 32 bits (calcular_huellas los hashea como int64)
+        tipos_finales = {'id': 'int64', 'entero': 'int32', 'real': 'float64', 'coordenada': 'float64'}
+        df = df.astype({col: tipos_finales[conversion] for col, (_, conversion) in esquema.items()
+                        if conversion in tipos_finales})
 
         # print(df['plazo_meses'])
-        df.to_csv('./csv_limpiado.csv', index=False, sep=';')
+        df.to_csv(cls.archivo_limpio, index=False, sep=';', header=encabezado, mode='w' if encabezado else 'a')
         return df
 
     @classmethod
     @abstractmethod
-    def cargar_datos(cls, df):
+    def clave_cache(cls):
+        # Clave del cache: tamaño, fecha de modificacion y hash del csv fuente mas la version de la limpieza
+        estado = os.stat(cls.archivo_csv)
+        contenido = hashlib.sha256()
+        with open(cls.archivo_csv, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(1024 * 1024), b''):
+                contenido.update(bloque)
+        clave = f"{estado.st_size}-{estado.st_mtime_ns}-{contenido.hexdigest()}-v{cls.version_limpieza}"
+        return hashlib.sha256(clave.encode()).hexdigest()[:32]
+
+    @classmethod
+    @abstractmethod
+    def ruta_cache(cls):
+        return os.path.join(cls.directorio_cache, f"{cls.clave_cache()}.pkl")
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='resultado')
+    def obtener_datos_limpios(cls, usar_cache=True):
+        # Devuelve el dataset limpio desde el cache si el csv y las reglas no cambiaron, si no lo extrae y limpia
+        try:
+            ruta = cls.ruta_cache()
+        except FileNotFoundError as e:
+            print("Error al conectar con el dataset.", e)
+            return False
+
+        if usar_cache and os.path.exists(ruta):
+            df = pd.read_pickle(ruta)
+            print("dataset limpio leido del cache")
+            return df
+
+        df = cls.extraer_datos()
+        if df is False:
+            return False
+        df = cls.limpiar_datos(df)
+
+        os.makedirs(cls.directorio_cache, exist_ok=True)
+        # Escribo a un temporal y renombro para no dejar un cache a medio escribir
+        temporal = ruta + ".tmp"
+        df.to_pickle(temporal)
+        os.replace(temporal, ruta)
+        return df
+
+    @classmethod
+    @abstractmethod
+    def cargar_csv(cls, forzar=False):
+        # extraer -> limpiar -> cargar el csv salvo que ya este cargado: misma clave_cache (csv y reglas de limpieza)
+        # y ninguna escritura en la base desde esa carga. Asi repetir la carga no lee el csv ni importa pandas.
+        # Devuelve True si cargo, None si no hacia falta y False si hubo un error
+        try:
+            clave = cls.clave_cache()
+        except FileNotFoundError as e:
+            print("Error al conectar con el dataset.", e)
+            return False
+        marca = os.path.join(cls.directorio_cache, "ultima_carga.json")
+        base = os.path.abspath(sqlite_db.database)
+        cls.conectar_db()
+        try:
+            if not forzar and os.path.exists(marca):
+                with open(marca) as archivo:
+                    ultima = json.load(archivo)
+                if ultima == {'clave': clave, 'base': base, 'version': cls.version_datos()}:
+                    print("Los datos ya estan cargados (el csv no cambio desde la ultima carga)")
+                    return None
+            df = cls.obtener_datos_limpios()
+            if df is False:
+                return False
+            cls.cargar_datos(df)
+            cls.conectar_db()
+            os.makedirs(cls.directorio_cache, exist_ok=True)
+            with open(marca, 'w') as archivo:
+                json.dump({'clave': clave, 'base': base, 'version': cls.version_datos()}, archivo)
+            return True
+        finally:
+            cls.cerrar_db()
+
+    @classmethod
+    @abstractmethod
+    def invalidar_cache(cls):
+        # Borra la entrada del cache del csv actual, la proxima lectura vuelve a limpiar
+        try:
+            os.remove(cls.ruta_cache())
+        except FileNotFoundError:
+            return False
+        return True
+
+    @classmethod
+    @abstractmethod
+    def limpiar_cache(cls, conservar=3):
+        # Borra las entradas mas viejas del cache dejando solo las ultimas `conservar`
+        if not os.path.isdir(cls.directorio_cache):
+            return 0
+        entradas = [os.path.join(cls.directorio_cache, nombre) for nombre in os.listdir(cls.directorio_cache)
+                    if nombre.endswith('.pkl')]
+        entradas.sort(key=os.path.getmtime, reverse=True)
+        for ruta in entradas[conservar:]:
+            os.remove(ruta)
+        return len(entradas[conservar:])
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='entrada')
+    def resolver_lookups(cls, df, mapas=None):
+        # Devuelve {campo: {forma canonica: id}} para cada tabla lookup (ver clave_lookup), creando de una sola vez los
+        # nombres que falten: de cada forma canonica nueva se inserta el primer nombre que aparece en df
+        # Con `mapas` de una llamada anterior (varios archivos o bloques) no se vuelven a leer las tablas: solo se
+        # insertan y leen los nombres que todavia no estan, y el diccionario se actualiza en el lugar
+        if mapas is None:
+            mapas = {}
+        with sqlite_db.atomic():
+            for campo, clase_orm in cls.clases_lookup.items():
+                if campo not in mapas:
+                    # Si quedaran duplicados de antes de migrar_duplicados_lookups gana el de menor id
+                    mapas[campo] = {clave_lookup(clase_orm, nombre): id_ for nombre, id_ in
+                                    clase_orm.select(clase_orm.nombre, clase_orm.id)
+                                    .order_by(clase_orm.id.desc()).tuples()}
+                mapa = mapas[campo]
+                # En orden de aparicion, asi los ids quedan igual que en la carga fila a fila
+                nuevos = {}
+                for valor in df[campo].unique():
+                    if pd.notna(valor):
+                        nuevos.setdefault(clave_lookup(clase_orm, valor), valor)
+                faltantes = [nombre for clave, nombre in nuevos.items() if clave not in mapa]
+                for lote in chunked(faltantes, cls.tamanio_lote):
+                    clase_orm.insert_many([{'nombre': nombre} for nombre in lote]).execute()
+                    mapa.update({clave_lookup(clase_orm, nombre): id_ for nombre, id_ in
+                                 clase_orm.select(clase_orm.nombre, clase_orm.id)
+                                 .where(clase_orm.nombre.in_(lote)).tuples()})
+        # Fuera de una transaccion los ids ya estan confirmados y sirven para nueva_obra y las transiciones
+        for campo, clase_orm in cls.clases_lookup.items():
+            cache_lookups.guardar(clase_orm, mapas[campo])
+        return mapas
+
+    @classmethod
+    @abstractmethod
+    def filas_obra(cls, df, mapas):
+        # Convierte las filas del DataFrame en diccionarios listos para Obra.insert_many
+        nombres_campos = {columna: columna.replace('-', '_') for columna in df.columns}
+        for fila in df.itertuples(index=False, name=None):
+            registro = {}
+            for columna, valor in zip(df.columns, fila):
+                if columna in mapas:
+                    clase_orm = cls.clases_lookup[columna]
+                    registro[columna] = mapas[columna].get(clave_lookup(clase_orm, valor)) if pd.notna(valor) else None
+                else:
+                    registro[nombres_campos[columna]] = valor
+            # NaN no es una coordenada, va NULL; la celda se calcula aca para no depender del trigger
+            if pd.isna(registro.get('lat')) or pd.isna(registro.get('lng')):
+                registro['lat'] = registro['lng'] = registro['celda'] = None
+            else:
+                registro['celda'] = celda_de(registro['lat'], registro['lng'])
+            yield registro
+
+    @classmethod
+    @abstractmethod
+    def insertar_lote(cls, modelo, filas, ignorar_repetidas=False):
+        # Lo mismo que modelo.insert_many(filas).execute() (filas con las mismas claves): el SQL sale de
+        # sentencia_insercion y cada valor solo pasa por el db_value de su campo. Con insert_many armar el SQL en
+        # Python era la mayor parte del tiempo de la carga masiva
+        if not filas:
+            return
+        campos = tuple(filas[0])
+        conversiones = [modelo._meta.fields[campo].db_value for campo in campos]
+        parametros = [convertir(fila[campo]) for fila in filas for campo, convertir in zip(campos, conversiones)]
+        sqlite_db.execute_sql(sentencia_insercion(modelo, campos, len(filas), ignorar_repetidas), parametros)
+
+    @classmethod
+    @abstractmethod
+    def separar_detalle(cls, lote):
+        # Divide los registros de filas_obra en filas de obras y de obras_detalles (ver CAMPOS_DETALLE)
+        obras, detalles = [], []
+        for registro in lote:
+            detalle = {'obra': registro['id']}
+            for campo in CAMPOS_DETALLE:
+                detalle[campo] = valor_detalle(registro.pop(campo, None))
+            obras.append(registro)
+            detalles.append(detalle)
+        return obras, detalles
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='resultado')
+    def cargar_datos_masivo(cls, df, tamanio_lote=None, mapas=None):
+        # Carga masiva: lookups resueltos una sola vez en memoria y obras insertadas por lotes en transacciones
+        tamanio_lote = tamanio_lote or cls.tamanio_lote
+        inicio = time.perf_counter()
+        mapas = cls.resolver_lookups(df, mapas)
+
+        total_antes = Obra.select().count()
+        for lote in chunked(cls.filas_obra(df, mapas), tamanio_lote):
+            try:
+                obras, detalles = cls.separar_detalle(lote)
+                with sqlite_db.atomic():
+                    # Ignoro ids repetidos igual que la carga fila a fila
+                    cls.insertar_lote(Obra, obras, ignorar_repetidas=True)
+                    cls.insertar_lote(ObraDetalle, detalles, ignorar_repetidas=True)
+            except IntegrityError as e:
+                print("Error al insertar un lote en la tabla obras.", e)
+        filas_cargadas = Obra.select().count() - total_antes
+        cls.guardar_huellas(df['id'], cls.calcular_huellas(df))
+
+        duracion = time.perf_counter() - inicio
+        filas_por_segundo = filas_cargadas / duracion if duracion > 0 else 0
+        print(f"Carga masiva: {filas_cargadas} de {len(df)} filas en {duracion:.2f}s ({filas_por_segundo:.0f} filas/s)")
+        return filas_cargadas
+
+    @classmethod
+    @abstractmethod
+    def calcular_huellas(cls, df):
+        # Hash vectorizado del contenido de cada fila (si cambia la version de pandas la primera sincronizacion reescribe todo)
+        # Los enteros se hashean como int64: la huella no depende del ancho con que limpiar_datos guarda la columna
+        # (y una category se hashea igual que sus valores como texto)
+        enteros = {col: 'int64' for col, tipo in df.dtypes.items() if pd.api.types.is_integer_dtype(tipo) and tipo != 'int64'}
+        return pd.util.hash_pandas_object(df.astype(enteros) if enteros else df, index=False).map('{:016x}'.format)
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='entrada')
+    def guardar_huellas(cls, ids, huellas, tamanio_lote=None):
+        filas = [{'obra': int(id_), 'huella': huella, 'eliminada': False} for id_, huella in zip(ids, huellas)]
+        with sqlite_db.atomic():
+            for lote in chunked(filas, tamanio_lote or cls.tamanio_lote):
+                (ObraHuella.insert_many(lote)
+                 .on_conflict(conflict_target=[ObraHuella.obra], preserve=[ObraHuella.huella, ObraHuella.eliminada])
+                 .execute())
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def marcar_eliminadas(cls, ids_vigentes, tamanio_lote=None):
+        # Marca como eliminadas las obras que ya no vienen en el csv
+        ids_vigentes = set(ids_vigentes)
+        eliminadas = [obra_id for (obra_id,) in
+                      ObraHuella.select(ObraHuella.obra).where(ObraHuella.eliminada == False).tuples()
+                      if obra_id not in ids_vigentes]
+        with sqlite_db.atomic():
+            for lote in chunked(eliminadas, tamanio_lote or cls.tamanio_lote):
+                ObraHuella.update(eliminada=True).where(ObraHuella.obra.in_(lote)).execute()
+        return len(eliminadas)
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='entrada')
+    def sincronizar_datos(cls, df, tamanio_lote=None, marcar_eliminadas=True, mapas=None):
+        # Sincronizacion incremental: solo se escriben las obras nuevas o modificadas y se marcan las que ya no vienen en el csv
+        # Con marcar_eliminadas=False sirve para sincronizar un bloque suelto (ver procesar_en_bloques)
+        tamanio_lote = tamanio_lote or cls.tamanio_lote
+        inicio = time.perf_counter()
+
+        huellas = cls.calcular_huellas(df)
+        ids_csv = df['id'].astype(int)
+        # Solo leo las huellas de las obras que vienen en df
+        existentes = {}
+        ids_obras = set()
+        for lote in chunked(ids_csv.unique().tolist(), tamanio_lote):
+            existentes.update({obra_id: (huella, eliminada) for obra_id, huella, eliminada in
+                               ObraHuella.select(ObraHuella.obra, ObraHuella.huella, ObraHuella.eliminada)
+                               .where(ObraHuella.obra.in_(lote)).tuples()})
+            # Obras cargadas antes de que existiera la tabla de huellas: se tratan como modificadas una unica vez
+            ids_obras.update(id_ for (id_,) in Obra.select(Obra.id).where(Obra.id.in_(lote)).tuples())
+
+        nuevas = ~ids_csv.isin(ids_obras)
+        modificadas = ~nuevas & pd.Series([existentes.get(id_, (None, False))[0] != huella
+                                           for id_, huella in zip(ids_csv, huellas)], index=df.index)
+        reaparecidas = pd.Series([existentes.get(id_, (None, False))[1] for id_ in ids_csv], index=df.index)
+        a_escribir = nuevas | modificadas
+
+        cambios = df[a_escribir]
+        if len(cambios):
+            mapas = cls.resolver_lookups(cambios, mapas)
+            campos = [campo for campo in Obra._meta.sorted_fields if campo is not Obra._meta.primary_key]
+            campos_detalle = [getattr(ObraDetalle, campo) for campo in CAMPOS_DETALLE]
+            for lote in chunked(cls.filas_obra(cambios, mapas), tamanio_lote):
+                obras, detalles = cls.separar_detalle(lote)
+                with sqlite_db.atomic():
+                    Obra.insert_many(obras).on_conflict(conflict_target=[Obra.id], preserve=campos).execute()
+                    (ObraDetalle.insert_many(detalles)
+                     .on_conflict(conflict_target=[ObraDetalle.obra], preserve=campos_detalle).execute())
+        # Tambien actualizo la huella de las obras que vuelven a aparecer para quitarles la marca de eliminada
+        actualizar = a_escribir | reaparecidas
+        cls.guardar_huellas(ids_csv[actualizar], huellas[actualizar], tamanio_lote)
+
+        eliminadas = cls.marcar_eliminadas(ids_csv, tamanio_lote) if marcar_eliminadas else 0
+
+        duracion = time.perf_counter() - inicio
+        print(f"Sincronizacion: {int(nuevas.sum())} nuevas, {int(modificadas.sum())} modificadas, "
+              f"{eliminadas} marcadas como eliminadas, {int((~a_escribir).sum())} sin cambios ({duracion:.2f}s)")
+        return {'nuevas': int(nuevas.sum()), 'modificadas': int(modificadas.sum()), 'eliminadas': eliminadas}
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='entrada')
+    def cargar_datos(cls, df, masivo=True, tamanio_lote=None):
 
         # Me aseguro que la conexión a la bbdd está abierta
         cls.conectar_db()
 
-        # Valido si hay datos en la tabla Obra antes de proceder
+        # Si la tabla Obra ya tiene datos, en modo masivo sincronizo solo las diferencias
         if Obra.select().exists():
+            if masivo:
+                try:
+                    return cls.sincronizar_datos(df, tamanio_lote)
+                finally:
+                    cls.cerrar_db()
             print("La tabla Obra ya contiene datos.")
-            sqlite_db.close()
+            cls.cerrar_db()
+            return
+
+        if masivo:
+            try:
+                with cls.carga_sin_triggers():
+                    cls.cargar_datos_masivo(df, tamanio_lote)
+            finally:
+                # Me aseguro de cerrar la conexion a la BBDD
+                cls.cerrar_db()
             return
 
 
@@ -185,34 +1036,25 @@ class GestionarObra(ABC):
         }
 
         # Diccionario de clases ORM correspondientes a cada campo
-        clases_orm = {
-            'etapa': Etapa,
-            'tipo': Tipo,
-            'area_responsable': AreaResponsable,
-            'comuna': Comuna,
-            'barrio': Barrio,
-            'licitacion_oferta_empresa': LicitacionEmpresa,
-            'contratacion_tipo': ContratacionTipo,
-            'financiamiento': Financiamiento
-        }
+        clases_orm = cls.clases_lookup
 
         # Iterar sobre el diccionario y crear instancias en las tablas lookup
         for campo, valores in valores_unicos.items():
             for valor in valores:
                 if pd.notna(valor):  # Verificar que el valor no sea NaN
                     clase_orm = clases_orm[campo]
-                    clase_orm.create(nombre=valor)
+                    Obra.resolver_lookup(clase_orm, valor)
 
         # LLeno ahora la tabla principal recorriendo las filas del csv
         for elem in df.values:
-            tipo_etapa = Etapa.get(Etapa.nombre == elem[3])
-            tipo_tipo = Tipo.get(Tipo.nombre == elem[4])
-            tipo_area = AreaResponsable.get(AreaResponsable.nombre == elem[5])
-            tipo_comuna = Comuna.get(Comuna.nombre == elem[8])
-            tipo_barrio = Barrio.get(Barrio.nombre == elem[9])
-            tipo_licitacion = LicitacionEmpresa.get(LicitacionEmpresa.nombre == elem[21])
-            tipo_contratacion = ContratacionTipo.get(ContratacionTipo.nombre == elem[23])
-            tipo_financiamiento = Financiamiento.get(Financiamiento.nombre == elem[35])
+            tipo_etapa = Obra.resolver_lookup(Etapa, elem[3])
+            tipo_tipo = Obra.resolver_lookup(Tipo, elem[4])
+            tipo_area = Obra.resolver_lookup(AreaResponsable, elem[5])
+            tipo_comuna = Obra.resolver_lookup(Comuna, elem[8])
+            tipo_barrio = Obra.resolver_lookup(Barrio, elem[9])
+            tipo_licitacion = Obra.resolver_lookup(LicitacionEmpresa, elem[21])
+            tipo_contratacion = Obra.resolver_lookup(ContratacionTipo, elem[23])
+            tipo_financiamiento = Obra.resolver_lookup(Financiamiento, elem[35])
             try:
                 Obra.create(
                     id=elem[0],
@@ -257,10 +1099,254 @@ class GestionarObra(ABC):
 
         print("Datos cargados en las tablas exitosamente.")
         # Me aseguro de cerrar la conexion a la BBDD
-        if not sqlite_db.is_closed():
-            sqlite_db.close()
+        cls.cerrar_db()
+
+
 
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def procesar_en_bloques(cls, tamanio_bloque=10000, tamanio_lote=None):
+        # Pipeline extraer -> limpiar -> cargar bloque a bloque, la memoria queda acotada al tamaño del bloque
+        bloques = cls.extraer_datos(tamanio_bloque)
+        if bloques is False:
+            return
 
+        cls.conectar_db()
+        estadisticas = {}
+        tabla_vacia = not Obra.select().exists()
+        ids_vistos = set()
+        mapas = {}
+        try:
+            # Sobre la tabla vacia todos los bloques van por la carga masiva, con los triggers apagados hasta el final
+            with cls.carga_sin_triggers() if tabla_vacia else nullcontext():
+                for numero in itertools.count():
+                    # read_csv lee cada bloque recien al pedirlo, lo mido aparte para separarlo de la limpieza
+                    with etapa('leer_bloque') as medida:
+                        bloque = next(bloques, None)
+                        medida.filas = 0 if bloque is None else len(bloque)
+                    if bloque is None:
+                        break
+                    bloque = cls.limpiar_datos(bloque, estadisticas, encabezado=(numero == 0))
+                    ids_vistos.update(bloque['id'].astype(int).tolist())
+                    if tabla_vacia:
+                        cls.cargar_datos_masivo(bloque, tamanio_lote, mapas)
+                    else:
+                        cls.sincronizar_datos(bloque, tamanio_lote, marcar_eliminadas=False, mapas=mapas)
+            # Las eliminadas recien se pueden saber despues de ver todos los bloques
+            if not tabla_vacia:
+                print(f"Obras marcadas como eliminadas: {cls.marcar_eliminadas(ids_vistos, tamanio_lote)}")
+        finally:
+            cls.cerrar_db()
+
+        print(f"Limpieza: {estadisticas.get('filas_leidas', 0)} filas leidas, "
+              f"{estadisticas.get('descartadas_nulos', 0)} descartadas por nulos, "
+              f"{estadisticas.get('descartadas_numericos', 0)} descartadas por numeros invalidos o cero, "
+              f"{estadisticas.get('descartadas_fechas', 0)} descartadas por fechas invalidas, "
+              f"{estadisticas.get('filas_limpias', 0)} filas limpias")
+        return estadisticas
+
+    @classmethod
+    @abstractmethod
+    def archivos_a_ingerir(cls, origen):
+        # Acepta un directorio (todos sus .csv), un patron glob ("exports/obras_2023_*.csv") o un archivo. Nunca
+        # incluye archivo_limpio: la ingesta lo reescribe mientras los procesos del pool todavia leen la entrada
+        if os.path.isdir(origen):
+            origen = os.path.join(origen, '*.csv')
+        salida = os.path.realpath(cls.archivo_limpio)
+        archivos = []
+        for archivo in set(glob.glob(origen)):
+            if os.path.realpath(archivo) == salida:
+                print(f"{archivo} se omite: es el csv limpio que escribe la ingesta")
+            else:
+                archivos.append(archivo)
+        # Orden por nombre: si una obra viene en varios exports gana el ultimo (los exports se nombran por periodo)
+        return sorted(archivos)
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def ingerir_archivos(cls, origen, procesos=None, tamanio_lote=None, marcar_eliminadas=True):
+        # Varios csv a la vez: cada archivo se extrae y limpia en un proceso del pool y un unico escritor (este
+        # proceso) los va cargando en orden a medida que estan listos, con los ids de las lookups compartidos
+        if os.path.realpath(origen) == os.path.realpath(cls.archivo_limpio):
+            print(f"No se puede ingerir {origen}: es el mismo archivo que el csv limpio de salida ({cls.archivo_limpio})")
+            return False
+        archivos = cls.archivos_a_ingerir(origen)
+        if not archivos:
+            print(f"No se encontraron archivos csv en {origen}")
+            return False
+        procesos = min(procesos or os.cpu_count() or 1, len(archivos))
+        inicio = time.perf_counter()
+
+        # Los procesos del pool tienen que poder importar la clase; las definidas en el script principal
+        # (Implementacion) no siempre se pueden, en ese caso limpian con las reglas de GestionarObra
+        clase_limpieza = cls if cls.__module__ != '__main__' else GestionarObra
+        if procesos > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=procesos)
+            # map reparte todos los archivos de entrada y devuelve los resultados en orden
+            resultados = pool.map(limpiar_archivo, itertools.repeat(clase_limpieza), archivos)
+        else:
+            pool = None
+            resultados = map(limpiar_archivo, itertools.repeat(clase_limpieza), archivos)
+
+        cls.conectar_db()
+        tabla_vacia = not Obra.select().exists()
+        ids_vistos = set()
+        mapas = {}
+        filas = 0
+        try:
+            for numero, (archivo, df) in enumerate(resultados):
+                if df is False:
+                    continue
+                print(f"{archivo}: {len(df)} filas limpias")
+                # El csv limpio queda con todos los archivos juntos
+                df.to_csv(cls.archivo_limpio, index=False, sep=';', header=(numero == 0),
+                          mode='w' if numero == 0 else 'a')
+                ids_vistos.update(df['id'].astype(int).tolist())
+                filas += len(df)
+                # El primer archivo sobre la tabla vacia va por la carga masiva, el resto sincroniza (gana el ultimo)
+                if not Obra.select().exists():
+                    with cls.carga_sin_triggers():
+                        cls.cargar_datos_masivo(df, tamanio_lote, mapas)
+                else:
+                    cls.sincronizar_datos(df, tamanio_lote, marcar_eliminadas=False, mapas=mapas)
+            if marcar_eliminadas and not tabla_vacia:
+                print(f"Obras marcadas como eliminadas: {cls.marcar_eliminadas(ids_vistos, tamanio_lote)}")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            cls.cerrar_db()
+
+        duracion = time.perf_counter() - inicio
+        print(f"Ingesta: {len(archivos)} archivos, {filas} filas limpias en {duracion:.2f}s con {procesos} procesos")
+        return {'archivos': len(archivos), 'filas': filas, 'segundos': duracion, 'procesos': procesos}
+
+    @classmethod
+    @abstractmethod
+    def condicion_rectangulo(cls, lat_min, lat_max, lng_min, lng_max):
+        # Filtro por rango de celdas (usa el indice) y despues por coordenada exacta. Solo el rango de celdas se
+        # recorta a coordenadas validas; el filtro exacto usa los limites pedidos (una obra en lat 90 esta en la fila
+        # de celdas 18000 y tiene que aparecer si se pide hasta 90)
+        fila_min, columna_min = divmod(celda_de(max(lat_min, -90), max(lng_min, -180)), COLUMNAS_CELDA)
+        fila_max, columna_max = divmod(celda_de(min(lat_max, 90), min(lng_max, 180)), COLUMNAS_CELDA)
+        if fila_max - fila_min < 30:
+            # Un rango de celdas por fila de la grilla (peewee anida los OR, mas filas desbordan el parser de SQLite)
+            rangos = [Obra.celda.between(fila * COLUMNAS_CELDA + columna_min, fila * COLUMNAS_CELDA + columna_max)
+                      for fila in range(fila_min, fila_max + 1)]
+            por_celda = reduce(operator.or_, rangos)
+        else:
+            # Rectangulos muy altos: un solo rango para no armar un OR gigante
+            por_celda = Obra.celda.between(fila_min * COLUMNAS_CELDA, fila_max * COLUMNAS_CELDA + columna_max)
+        return por_celda & Obra.lat.between(lat_min, lat_max) & Obra.lng.between(lng_min, lng_max)
+
+    @classmethod
+    @abstractmethod
+    def obras_en_rectangulo(cls, lat_min, lat_max, lng_min, lng_max):
+        cls.conectar_db()
+        try:
+            return list(Obra
+                        .select(Obra.id, Obra.nombre, Obra.lat, Obra.lng, Obra.monto_contrato)
+                        .where(cls.condicion_rectangulo(lat_min, lat_max, lng_min, lng_max))
+                        .dicts())
+        finally:
+            cls.cerrar_db()
+
+    @classmethod
+    @abstractmethod
+    def distancia_km(cls, lat_1, lng_1, lat_2, lng_2):
+        # Distancia haversine sobre la esfera terrestre
+        lat_1, lng_1, lat_2, lng_2 = map(math.radians, (lat_1, lng_1, lat_2, lng_2))
+        a = math.sin((lat_2 - lat_1) / 2) ** 2 + math.cos(lat_1) * math.cos(lat_2) * math.sin((lng_2 - lng_1) / 2) ** 2
+        return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+    @classmethod
+    @abstractmethod
+    def obras_en_radio(cls, lat, lng, radio_km):
+        # Busco en el rectangulo que contiene al circulo y me quedo con las que estan a menos de radio_km
+        delta_lat = radio_km / 111.32
+        delta_lng = radio_km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+        resultado = []
+        for obra in cls.obras_en_rectangulo(lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng):
+            obra['distancia_km'] = cls.distancia_km(lat, lng, obra['lat'], obra['lng'])
+            if obra['distancia_km'] <= radio_km:
+                resultado.append(obra)
+        resultado.sort(key=lambda obra: obra['distancia_km'])
+        return resultado
+
+    @classmethod
+    @abstractmethod
+    def obras_cercanas(cls, lat, lng, cantidad=5):
+        # Las `cantidad` obras mas cercanas: agrando el radio hasta juntar suficientes
+        cls.conectar_db()
+        try:
+            total = Obra.select().where(Obra.celda.is_null(False)).count()
+        finally:
+            cls.cerrar_db()
+        radio_km = TAMANIO_CELDA * 111.32
+        while True:
+            encontradas = cls.obras_en_radio(lat, lng, radio_km)
+            if len(encontradas) >= min(cantidad, total):
+                return encontradas[:cantidad]
+            radio_km *= 2
+
+    @classmethod
+    @abstractmethod
+    def monto_por_celda(cls, escala=1, lat_min=-90, lat_max=90, lng_min=-180, lng_max=180):
+        # Cantidad de obras y monto_contrato por celda para mapas de calor; escala agrupa escala x escala celdas
+        # En SQLite la division entre enteros ya es entera (peewee usa % para LIKE, por eso no hay modulo)
+        fila_celda = Obra.celda / COLUMNAS_CELDA
+        fila = fila_celda / escala
+        columna = (Obra.celda - fila_celda * COLUMNAS_CELDA) / escala
+        cls.conectar_db()
+        try:
+            query = (Obra
+                     .select(fila.alias('fila'), columna.alias('columna'),
+                             fn.COUNT(Obra.id).alias('cantidad_obras'),
+                             fn.SUM(Obra.monto_contrato).alias('monto_total'))
+                     .where(cls.condicion_rectangulo(lat_min, lat_max, lng_min, lng_max))
+                     .group_by(fila, columna)
+                     .dicts())
+            celdas = list(query)
+        finally:
+            cls.cerrar_db()
+        lado = TAMANIO_CELDA * escala
+        for celda in celdas:
+            # Centro de la celda agrupada
+            celda['lat'] = celda['fila'] * lado - 90 + lado / 2
+            celda['lng'] = celda['columna'] * lado - 180 + lado / 2
+        return celdas
+
+    @classmethod
+    @abstractmethod
+    def buscar_obras(cls, texto, etapa=None, comuna=None, limite=20):
+        # Busqueda de texto completo en nombre, descripcion y direccion, ordenada por relevancia (bm25)
+        # Cada palabra se busca como prefijo y sin acentos: "hospi pinero" encuentra "Hospital Piñero"
+        palabras = re.findall(r'\w+', unidecode(texto))
+        if not palabras:
+            return []
+        consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+        # El nombre pesa mas que la direccion y esta mas que la descripcion
+        puntaje = ObraBusqueda.bm25(10.0, 1.0, 5.0)
+
+        query = (Obra
+                 .select(Obra.id, Obra.nombre, Obra.direccion, Etapa.nombre.alias('etapa'),
+                         Comuna.nombre.alias('comuna'), puntaje.alias('puntaje'))
+                 .join(ObraBusqueda, on=(ObraBusqueda.rowid == Obra.id))
+                 .join_from(Obra, Etapa)
+                 .join_from(Obra, Comuna)
+                 .where(ObraBusqueda.match(consulta)))
+        if etapa is not None:
+            query = query.where(coincide_lookup(Etapa, [etapa]))
+        if comuna is not None:
+            query = query.where(Comuna.nombre == comuna)
+
+        cls.conectar_db()
+        try:
+            return list(query.order_by(puntaje).limit(limite).dicts())
+        finally:
+            cls.cerrar_db()
 
     @classmethod
     @abstractmethod
@@ -283,43 +1369,38 @@ class GestionarObra(ABC):
         while True:
             comuna_nombre = input("Ingrese la comuna: ").capitalize()
             comuna_nombre = cls.verificando_entero(comuna_nombre)
-            comuna, created = Comuna.get_or_create(nombre=comuna_nombre)
-            if created:
-                print(f"Comuna '{comuna_nombre}' creada.")
+            comuna = Obra.resolver_lookup(Comuna, comuna_nombre)
             break
         # Validación de Barrio                                                  #FUNCION# tabla
         while True:
             barrio_nombre = input("Ingrese el barrio: ").capitalize()
             barrio_nombre = cls.verificando_texto(barrio_nombre)
-            barrio, created = Barrio.get_or_create(nombre=barrio_nombre)
-            if created:
-                print(f"Barrio '{barrio_nombre}' creado.")
+            # "Villa urquiza" (capitalizado) resuelve a la fila "Villa Urquiza" del csv
+            barrio = Obra.resolver_lookup(Barrio, barrio_nombre)
             break
         direccion = input("Ingrese la dirección: ").capitalize()
         direccion = cls.verificando_texto(direccion)
-        lat = input("Ingrese la latitud: ").capitalize()
-        lat = cls.verificando_texto(lat)
-        lng = input("Ingrese la longitud: ").capitalize()
-        lng = cls.verificando_texto(lng)
+        lat = input("Ingrese la latitud: ")
+        lat = cls.verificando_flotante(lat.replace(',', '.'))
+        lng = input("Ingrese la longitud: ")
+        lng = cls.verificando_flotante(lng.replace(',', '.'))
         fecha_inicio = input("Ingrese la fecha de inicio (dd-mm-yyyy): ")                #FUNCION
-        fecha_inicio = cls.verificando_texto(fecha_inicio)  # nota ver fecha EXPREG
+        fecha_inicio = cls.verificando_fecha(fecha_inicio)
         fecha_fin_inicial = input("Ingrese la fecha de fin inicial (dd-mm-yyyy): ")     #FUNCION
-        fecha_fin_inicial = cls.verificando_texto(fecha_fin_inicial)
+        fecha_fin_inicial = cls.verificando_fecha(fecha_fin_inicial)
         plazo_meses = input("Ingrese el plazo en meses (entero): ")                #FUNCION
         plazo_meses = cls.verificando_entero(plazo_meses)
         porcentaje_avance = input("Ingrese el porcentaje de avance de la obra: ")  #FUNCION
         porcentaje_avance = cls.verificando_flotante(porcentaje_avance)
-        imagen_1 = "N/a"
-        imagen_2 = "N/a"
-        imagen_3 = "N/a"
-        imagen_4 = "N/a"
+        imagen_1 = cls.valores_por_defecto['imagen_1']
+        imagen_2 = cls.valores_por_defecto['imagen_2']
+        imagen_3 = cls.valores_por_defecto['imagen_3']
+        imagen_4 = cls.valores_por_defecto['imagen_4']
         # Validación de LicitacionEmpresa                                               #FUNCION
         while True:
             empresa_nombre = input("Ingrese la empresa de la licitación: ").capitalize()
             empresa_nombre = cls.verificando_texto(empresa_nombre)
-            empresa, created = LicitacionEmpresa.get_or_create(nombre=empresa_nombre)
-            if created:
-                print(f"Empresa '{empresa_nombre}' creada.")
+            empresa = Obra.resolver_lookup(LicitacionEmpresa, empresa_nombre)
             break
         licitacion_anio = input("Ingrese el año de licitacion(ejemplo: 2024): ")
         licitacion_anio = cls.verificando_entero(licitacion_anio)
@@ -328,9 +1409,7 @@ class GestionarObra(ABC):
         while True:
             contratacion_tipo_nombre = input("Ingrese el tipo de contratación: ").capitalize()
             contratacion_tipo_nombre = cls.verificando_texto(contratacion_tipo_nombre)
-            contratacion_tipo, created = ContratacionTipo.get_or_create(nombre=contratacion_tipo_nombre)
-            if created:
-                print(f"Tipo de contratación '{contratacion_tipo_nombre}' creado.")
+            contratacion_tipo = Obra.resolver_lookup(ContratacionTipo, contratacion_tipo_nombre)
             break
         nro_contratacion = input("Ingrese el número de contratación: ").capitalize()
         nro_contratacion = cls.verificando_texto(nro_contratacion)
@@ -346,11 +1425,11 @@ class GestionarObra(ABC):
         destacada = cls.verificando_texto(destacada)
         ba_elige = input("Es una obra de BA Elige? (si/no): ").lower()
         ba_elige = cls.verificando_texto(ba_elige)
-        link_interno = "link no disponible"
-        pliego_descarga = "link de pliego no disponible"
+        link_interno = cls.valores_por_defecto['link_interno']
+        pliego_descarga = cls.valores_por_defecto['pliego_descarga']
         expediente_numero = input("Ingrese el número del expediente: ").capitalize()        #FUNCION
         expediente_numero = cls.verificando_texto(expediente_numero)
-        estudio_ambiental_descarga = "link de estudio ambiental no disponible"
+        estudio_ambiental_descarga = cls.valores_por_defecto['estudio_ambiental_descarga']
         financiamiento = input("Ingrese la empresa que financia: ").capitalize()            #FUNCION
         financiamiento = cls.verificando_texto(financiamiento)
 
@@ -358,9 +1437,9 @@ class GestionarObra(ABC):
         nueva_obra = Obra.create(
             entorno=entorno,
             nombre=nombre,
-            etapa=etapa,
-            tipo=tipo,
-            area_responsable=area_responsable,
+            etapa=Obra.resolver_lookup(Etapa, etapa),
+            tipo=Obra.resolver_lookup(Tipo, tipo),
+            area_responsable=Obra.resolver_lookup(AreaResponsable, area_responsable),
             descripcion=descripcion,
             monto_contrato=monto_contrato,
             comuna=comuna,
@@ -390,156 +1469,471 @@ class GestionarObra(ABC):
             pliego_descarga=pliego_descarga,
             expediente_numero=expediente_numero,
             estudio_ambiental_descarga=estudio_ambiental_descarga,
-            financiamiento=financiamiento
+            financiamiento=Obra.resolver_lookup(Financiamiento, financiamiento)
         )
-        nueva_obra.save()
         return nueva_obra
 
     @classmethod
     @abstractmethod
-    def obtener_indicadores(cls):
-        # Me aseguro que la conexión a la bbdd está abierta
-        cls.conectar_db()
+    def leer_obras_nuevas(cls, archivo):
+        # .json (lista de objetos), .jsonl (un objeto por linea) o .csv separado por ";" como el dataset
+        if archivo.endswith('.jsonl'):
+            df = pd.read_json(archivo, lines=True, dtype=False)
+        elif archivo.endswith('.json'):
+            df = pd.read_json(archivo, dtype=False)
+        else:
+            df = pd.read_csv(archivo, sep=';', dtype=str, keep_default_na=False, na_values=[''])
+        df.columns = [columna.replace('-', '_') for columna in df.columns]
+        # Todo como texto (o NaN) para validar igual que lo que llega por input()
+        return df.apply(lambda columna: columna.map(lambda valor: valor if pd.isna(valor) else str(valor)))
+
+    @classmethod
+    @abstractmethod
+    def validar_obras_nuevas(cls, df):
+        # Mismas reglas que verificando_texto, verificando_entero y verificando_flotante, aplicadas a columnas enteras.
+        # Devuelve (DataFrame con los valores convertidos, Serie con los errores de cada fila, '' si es valida)
+        errores = pd.Series('', index=df.index)
+        validados = pd.DataFrame(index=df.index)
+
+        def registrar(columna, validos, mensaje):
+            nonlocal errores
+            errores = errores.where(validos, errores + f"{columna}: {mensaje}; ")
+
+        for columna, regla in cls.reglas_obra_nueva.items():
+            if columna not in df.columns:
+                if columna in cls.valores_por_defecto:
+                    validados[columna] = cls.valores_por_defecto[columna]
+                    continue
+                registrar(columna, pd.Series(False, index=df.index), "falta la columna")
+                # Todas las filas quedan rechazadas; la columna vacia evita casos especiales mas abajo
+                validados[columna] = float('nan')
+                continue
+            # Como texto de pandas: una columna vacia en todos los registros llega como NaN de tipo float o object y
+            # no admite .str
+            valores = df[columna].astype('string')
+            if columna in cls.valores_por_defecto:
+                valores = valores.fillna(cls.valores_por_defecto[columna])
+            if regla == 'texto':
+                # verificando_texto: no vacio y capitalize
+                validos = valores.notna() & valores.fillna('').str.strip().ne('')
+                registrar(columna, validos, "El texto no puede estar vacio")
+                validados[columna] = valores.str.capitalize().astype(object)
+            elif regla == 'entero':
+                # verificando_entero: lo que acepta int()
+                enteros = cls.parsear_enteros(valores)
+                registrar(columna, enteros.notna(), "El valor ingresado no es un numero.")
+                validados[columna] = enteros
+            elif regla == 'fecha':
+                # verificando_fecha: alguno de formatos_fecha, se guarda en ISO
+                fechas = cls.parsear_fechas(valores)
+                registrar(columna, fechas.notna(), "La fecha ingresada no es valida.")
+                validados[columna] = fechas.dt.strftime('%Y-%m-%d')
+            else:
+                # verificando_flotante; las coordenadas aceptan coma decimal como en nueva_obra
+                if columna in ('lat', 'lng'):
+                    valores = valores.str.replace(',', '.')
+                numeros = pd.to_numeric(valores.str.strip(), errors='coerce').astype('float64')
+                registrar(columna, numeros.notna(), "El valor ingresado no es un numero.")
+                validados[columna] = numeros
+        # La celda espacial sale de lat y lng en filas_obra; coordenadas fuera de rango se rechazan
+        fuera_de_rango = (validados['lat'].abs() > 90) | (validados['lng'].abs() > 180)
+        registrar('lat/lng', ~fuera_de_rango, "coordenadas fuera de rango")
+        return validados, errores
+
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def importar_obras(cls, archivo, reporte=None, tamanio_lote=None):
+        # Alta masiva sin input(): valida todos los registros, resuelve las lookups de una vez e inserta las obras
+        # validas en una unica transaccion; las invalidas van a un csv de reporte con el motivo en vez de frenar la carga
+        inicio = time.perf_counter()
         try:
-            # a) Listado de todas las areas responsables
-            query = AreaResponsable.select(AreaResponsable.nombre).distinct().order_by(AreaResponsable.nombre)
-            resultado_a = query.execute()
-            print("Muestro las areas responsables: ")
-            for area in resultado_a:
-                print(f"* Nombre: {area.nombre}")
-
-            # b) Listado de todos los tipos de Obra
-            query = Tipo.select(Tipo.nombre).distinct().order_by(Tipo.nombre)
-            resultado_b = query.execute()
-            print("\nMuestro los Tipos de Obra: ")
-            for tipo in resultado_b:
-                print(f"* Nombre: {tipo.nombre}")
-
-            # c) Cantidad de obras que se encuentran en cada etapa
-            query = (Etapa.select(Etapa.nombre, fn.Count(Obra.id).alias('cantidad_obras'))
-                     .join(Obra, on=(Obra.etapa == Etapa.id))
-                     .group_by(Etapa.id))
-
-            resultado_c = [(etapa.nombre, etapa.cantidad_obras) for etapa in query]
-
-            print("\nMuestro la cantidad de obras por etapa: ")
-            for etapa, cantidad in resultado_c:
-                print(f'Etapa: {etapa} | Cantidad de obras: {cantidad}')
-
-            # d) Cantidad de obras y monto total de inversion por tipo de Obra
-            query_tipo_obra = (Tipo
-                   .select(Tipo.nombre,
-                           fn.Count(Obra.id).alias('cantidad_obras'),
-                           fn.Sum(Obra.monto_contrato).alias('monto_total_inversion'))
-                   .join(Obra, on=(Obra.tipo == Tipo.id))
-                   .group_by(Tipo.id))
-
-            resultado_d = [(tipo.nombre, tipo.cantidad_obras, tipo.monto_total_inversion) for tipo in query_tipo_obra]
-
-            print("\nMuestro la cantidad de obras y monto total de inversion por tipo de obra: ")
-            for tipo in resultado_d:
-                print(f"Tipo de Obra: {tipo[0]}")
-                print(f"Cantidad de Obras: {tipo[1]}")
-                print(f"Monto Total de Inversión: ${tipo[2]}")
-                print("----------------------")
-
-            # e) Listado de todos los barrios pertencientes a las comunas 1, 2, 3
-            comunas_seleccionadas = [1, 2, 3]
-            query = (Barrio
-                     .select(Barrio.nombre, Comuna.nombre)
-                     .join(Obra)
-                     .join(Comuna, on=(Obra.comuna == Comuna.id))
-                     .where(Comuna.nombre.in_(comunas_seleccionadas))
-                    .distinct())
-            # print(query)
-        
-            resultado_e = [(barrio.nombre) for barrio in query]
-            print("\nListado de barrios sin repetir en comunas 1, 2, 3:")
-            for barrio_nombre in resultado_e:
-                print(f"Barrio: {barrio_nombre}")
-
-            # f) Cantidad de Obras finalizadas y su monto de inversion en la comunan 1
-            etapa_finalizada = "Finalizada"
+            df = cls.leer_obras_nuevas(archivo)
+        except (FileNotFoundError, ValueError) as e:
+            print("Error al leer el archivo de obras nuevas.", e)
+            return False
+        validados, errores = cls.validar_obras_nuevas(df)
+        validas = errores.eq('')
 
-            query = (Obra
-                    .select(fn.COUNT(Obra.id).alias('cantidad_obras'), fn.SUM(Obra.monto_contrato).alias('monto_inversion'))
-                    .join(Comuna, on=(Obra.comuna == Comuna.id))
-                    .join(Etapa, on=(Obra.etapa == Etapa.id))
-                    .where((Comuna.nombre == "1") & (Etapa.nombre == etapa_finalizada))
-                    .group_by(Comuna.id))
-            # print(query)
-
-            resultado_f = query.dicts().get()
-            print("\nCantidad de Obras finalizadas y su monto de inversion en la comunan 1")
-            print(f"* Cantidad de obras finalizadas en la comuna 1: {resultado_f['cantidad_obras']}")
-            print(f"* Monto total de inversión en la comuna 1: {resultado_f['monto_inversion']}")
-
-            # g) Cantidad de obras finalizadas en un plazo menor a 24 meses
-            etapa_finalizada = "Finalizada"
-
-            # Consulta en Peewee ORM
-            query = (Obra
-                    .select(fn.COUNT(Obra.id).alias('cantidad_obras'))
-                    .join(Etapa, on=(Obra.etapa == Etapa.id))
-                    .where((Etapa.nombre == etapa_finalizada) & (Obra.plazo_meses < 24)
-                    ))
-            # print(query)
+        rechazadas = df[~validas].copy()
+        rechazadas.insert(0, 'errores', errores[~validas].str.rstrip('; '))
+        # Numero de registro dentro del archivo (1 = primer registro)
+        rechazadas.insert(0, 'registro', rechazadas.index + 1)
+        if reporte is None:
+            reporte = os.path.splitext(archivo)[0] + "_rechazadas.csv"
+        if len(rechazadas):
+            rechazadas.to_csv(reporte, index=False, sep=';')
+
+        # Sin nulos en las filas validas, los enteros vuelven a int64 comun
+        nuevas = validados[validas].astype({columna: 'int64' for columna, regla in cls.reglas_obra_nueva.items()
+                                            if regla == 'entero'})
+        ids = []
+        if len(nuevas):
+            abierta = not sqlite_db.is_closed()
+            if not abierta:
+                cls.conectar_db()
+            try:
+                # BEGIN IMMEDIATE toma el lock de escritura antes de leer el mayor id: otro escritor (el escritor unico,
+                # la CLI u otro proceso) no puede dar de alta obras con los mismos ids hasta el COMMIT
+                with sqlite_db.atomic('IMMEDIATE'):
+                    mapas = cls.resolver_lookups(nuevas)
+                    # Ids a continuacion del mayor (lo mismo que haria SQLite), los necesita obras_detalles
+                    siguiente = (Obra.select(fn.MAX(Obra.id)).scalar() or 0) + 1
+                    nuevas.insert(0, 'id', range(siguiente, siguiente + len(nuevas)))
+                    for lote in chunked(cls.filas_obra(nuevas, mapas), tamanio_lote or cls.tamanio_lote):
+                        obras, detalles = cls.separar_detalle(lote)
+                        # Cada lote en su savepoint: si uno falla se informa y los demas se importan igual
+                        try:
+                            with sqlite_db.atomic():
+                                Obra.insert_many(obras).execute()
+                                ObraDetalle.insert_many(detalles).execute()
+                        except IntegrityError as e:
+                            print(f"Error al insertar un lote de {len(obras)} obras nuevas.", e)
+                            continue
+                        ids.extend(obra['id'] for obra in obras)
+            finally:
+                if not abierta:
+                    cls.cerrar_db()
 
-            resultado_g = query.dicts().get()
+        duracion = time.perf_counter() - inicio
+        print(f"Importacion: {len(ids)} obras nuevas, {len(rechazadas)} rechazadas"
+              f"{f' (detalle en {reporte})' if len(rechazadas) else ''} en {duracion:.2f}s")
+        return {'importadas': len(ids), 'ids': ids, 'rechazadas': len(rechazadas),
+                'reporte': reporte if len(rechazadas) else None}
 
-            print(f"\n* Cantidad de obras finalizadas en un plazo menor a 24 meses: {resultado_g['cantidad_obras']}")
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def consultas_indicadores(cls):
+        # Consulta de cada indicador del registro (indicadores.py) recorriendo obras, para analizarlas (ver verificar_indices)
+        return {actual.nombre: actual.consulta(False) for actual in indicadores.seleccionar()}
 
-            # h) Porcentaje total de obras finalizadas
-            total_obras = Obra.select().count()
-            obras_finalizadas = Obra.select().where(Obra.porcentaje_avance == 100).count()
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def consultas_resumen(cls):
+        # Mismos indicadores que consultas_indicadores pero leyendo las tablas resumen (una fila por grupo)
+        return {actual.nombre: actual.consulta(True) for actual in indicadores.seleccionar()}
 
-            porcentaje_finalizadas = (obras_finalizadas / total_obras) * 100 if total_obras > 0 else 0
+    @classmethod
+    @abstractmethod
+    def verificar_indices(cls):
+        # Corre EXPLAIN QUERY PLAN sobre cada indicador y devuelve los que recorren la tabla obras completa
+        cls.conectar_db()
+        recorridos_completos = {}
+        try:
+            for nombre, query in cls.consultas_indicadores().items():
+                sql, params = query.sql()
+                # peewee usa alias (t1, t2, ...), los paso a nombres de tabla para leer el plan
+                alias = {a: tabla for tabla, a in re.findall(r'"(\w+)" AS "(\w+)"', sql)}
+                plan = [fila[-1] for fila in sqlite_db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)]
+                for detalle in plan:
+                    partes = detalle.split()
+                    if partes[0] == 'SCAN' and 'INDEX' not in detalle and alias.get(partes[1], partes[1]) == Obra._meta.table_name:
+                        recorridos_completos[nombre] = plan
+                print(f"{'FULL SCAN' if nombre in recorridos_completos else 'indice'} | {nombre}: {' / '.join(plan)}")
+        finally:
+            cls.cerrar_db()
+        return recorridos_completos
 
-            print(f"\n* Porcentaje total de obras finalizadas: {porcentaje_finalizadas:.2f}%")
+    @classmethod
+    @abstractmethod
+    def version_datos(cls):
+        # Version actual de los datos, cambia con cada escritura en obras o en las tablas lookup
+        return VersionDatos.select(VersionDatos.version).where(VersionDatos.id == 1).scalar() or 0
 
-            # i) Cantidad total de mano de obra empleada
-            total_mano_obra = (Obra
-                   .select(fn.SUM(Obra.mano_obra).alias('total_mano_obra'))
-                   .where(Obra.mano_obra > 0)
-                   .scalar())
+    @classmethod
+    @abstractmethod
+    def escritor_obras(cls, tamanio_grupo=None):
+        # Escritor unico (escritura.py) para altas y modificaciones desde varios hilos: cada productor recibe un
+        # Future y un solo hilo escribe en transacciones agrupadas. Se usa con with (al salir espera lo encolado)
+        return escritura.EscritorObras(tamanio_grupo or escritura.TAMANIO_GRUPO)
 
-            print(f"\n* Cantidad total de mano de obra empleada: {total_mano_obra}")
+    @classmethod
+    @abstractmethod
+    @medir_etapa()
+    def analitica(cls):
+        # Motor analitico en memoria (analitica.py) al dia con la base: la primera vez lee obras completa y despues
+        # solo relee las obras que cambiaron desde la ultima llamada
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            if cls.motor_analitico is None:
+                # NumPy se importa recien aca, con el primer uso del motor
+                from analitica import AnaliticaObras
+                cls.motor_analitico = AnaliticaObras()
+            cls.motor_analitico.refrescar()
+        finally:
+            if not abierta:
+                cls.cerrar_db()
+        return cls.motor_analitico
 
-            # j) Monto total de inversion
-            total_inversion = (Obra
-                   .select(fn.SUM(Obra.monto_contrato).alias('total_inversion'))
-                   .where(Obra.monto_contrato > 0)
-                   .scalar())
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='resultado')
+    def calcular_indicadores(cls, nombres=None, usar_resumen=True, hilos=None):
+        # Devuelve {indicador: resultado}; cada resultado se reutiliza mientras no cambie la version de los datos. Los
+        # que faltan se calculan a la vez en `hilos` conexiones de solo lectura (ver indicadores.calcular)
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            version = cls.version_datos()
+            resultados = {}
+            faltantes = []
+            for actual in indicadores.seleccionar(nombres):
+                guardado = cls.cache_indicadores.get((actual.nombre, usar_resumen))
+                if guardado is not None and guardado[0] == version:
+                    cls.estadisticas_cache['aciertos'] += 1
+                    resultados[actual.nombre] = guardado[1]
+                else:
+                    cls.estadisticas_cache['fallos'] += 1
+                    resultados[actual.nombre] = None
+                    faltantes.append(actual.nombre)
+            if faltantes:
+                # Por defecto leo las tablas resumen, con usar_resumen=False se recorre obras
+                calculados = indicadores.calcular(faltantes, usar_resumen, hilos or indicadores.HILOS)
+                for nombre, resultado in calculados.items():
+                    resultados[nombre] = resultado
+                    cls.cache_indicadores[(nombre, usar_resumen)] = (version, resultado)
+        finally:
+            if not abierta:
+                cls.cerrar_db()
+        return resultados
 
-            print(f"\n* Monto total de inversión en obras: {total_inversion:.2f}")
+    @classmethod
+    @abstractmethod
+    def serie_temporal(cls, periodo='mes', evento='inicio', comuna=None, tipo=None, desde=None, hasta=None):
+        # Serie de obras iniciadas (evento='inicio') o que vencen (evento='vencimiento') por mes o por anio, leida de
+        # las tablas resumen sin recorrer obras. comuna y tipo filtran por nombre; desde y hasta son (anio, mes) o anio
+        # inclusivos. Devuelve una lista de diccionarios ordenada por periodo
+        modelo = ResumenMensual if periodo == 'mes' else ResumenAnual
+        if periodo not in ('mes', 'anio') or evento not in EVENTOS_FECHA:
+            raise ValueError(f"Serie desconocida: periodo={periodo}, evento={evento}")
+        claves = [modelo.anio, modelo.mes] if modelo is ResumenMensual else [modelo.anio]
+        consulta = (modelo
+                    .select(*claves, fn.SUM(modelo.cantidad_obras).alias('cantidad_obras'),
+                            fn.SUM(modelo.monto_total).alias('monto_total'),
+                            fn.SUM(modelo.total_mano_obra).alias('total_mano_obra'))
+                    .where((modelo.evento == evento) & (modelo.anio > 0))
+                    .group_by(*claves)
+                    .order_by(*claves))
+        if comuna is not None:
+            consulta = consulta.where(modelo.comuna.in_(Comuna.select(Comuna.id).where(Comuna.nombre == comuna)))
+        if tipo is not None:
+            consulta = consulta.where(modelo.tipo.in_(Tipo.select(Tipo.id).where(coincide_lookup(Tipo, [tipo]))))
+        # Los limites se comparan como tupla (anio, mes) para que cruzar de anio funcione
+        for limite, operador in ((desde, operator.ge), (hasta, operator.le)):
+            if limite is None:
+                continue
+            if isinstance(limite, int):
+                consulta = consulta.where(operador(modelo.anio, limite))
+            elif modelo is ResumenMensual:
+                consulta = consulta.where(operador(modelo.anio * 100 + modelo.mes, limite[0] * 100 + limite[1]))
+            else:
+                consulta = consulta.where(operador(modelo.anio, limite[0]))
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            return list(consulta.dicts())
+        finally:
+            if not abierta:
+                cls.cerrar_db()
 
-                
+    @classmethod
+    @abstractmethod
+    @medir_etapa(filas='resultado')
+    def exportar_obras(cls, ruta, etapa=None, comuna=None, desde=None, hasta=None, campo_fecha='fecha_inicio',
+                       formato=None, tamanio_bloque=exportacion.TAMANIO_BLOQUE):
+        # Exporta obras con los nombres de las lookups a csv, jsonl o parquet (segun la extension o formato) sin
+        # cargarlas en memoria (ver exportacion.py). Devuelve la cantidad exportada o None si no se pudo
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            inicio = time.perf_counter()
+            exportadas = exportacion.exportar_obras(ruta, formato, tamanio_bloque, etapa=etapa, comuna=comuna,
+                                                    desde=desde, hasta=hasta, campo_fecha=campo_fecha)
+            print(f"Exportacion: {exportadas} obras en {ruta} ({time.perf_counter() - inicio:.2f}s)")
+            return exportadas
+        except (ValueError, ImportError, OSError) as e:
+            print("Error al exportar las obras.", e)
+            return None
+        finally:
+            if not abierta:
+                cls.cerrar_db()
+
+    @classmethod
+    @abstractmethod
+    def listar_obras(cls, columnas=None, orden='id', descendente=False, cursor=None, limite=listado.LIMITE_POR_DEFECTO,
+                     formato='dict', etapa=None, tipo=None, comuna=None, barrio=None):
+        # Una pagina del listado por keyset (ver listado.py): {'obras': [...], 'siguiente': cursor o None}; la pagina
+        # siguiente se pide con cursor=pagina['siguiente'] y los mismos filtros y orden
+        abierta = not sqlite_db.is_closed()
+        if not abierta:
+            cls.conectar_db()
+        try:
+            return listado.pagina_obras(columnas, orden, descendente, cursor, limite, formato, etapa=etapa, tipo=tipo,
+                                        comuna=comuna, barrio=barrio)
+        finally:
+            if not abierta:
+                cls.cerrar_db()
+
+    @classmethod
+    @abstractmethod
+    def servir_listado(cls, host='127.0.0.1', puerto=8000):
+        # Publica listar_obras en http://host:puerto/obras (solo lectura) hasta Ctrl+C
+        cls.conectar_db()
+        try:
+            listado.servir(host, puerto)
+        finally:
+            cls.cerrar_db()
+        return True
+
+    @classmethod
+    @abstractmethod
+    def exportar_indicadores(cls, ruta, nombres=None, usar_resumen=True, formato=None):
+        # Indicadores de calcular_indicadores a json, jsonl o csv
+        try:
+            cantidad = exportacion.exportar_indicadores(cls.calcular_indicadores(nombres, usar_resumen), ruta, formato)
+            print(f"Exportacion: {cantidad} indicadores en {ruta}")
+            return cantidad
+        except (ValueError, OSError) as e:
+            print("Error al exportar los indicadores.", e)
+            return None
+
+    @classmethod
+    @abstractmethod
+    def obtener_indicadores(cls, usar_resumen=True):
+        try:
+            # Primero se calculan todos y despues se imprime el reporte completo
+            print(indicadores.reporte(cls.calcular_indicadores(usar_resumen=usar_resumen)))
         except OperationalError as e:
             print("Error al obtener datos:", e)
         except AttributeError as e:
             print(f"Error de atributo: {e}")
-        finally:
-            if not sqlite_db.is_closed():
-                sqlite_db.close()
 
+def limpiar_archivo(clase, archivo):
+    # Corre en un proceso del pool de ingerir_archivos: extrae y limpia un csv (usando su cache) sin tocar la base.
+    # Subclase descartable para no cambiar archivo_csv de la clase original; el csv limpio lo escribe el proceso
+    # que carga, asi los procesos no se pisan el archivo
+    clase_archivo = type(clase.__name__, (clase,), {'archivo_csv': archivo, 'archivo_limpio': os.devnull})
+    return archivo, clase_archivo.obtener_datos_limpios()
+
+
+def mostrar_busqueda(resultados):
+    if not resultados:
+        print("No se encontraron obras")
+    for obra in resultados:
+        print(f"[{obra['id']}] {obra['nombre']} | {obra['direccion']} | Etapa: {obra['etapa']} | Comuna: {obra['comuna']}")
+
+
+def argumentos_cli():
+    parser = argparse.ArgumentParser(prog='gestionar_obras.py',
+                                     description="Sistema de gestion de obras urbanas. Cada comando abre la base, "
+                                                 "la migra si hace falta y hace solo su tarea.")
+    parser.add_argument('--perfil', action='store_true',
+                        help="muestra al final el tiempo por etapa y las consultas mas lentas")
+    parser.add_argument('--tiempo', action='store_true', help="muestra cuanto tardo el comando desde el arranque")
+    comandos = parser.add_subparsers(dest='comando', metavar='comando')
+
+    cargar = comandos.add_parser('cargar', aliases=['load'], help="extrae, limpia y carga el csv (si cambio)")
+    cargar.add_argument('--forzar', action='store_true', help="carga aunque el csv no haya cambiado")
+    cargar.add_argument('--archivo', help="csv a cargar (por defecto el del observatorio)")
+
+    sincronizar = comandos.add_parser('sincronizar', aliases=['sync'],
+                                      help="sincroniza por bloques o varios csv (directorio o patron glob)")
+    sincronizar.add_argument('origen', nargs='?', help="directorio o patron de csv; sin origen procesa el csv por bloques")
+    sincronizar.add_argument('--procesos', type=int, help="procesos para limpiar los csv en paralelo")
+    sincronizar.add_argument('--bloque', type=int, default=10000, help="filas por bloque (sin origen)")
+
+    indicadores = comandos.add_parser('indicadores', aliases=['indicators'], help="muestra los indicadores")
+    indicadores.add_argument('--sin-resumen', action='store_true', help="calcula recorriendo obras en vez de los resumenes")
+    indicadores.add_argument('--exportar', metavar='RUTA', help="ademas los exporta a .json, .jsonl o .csv")
 
-def menu():
-    print("Bienvenido al Sistema de Gestion de obra")
-    print("1) Empezar un nuevo proyecto")
-    print("2)")
+    comandos.add_parser('nueva', aliases=['new'], help="da de alta una obra ingresando sus datos")
+
+    importar = comandos.add_parser('importar', aliases=['import'], help="alta masiva desde un .json, .jsonl o .csv")
+    importar.add_argument('archivo')
+
+    buscar = comandos.add_parser('buscar', aliases=['search'], help="busqueda de texto en nombre, descripcion y direccion")
+    buscar.add_argument('texto', nargs='+')
+    buscar.add_argument('--etapa')
+    buscar.add_argument('--comuna', type=int)
+    buscar.add_argument('--limite', type=int, default=20)
+
+    exportar = comandos.add_parser('exportar', aliases=['export'], help="exporta obras a .csv, .jsonl o .parquet")
+    exportar.add_argument('ruta')
+    exportar.add_argument('--etapa', action='append', help="se puede repetir")
+    exportar.add_argument('--comuna', type=int, action='append', help="se puede repetir")
+    exportar.add_argument('--desde', help="fecha ISO (yyyy-mm-dd) inclusiva")
+    exportar.add_argument('--hasta', help="fecha ISO (yyyy-mm-dd) inclusiva")
+    exportar.add_argument('--campo-fecha', choices=['fecha_inicio', 'fecha_fin_inicial'], default='fecha_inicio')
+
+    servir = comandos.add_parser('servir', aliases=['serve'], help="publica el listado paginado de obras por HTTP "
+                                                                   "(solo lectura) en /obras")
+    servir.add_argument('--host', default='127.0.0.1')
+    servir.add_argument('--puerto', type=int, default=8000)
+    return parser
+
+
+def ejecutar_comando(clase, args):
+    comando = {'load': 'cargar', 'sync': 'sincronizar', 'indicators': 'indicadores', 'new': 'nueva',
+               'import': 'importar', 'search': 'buscar', 'export': 'exportar',
+               'serve': 'servir'}.get(args.comando, args.comando)
+    if comando == 'cargar':
+        if args.archivo:
+            clase.archivo_csv = args.archivo
+        return clase.cargar_csv(args.forzar) is not False
+    if comando == 'sincronizar':
+        if args.origen:
+            return clase.ingerir_archivos(args.origen, args.procesos) is not False
+        return clase.procesar_en_bloques(args.bloque) is not False
+    if comando == 'indicadores':
+        clase.obtener_indicadores(usar_resumen=not args.sin_resumen)
+        if args.exportar:
+            return clase.exportar_indicadores(args.exportar, usar_resumen=not args.sin_resumen) is not None
+        return True
+    if comando == 'nueva':
+        return clase.nueva_obra() is not None
+    if comando == 'importar':
+        return clase.importar_obras(args.archivo) is not False
+    if comando == 'buscar':
+        mostrar_busqueda(clase.buscar_obras(' '.join(args.texto), args.etapa, args.comuna, args.limite))
+        return True
+    if comando == 'exportar':
+        return clase.exportar_obras(args.ruta, etapa=args.etapa, comuna=args.comuna, desde=args.desde,
+                                    hasta=args.hasta, campo_fecha=args.campo_fecha) is not None
+    if comando == 'servir':
+        return clase.servir_listado(args.host, args.puerto)
+
+
+def main(clase, argumentos=None):
+    # python gestionar_obras.py <comando> [opciones]; python gestionar_obras.py -h lista los comandos
+    parser = argumentos_cli()
+    args = parser.parse_args(argumentos)
+    if args.comando is None:
+        parser.print_help()
+        return 0
+    with clase.perfilar() if args.perfil else nullcontext() as perfil:
+        clase.conectar_db()
+        clase.mapear_orm()
+        try:
+            correcto = ejecutar_comando(clase, args)
+        finally:
+            clase.cerrar_db(forzar=True)
+    if perfil:
+        perfil.mostrar()
+    if args.tiempo:
+        # Desde que se empezo a importar este modulo (incluye las importaciones y la apertura de la base)
+        print(f"Tiempo total: {time.perf_counter() - INICIO_PROCESO:.3f}s")
+    return 0 if correcto else 1
 
 
 if __name__ == "__main__":
-    print("estoy iniciando el programa")
     class Implementacion(GestionarObra):
         pass
 
-    data_set = Implementacion.extraer_datos()
-    Implementacion.conectar_db()
-    Implementacion.mapear_orm()
-    data_set = Implementacion.limpiar_datos(data_set)
-    Implementacion.cargar_datos(data_set)
-    Implementacion.obtener_indicadores()
-    # Implementacion.nueva_obra()
-    proyecto_nuevo = GestionarObra.nueva_obra()
-    proyecto_nuevo.nuevo_proyecto(proyecto_nuevo)
+    sys.exit(main(Implementacion))
@@ -0,0 +1,330 @@
+# Registro de indicadores. Cada indicador es una consulta independiente con nombre que devuelve datos (tuplas,
+# numeros o diccionarios), sin imprimir nada: consulta(resumen) arma el SELECT, sobre las tablas resumen o recorriendo
+# obras, extraer lo lee y mostrar lo convierte en texto para el reporte. calcular() los corre en un pool de hilos con
+# una conexion de solo lectura (PRAGMA query_only) por hilo: en WAL los lectores no se bloquean entre si ni con el
+# escritor, y sqlite3 suelta el GIL mientras SQLite ejecuta, asi el total se acerca al del indicador mas lento en lugar
+# de la suma. Un indicador nuevo se agrega con el decorador, en este modulo o en cualquier otro que se importe:
+#
+#   @indicador(extraer=filas, mostrar=lambda obras: "\n".join(f"{b}: {c}" for b, c in obras))
+#   def obras_por_barrio(resumen):
+#       return Barrio.select(Barrio.nombre, fn.COUNT(Obra.id)).join(Obra).group_by(Barrio.id)
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from peewee import fn
+from modelo_orm import (sqlite_db, Obra, Etapa, Tipo, AreaResponsable, Comuna, Barrio, ResumenEtapa, ResumenTipo,
+                        ResumenComuna, ResumenPlazo, ResumenGeneral)
+
+# nombre -> Indicador, en el orden en que se registraron (es el orden del reporte)
+INDICADORES = {}
+# Hilos del pool (cada uno con su conexion); con 1 se calculan en orden en la conexion del llamador. Mas hilos que
+# nucleos no adelanta nada: las consultas leen paginas ya en memoria y usan CPU todo el tiempo
+HILOS = min(4, os.cpu_count() or 1)
+# Pool de hilos de lectura, se crea con el primer calculo en paralelo (ver obtener_pool)
+pool = None
+hilos_pool = 0
+bloqueo_pool = threading.Lock()
+ETAPA_FINALIZADA = "Finalizada"
+COMUNAS_SELECCIONADAS = [1, 2, 3]
+
+
+class Indicador:
+    __slots__ = ('nombre', 'consulta', 'extraer', 'mostrar', 'en_memoria')
+
+    def __init__(self, nombre, consulta, extraer, mostrar):
+        self.nombre = nombre
+        self.consulta = consulta
+        self.extraer = extraer
+        self.mostrar = mostrar
+        # Version opcional sobre los arreglos del motor analitico, funcion(motor) (ver en_memoria y analitica.py)
+        self.en_memoria = None
+
+    def calcular(self, resumen=True):
+        return self.extraer(self.consulta(resumen))
+
+
+def indicador(extraer, mostrar, nombre=None):
+    # Decorador: registra consulta(resumen) con el nombre de la funcion. resumen=True lee las tablas resumen (una
+    # fila por grupo); si el indicador no tiene resumen puede ignorarlo y recorrer obras siempre
+    def registrar(consulta):
+        clave = nombre or consulta.__name__
+        if clave in INDICADORES:
+            raise ValueError(f"Ya hay un indicador registrado como {clave}")
+        INDICADORES[clave] = Indicador(clave, consulta, extraer, mostrar)
+        return consulta
+    return registrar
+
+
+def en_memoria(nombre):
+    # Decorador: agrega al indicador ya registrado su calculo sobre AnaliticaObras, funcion(motor) con el mismo
+    # resultado que la consulta recorriendo obras. Los indicadores sin esta version se calculan con su consulta
+    def agregar(funcion):
+        if nombre not in INDICADORES:
+            raise ValueError(f"No hay un indicador registrado como {nombre}")
+        INDICADORES[nombre].en_memoria = funcion
+        return funcion
+    return agregar
+
+
+# Extractores comunes; devuelven tuplas para que no se modifique lo que guarda el cache de indicadores
+def filas(consulta):
+    return tuple(consulta.tuples())
+
+
+def primera_columna(consulta):
+    return tuple(fila[0] for fila in consulta.tuples())
+
+
+def escalar(consulta):
+    return consulta.scalar()
+
+
+def cantidad(consulta):
+    return consulta.scalar() or 0
+
+
+def lineas(encabezado, formato):
+    # mostrar para listas: el encabezado y una linea por elemento
+    return lambda valores: "\n".join([encabezado] + [formato(valor) for valor in valores])
+
+
+'''
+    INDICADORES
+'''
+
+# a) Listado de todas las areas responsables
+@indicador(extraer=primera_columna,
+           mostrar=lineas("Muestro las areas responsables: ", lambda area: f"* Nombre: {area}"))
+def areas_responsables(resumen):
+    return AreaResponsable.select(AreaResponsable.nombre).distinct().order_by(AreaResponsable.nombre)
+
+
+# b) Listado de todos los tipos de Obra
+@indicador(extraer=primera_columna,
+           mostrar=lineas("Muestro los Tipos de Obra: ", lambda tipo: f"* Nombre: {tipo}"))
+def tipos_obra(resumen):
+    return Tipo.select(Tipo.nombre).distinct().order_by(Tipo.nombre)
+
+
+# c) Cantidad de obras que se encuentran en cada etapa
+@indicador(extraer=filas,
+           mostrar=lineas("Muestro la cantidad de obras por etapa: ",
+                          lambda fila: f'Etapa: {fila[0]} | Cantidad de obras: {fila[1]}'))
+def obras_por_etapa(resumen):
+    if resumen:
+        return (Etapa.select(Etapa.nombre, ResumenEtapa.cantidad_obras.alias('cantidad_obras'))
+                .join(ResumenEtapa)
+                .order_by(Etapa.id))
+    return (Etapa.select(Etapa.nombre, fn.Count(Obra.id).alias('cantidad_obras'))
+            .join(Obra, on=(Obra.etapa == Etapa.id))
+            .group_by(Etapa.id))
+
+
+# d) Cantidad de obras y monto total de inversion por tipo de Obra
+@indicador(extraer=filas,
+           mostrar=lineas("Muestro la cantidad de obras y monto total de inversion por tipo de obra: ",
+                          lambda fila: f"Tipo de Obra: {fila[0]}\nCantidad de Obras: {fila[1]}\n"
+                                       f"Monto Total de Inversión: ${fila[2]}\n----------------------"))
+def obras_por_tipo(resumen):
+    if resumen:
+        return (Tipo.select(Tipo.nombre, ResumenTipo.cantidad_obras.alias('cantidad_obras'),
+                            ResumenTipo.monto_total.alias('monto_total_inversion'))
+                .join(ResumenTipo)
+                .order_by(Tipo.id))
+    return (Tipo
+            .select(Tipo.nombre,
+                    fn.Count(Obra.id).alias('cantidad_obras'),
+                    fn.Sum(Obra.monto_contrato).alias('monto_total_inversion'))
+            .join(Obra, on=(Obra.tipo == Tipo.id))
+            .group_by(Tipo.id))
+
+
+# e) Listado de todos los barrios pertencientes a las comunas 1, 2, 3 (en orden de id, como agrupa analitica.py)
+@indicador(extraer=primera_columna,
+           mostrar=lineas("Listado de barrios sin repetir en comunas 1, 2, 3:", lambda barrio: f"Barrio: {barrio}"))
+def barrios_comunas(resumen):
+    if resumen:
+        return (Barrio
+                .select(Barrio.nombre, Comuna.nombre)
+                .join(ResumenComuna)
+                .join(Comuna, on=(ResumenComuna.comuna == Comuna.id))
+                .where(Comuna.nombre.in_(COMUNAS_SELECCIONADAS))
+                .distinct()
+                .order_by(Barrio.id, Comuna.id))
+    return (Barrio
+            .select(Barrio.nombre, Comuna.nombre)
+            .join(Obra)
+            .join(Comuna, on=(Obra.comuna == Comuna.id))
+            .where(Comuna.nombre.in_(COMUNAS_SELECCIONADAS))
+            .distinct()
+            .order_by(Barrio.id, Comuna.id))
+
+
+# f) Cantidad de Obras finalizadas y su monto de inversion en la comunan 1
+@indicador(extraer=lambda consulta: consulta.dicts().first() or {'cantidad_obras': 0, 'monto_inversion': None},
+           mostrar=lambda resultado: "Cantidad de Obras finalizadas y su monto de inversion en la comunan 1\n"
+                                     f"* Cantidad de obras finalizadas en la comuna 1: {resultado['cantidad_obras']}\n"
+                                     f"* Monto total de inversión en la comuna 1: {resultado['monto_inversion']}")
+def finalizadas_comuna_1(resumen):
+    if resumen:
+        return (ResumenComuna
+                .select(fn.SUM(ResumenComuna.cantidad_obras).alias('cantidad_obras'),
+                        fn.SUM(ResumenComuna.monto_total).alias('monto_inversion'))
+                .join(Comuna, on=(ResumenComuna.comuna == Comuna.id))
+                .join(Etapa, on=(ResumenComuna.etapa == Etapa.id))
+                .where((Comuna.nombre == "1") & (Etapa.nombre == ETAPA_FINALIZADA))
+                .group_by(Comuna.id))
+    return (Obra
+            .select(fn.COUNT(Obra.id).alias('cantidad_obras'),
+                    fn.SUM(Obra.monto_contrato).alias('monto_inversion'))
+            .join(Comuna, on=(Obra.comuna == Comuna.id))
+            .join(Etapa, on=(Obra.etapa == Etapa.id))
+            .where((Comuna.nombre == "1") & (Etapa.nombre == ETAPA_FINALIZADA))
+            .group_by(Comuna.id))
+
+
+# g) Cantidad de obras finalizadas en un plazo menor a 24 meses
+@indicador(extraer=cantidad,
+           mostrar=lambda valor: f"* Cantidad de obras finalizadas en un plazo menor a 24 meses: {valor}")
+def finalizadas_menos_24_meses(resumen):
+    if resumen:
+        return (ResumenPlazo
+                .select(fn.COALESCE(fn.SUM(ResumenPlazo.cantidad_obras), 0).alias('cantidad_obras'))
+                .join(Etapa, on=(ResumenPlazo.etapa == Etapa.id))
+                .where((Etapa.nombre == ETAPA_FINALIZADA) & (ResumenPlazo.plazo_meses < 24)))
+    return (Obra
+            .select(fn.COUNT(Obra.id).alias('cantidad_obras'))
+            .join(Etapa, on=(Obra.etapa == Etapa.id))
+            .where((Etapa.nombre == ETAPA_FINALIZADA) & (Obra.plazo_meses < 24)))
+
+
+# h) Porcentaje total de obras finalizadas: total y finalizadas en una sola consulta, el cociente en Python
+def porcentaje(consulta):
+    total_obras, obras_finalizadas = consulta.tuples().first() or (0, 0)
+    return ((obras_finalizadas or 0) / total_obras) * 100 if total_obras else 0
+
+
+@indicador(extraer=porcentaje, mostrar=lambda valor: f"* Porcentaje total de obras finalizadas: {valor:.2f}%")
+def porcentaje_finalizadas(resumen):
+    if resumen:
+        return (ResumenGeneral.select(ResumenGeneral.cantidad_obras, ResumenGeneral.cantidad_finalizadas)
+                .where(ResumenGeneral.id == 1))
+    return Obra.select(fn.COUNT(Obra.id), fn.SUM(Obra.porcentaje_avance == 100))
+
+
+# i) Cantidad total de mano de obra empleada
+@indicador(extraer=escalar, mostrar=lambda valor: f"* Cantidad total de mano de obra empleada: {valor}")
+def total_mano_obra(resumen):
+    if resumen:
+        return ResumenGeneral.select(ResumenGeneral.total_mano_obra).where(ResumenGeneral.id == 1)
+    return Obra.select(fn.SUM(Obra.mano_obra).alias('total_mano_obra')).where(Obra.mano_obra > 0)
+
+
+# j) Monto total de inversion
+@indicador(extraer=escalar, mostrar=lambda valor: f"* Monto total de inversión en obras: {valor or 0:.2f}")
+def total_inversion(resumen):
+    if resumen:
+        return ResumenGeneral.select(ResumenGeneral.total_inversion).where(ResumenGeneral.id == 1)
+    return Obra.select(fn.SUM(Obra.monto_contrato).alias('total_inversion')).where(Obra.monto_contrato > 0)
+
+
+'''
+    FIN DE LOS INDICADORES
+'''
+
+
+def seleccionar(nombres=None):
+    desconocidos = [nombre for nombre in nombres or () if nombre not in INDICADORES]
+    if desconocidos:
+        raise ValueError(f"Indicadores desconocidos: {', '.join(desconocidos)} (opciones: {', '.join(INDICADORES)})")
+    return [INDICADORES[nombre] for nombre in nombres or INDICADORES]
+
+
+def en_paralelo_posible():
+    # Los hilos no ven lo que la transaccion del llamador todavia no confirmo, y una base en memoria es distinta
+    # para cada conexion: en esos casos se calcula en la conexion del llamador
+    return not sqlite_db.in_transaction() and sqlite_db.database not in ('', ':memory:') \
+        and 'mode=memory' not in sqlite_db.database
+
+
+def cerrar_conexion(barrera):
+    # La barrera retiene a cada tarea hasta que todas estan corriendo: una por hilo, asi se cierran todas las conexiones
+    barrera.wait()
+    sqlite_db.close()
+
+
+def terminar(ejecutor, hilos):
+    # Cada hilo cierra su conexion (sqlite3 no deja cerrarla desde otro hilo) y despues terminan
+    barrera = threading.Barrier(hilos)
+    for futuro in [ejecutor.submit(cerrar_conexion, barrera) for _ in range(hilos)]:
+        futuro.result()
+    ejecutor.shutdown(wait=True)
+
+
+def obtener_pool(hilos):
+    # El pool y las conexiones de sus hilos se reutilizan entre llamadas: abrir una conexion con PRAGMAS_SQLITE
+    # cuesta mas que la mayoria de los indicadores leyendo los resumenes
+    global pool, hilos_pool
+    with bloqueo_pool:
+        if pool is None or hilos > hilos_pool:
+            if pool is not None:
+                terminar(pool, hilos_pool)
+            pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='indicadores')
+            hilos_pool = hilos
+        return pool
+
+
+def cerrar_pool():
+    # Al cambiar de base (configurar_db)
+    global pool
+    with bloqueo_pool:
+        if pool is not None:
+            terminar(pool, hilos_pool)
+            pool = None
+
+
+def olvidar_pool():
+    # En un proceso hijo (fork) los hilos del pool del padre no existen
+    global pool
+    pool = None
+
+
+os.register_at_fork(after_in_child=olvidar_pool)
+
+
+def trabajar(pendientes, resumen, resultados):
+    # Un hilo del pool: abre su conexion de solo lectura la primera vez y toma indicadores de la cola hasta vaciarla
+    if sqlite_db.is_closed():
+        sqlite_db.connect()
+        sqlite_db.execute_sql("PRAGMA query_only = ON")
+    while True:
+        try:
+            actual = pendientes.get_nowait()
+        except queue.Empty:
+            return
+        resultados[actual.nombre] = actual.calcular(resumen)
+
+
+def calcular(nombres=None, resumen=True, hilos=HILOS):
+    # Devuelve {nombre: resultado} en el orden del registro. Cada hilo lee con su propia transaccion implicita, igual
+    # que antes cada consulta en autocommit: con escrituras en curso dos indicadores pueden ver momentos distintos
+    seleccion = seleccionar(nombres)
+    hilos = min(hilos, len(seleccion))
+    if hilos <= 1 or not en_paralelo_posible():
+        return {actual.nombre: actual.calcular(resumen) for actual in seleccion}
+    pendientes = queue.SimpleQueue()
+    for actual in seleccion:
+        pendientes.put(actual)
+    resultados = {}
+    ejecutor = obtener_pool(hilos)
+    futuros = [ejecutor.submit(trabajar, pendientes, resumen, resultados) for _ in range(hilos)]
+    for futuro in futuros:
+        # Reenvia la primera excepcion de un indicador (los demas hilos terminan lo suyo)
+        futuro.result()
+    return {actual.nombre: resultados[actual.nombre] for actual in seleccion}
+
+
+def reporte(resultados):
+    # Texto de los indicadores calculados, un bloque por indicador separados por una linea en blanco
+    return "\n\n".join(INDICADORES[nombre].mostrar(valor) for nombre, valor in resultados.items())
@@ -0,0 +1,171 @@
+# Instrumentacion del pipeline de GestionarObra: tiempo y filas por etapa, sentencias SQL ejecutadas y consultas
+# mas lentas. Las sentencias se cuentan con los query_hooks de peewee (cada QueryEvent trae el sql y su duracion).
+# Sin un Perfil activo etapa() no hace nada y no hay ningun hook registrado en la base.
+#
+#   with Perfil() as perfil:
+#       Implementacion.cargar_datos(df)
+#   perfil.mostrar()          # o perfil.reporte() para tenerlo como diccionario
+import functools
+import heapq
+import itertools
+import threading
+import time
+from modelo_orm import sqlite_db
+
+# Perfil en curso (None = instrumentacion apagada)
+perfil_activo = None
+
+
+class MedidaEtapa:
+    __slots__ = ('filas',)
+
+    def __init__(self):
+        self.filas = None
+
+
+class etapa:
+    # with etapa('limpiar_datos') as medida: ...; medida.filas = len(df)
+    __slots__ = ('nombre', 'perfil', 'medida', 'inicio')
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.perfil = perfil_activo
+
+    def __enter__(self):
+        self.medida = MedidaEtapa()
+        if self.perfil is not None:
+            self.perfil.abrir_etapa(self.nombre)
+            self.inicio = time.perf_counter()
+        return self.medida
+
+    def __exit__(self, *excepcion):
+        if self.perfil is not None:
+            self.perfil.cerrar_etapa(self.nombre, time.perf_counter() - self.inicio, self.medida.filas)
+        return False
+
+
+def contar_filas(valor):
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    return len(valor) if hasattr(valor, '__len__') else None
+
+
+def medir_etapa(filas=None):
+    # Decorador para metodos de GestionarObra: mide la llamada como una etapa con el nombre del metodo
+    # filas='entrada' cuenta el primer argumento (antes de llamar, limpiar_datos lo modifica), 'resultado' lo devuelto
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(cls, *args, **kwargs):
+            if perfil_activo is None:
+                return funcion(cls, *args, **kwargs)
+            with etapa(funcion.__name__) as medida:
+                if filas == 'entrada' and args:
+                    medida.filas = contar_filas(args[0])
+                resultado = funcion(cls, *args, **kwargs)
+                if filas == 'resultado':
+                    medida.filas = contar_filas(resultado)
+            return resultado
+        return envoltura
+    return decorador
+
+
+class Perfil:
+    def __init__(self, cantidad_lentas=10, largo_sql=300):
+        self.cantidad_lentas = cantidad_lentas
+        self.largo_sql = largo_sql
+        self.etapas = {}
+        # Heap acotado de (duracion, orden, sql, etapa) con las consultas mas lentas
+        self.lentas = []
+        self.orden = itertools.count()
+        self.consultas_totales = 0
+        self.segundos_sql = 0.0
+        self.duracion = None
+        self.bloqueo = threading.Lock()
+        # Etapas abiertas por hilo; las consultas se atribuyen a la mas interna
+        self.pilas = threading.local()
+
+    def __enter__(self):
+        global perfil_activo
+        self.anterior = perfil_activo
+        perfil_activo = self
+        sqlite_db.query_hooks.append(self.registrar_consulta)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        global perfil_activo
+        self.duracion = time.perf_counter() - self.inicio
+        sqlite_db.query_hooks.remove(self.registrar_consulta)
+        perfil_activo = self.anterior
+        return False
+
+    def pila(self):
+        if not hasattr(self.pilas, 'etapas'):
+            self.pilas.etapas = []
+        return self.pilas.etapas
+
+    def abrir_etapa(self, nombre):
+        # [nombre, segundos de las etapas anidadas] para calcular el tiempo propio de cada una
+        self.pila().append([nombre, 0.0])
+        with self.bloqueo:
+            self.etapas.setdefault(nombre, {'llamadas': 0, 'segundos': 0.0, 'segundos_propios': 0.0, 'filas': 0,
+                                            'consultas': 0, 'segundos_sql': 0.0})
+
+    def cerrar_etapa(self, nombre, duracion, filas):
+        pila = self.pila()
+        _, anidadas = pila.pop()
+        if pila:
+            pila[-1][1] += duracion
+        with self.bloqueo:
+            datos = self.etapas[nombre]
+            datos['llamadas'] += 1
+            # Una etapa recursiva (o repetida dentro de si misma) no suma dos veces el mismo tiempo
+            if not any(abierta[0] == nombre for abierta in pila):
+                datos['segundos'] += duracion
+            datos['segundos_propios'] += duracion - anidadas
+            datos['filas'] += filas or 0
+
+    def registrar_consulta(self, evento):
+        pila = self.pila()
+        nombre = pila[-1][0] if pila else None
+        with self.bloqueo:
+            self.consultas_totales += 1
+            self.segundos_sql += evento.duration
+            if nombre is not None:
+                self.etapas[nombre]['consultas'] += 1
+                self.etapas[nombre]['segundos_sql'] += evento.duration
+            consulta = (evento.duration, next(self.orden), evento.sql, nombre)
+            if len(self.lentas) < self.cantidad_lentas:
+                heapq.heappush(self.lentas, consulta)
+            elif consulta > self.lentas[0]:
+                heapq.heapreplace(self.lentas, consulta)
+
+    def reporte(self):
+        duracion = self.duracion if self.duracion is not None else time.perf_counter() - self.inicio
+        etapas = {}
+        for nombre, datos in self.etapas.items():
+            etapas[nombre] = dict(datos)
+            etapas[nombre]['filas_por_segundo'] = datos['filas'] / datos['segundos'] if datos['segundos'] > 0 else None
+        return {
+            'segundos': duracion,
+            'consultas': self.consultas_totales,
+            'segundos_sql': self.segundos_sql,
+            'etapas': etapas,
+            'consultas_lentas': [{'segundos': segundos, 'etapa': nombre, 'sql': sql[:self.largo_sql]}
+                                 for segundos, _, sql, nombre in sorted(self.lentas, reverse=True)],
+        }
+
+    def mostrar(self):
+        reporte = self.reporte()
+        print(f"\nPerfil: {reporte['segundos']:.2f}s, {reporte['consultas']} sentencias SQL "
+              f"({reporte['segundos_sql']:.2f}s en SQLite)")
+        print(f"{'etapa':28} {'llamadas':>8} {'segundos':>9} {'propios':>9} {'filas':>9} {'filas/s':>10} "
+              f"{'sql':>7} {'seg sql':>8}")
+        for nombre, datos in reporte['etapas'].items():
+            filas_por_segundo = f"{datos['filas_por_segundo']:.0f}" if datos['filas_por_segundo'] else "-"
+            print(f"{nombre:28} {datos['llamadas']:8} {datos['segundos']:9.3f} {datos['segundos_propios']:9.3f} "
+                  f"{datos['filas']:9} {filas_por_segundo:>10} {datos['consultas']:7} {datos['segundos_sql']:8.3f}")
+        print("Consultas mas lentas:")
+        for consulta in reporte['consultas_lentas']:
+            sql = ' '.join(consulta['sql'].split())[:120]
+            print(f"  {consulta['segundos'] * 1000:9.2f} ms  [{consulta['etapa'] or '-'}] {sql}")
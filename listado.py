@@ -0,0 +1,194 @@
+# Listado paginado de obras por keyset: cada pagina continua desde la clave (orden, id) de la ultima fila de la
+# anterior con WHERE (orden, id) > (?, ?) sobre un indice, en lugar de OFFSET (que recorre y descarta todas las filas
+# previas): la pagina 1000 cuesta lo mismo que la primera. Se leen solo las columnas pedidas como tuplas o
+# diccionarios, con los nombres de las lookups en el mismo SELECT. servir() publica el listado por HTTP en modo solo
+# lectura para el front end.
+#
+#   pagina = Implementacion.listar_obras(['id', 'nombre', 'etapa'], orden='fecha_inicio', etapa='Finalizada')
+#   Implementacion.listar_obras(['id', 'nombre', 'etapa'], orden='fecha_inicio', cursor=pagina['siguiente'])
+#   GET http://127.0.0.1:8000/obras?columnas=id,nombre,etapa&orden=fecha_inicio&etapa=Finalizada&cursor=...
+import base64
+import json
+from urllib.parse import parse_qs, urlparse
+from peewee import JOIN, Tuple, fn
+from modelo_orm import (sqlite_db, Obra, ObraDetalle, Etapa, Tipo, Comuna, Barrio, CAMPOS_DETALLE,
+                        TEXTO_NO_DISPONIBLE, coincide_lookup)
+from exportacion import LOOKUPS, COLUMNAS, como_lista
+
+# Columnas por las que se puede ordenar: sin NULL y con indice en obras (en SQLite el indice de una columna
+# termina en el rowid, asi (orden, id) se recorre en el orden del indice sin ordenar en memoria)
+ORDENES = ['id', 'fecha_inicio', 'fecha_fin_inicial', 'monto_contrato', 'plazo_meses', 'porcentaje_avance',
+           'mano_obra']
+COLUMNAS_POR_DEFECTO = ['id', 'nombre', 'etapa', 'tipo', 'comuna', 'barrio', 'monto_contrato', 'fecha_inicio',
+                        'porcentaje_avance']
+# Filtro -> tabla lookup; cada uno acepta un nombre o una lista de nombres
+FILTROS = {'etapa': Etapa, 'tipo': Tipo, 'comuna': Comuna, 'barrio': Barrio}
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 1000
+
+
+def codificar_cursor(valor, obra_id):
+    return base64.urlsafe_b64encode(json.dumps([valor, obra_id], default=str).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    # El cursor llega del cliente: el valor va a una comparacion de SQLite contra la columna de orden y tiene que
+    # ser un escalar (una lista o un diccionario terminan en "row value misused"), el id un entero
+    try:
+        valor, obra_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Cursor invalido: {cursor}") from None
+    if isinstance(valor, bool) or not isinstance(valor, (str, int, float, type(None))):
+        raise ValueError(f"Cursor invalido: {cursor}")
+    if isinstance(obra_id, bool) or not isinstance(obra_id, int):
+        raise ValueError(f"Cursor invalido: {cursor}")
+    return valor, obra_id
+
+
+def expresion(columna):
+    if columna in LOOKUPS:
+        return LOOKUPS[columna].nombre.alias(columna)
+    if columna in CAMPOS_DETALLE:
+        return fn.COALESCE(getattr(ObraDetalle, columna), TEXTO_NO_DISPONIBLE).alias(columna)
+    return getattr(Obra, columna)
+
+
+def consulta_pagina(columnas, orden, descendente, cursor, limite, filtros):
+    desconocidas = [columna for columna in columnas if columna not in COLUMNAS]
+    if desconocidas:
+        raise ValueError(f"Columnas desconocidas: {', '.join(desconocidas)}")
+    if orden not in ORDENES:
+        raise ValueError(f"No se puede ordenar por {orden} (opciones: {', '.join(ORDENES)})")
+
+    clave = getattr(Obra, orden)
+    # La clave de orden y el id van al final de cada fila para armar el cursor
+    consulta = Obra.select(*[expresion(columna) for columna in columnas], clave, Obra.id)
+    # Un JOIN por lookup pedida, no una consulta por fila como al leer obra.etapa.nombre
+    for columna in columnas:
+        if columna in LOOKUPS:
+            clase = LOOKUPS[columna]
+            consulta = consulta.join_from(Obra, clase, JOIN.LEFT_OUTER, on=(getattr(Obra, columna) == clase.id))
+    if any(columna in CAMPOS_DETALLE for columna in columnas):
+        consulta = consulta.join_from(Obra, ObraDetalle, JOIN.LEFT_OUTER, on=(ObraDetalle.obra == Obra.id))
+
+    # Los filtros van como subconsulta de ids sobre la lookup (por forma canonica) y usan los indices de obras
+    for columna, valor in filtros.items():
+        if valor is not None:
+            clase = FILTROS[columna]
+            ids = clase.select(clase.id).where(coincide_lookup(clase, como_lista(valor)))
+            consulta = consulta.where(getattr(Obra, columna).in_(ids))
+
+    if cursor is not None:
+        valor, ultimo_id = decodificar_cursor(cursor)
+        if orden == 'id':
+            condicion = Obra.id < ultimo_id if descendente else Obra.id > ultimo_id
+        elif descendente:
+            condicion = Tuple(clave, Obra.id) < Tuple(valor, ultimo_id)
+        else:
+            condicion = Tuple(clave, Obra.id) > Tuple(valor, ultimo_id)
+        consulta = consulta.where(condicion)
+
+    if descendente:
+        consulta = consulta.order_by(clave.desc(), Obra.id.desc())
+    else:
+        consulta = consulta.order_by(clave, Obra.id)
+    # Una fila de mas para saber si hay pagina siguiente
+    return consulta.limit(limite + 1).tuples()
+
+
+def pagina_obras(columnas=None, orden='id', descendente=False, cursor=None, limite=LIMITE_POR_DEFECTO,
+                 formato='dict', **filtros):
+    # Devuelve {'obras': [...], 'siguiente': cursor de la pagina siguiente o None si es la ultima}. formato 'dict'
+    # devuelve diccionarios y 'tupla' tuplas en el orden de `columnas`
+    columnas = list(columnas or COLUMNAS_POR_DEFECTO)
+    desconocidos = [filtro for filtro in filtros if filtro not in FILTROS]
+    if desconocidos:
+        raise ValueError(f"Filtros desconocidos: {', '.join(desconocidos)} (opciones: {', '.join(FILTROS)})")
+    if formato not in ('dict', 'tupla'):
+        raise ValueError(f"Formato desconocido: {formato} (opciones: dict, tupla)")
+    limite = min(max(int(limite), 1), LIMITE_MAXIMO)
+
+    filas = list(consulta_pagina(columnas, orden, descendente, cursor, limite, filtros))
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(*filas[-1][-2:])
+    cantidad = len(columnas)
+    if formato == 'dict':
+        obras = [dict(zip(columnas, fila[:cantidad])) for fila in filas]
+    else:
+        obras = [fila[:cantidad] for fila in filas]
+    return {'obras': obras, 'siguiente': siguiente}
+
+
+def recorrer_obras(columnas=None, orden='id', descendente=False, tamanio_pagina=LIMITE_MAXIMO, formato='dict',
+                   **filtros):
+    # Generador con todas las obras que cumplen los filtros, leidas de a una pagina
+    cursor = None
+    while True:
+        pagina = pagina_obras(columnas, orden, descendente, cursor, tamanio_pagina, formato, **filtros)
+        yield from pagina['obras']
+        cursor = pagina['siguiente']
+        if cursor is None:
+            return
+
+
+def argumentos_http(parametros):
+    # Query string -> argumentos de pagina_obras:
+    #   ?columnas=id,nombre&orden=monto_contrato&desc=1&limite=100&cursor=...&etapa=Finalizada&comuna=1&comuna=2
+    argumentos = {}
+    if 'columnas' in parametros:
+        argumentos['columnas'] = [columna for valor in parametros['columnas'] for columna in valor.split(',') if columna]
+    for nombre in ('orden', 'cursor', 'limite', 'formato'):
+        if nombre in parametros:
+            argumentos[nombre] = parametros[nombre][-1]
+    argumentos['descendente'] = parametros.get('desc', ['0'])[-1].lower() in ('1', 'true', 'si')
+    for filtro in FILTROS:
+        if filtro in parametros:
+            argumentos[filtro] = parametros[filtro]
+    return argumentos
+
+
+def responder(manejador, estado, cuerpo):
+    datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+    manejador.send_response(estado)
+    manejador.send_header('Content-Type', 'application/json; charset=utf-8')
+    manejador.send_header('Content-Length', str(len(datos)))
+    # El front end se sirve desde otro puerto local
+    manejador.send_header('Access-Control-Allow-Origin', '*')
+    manejador.end_headers()
+    manejador.wfile.write(datos)
+
+
+def atender(manejador):
+    # Solo GET /obras
+    url = urlparse(manejador.path)
+    if url.path.rstrip('/') != '/obras':
+        return responder(manejador, 404, {'error': f"No existe {url.path}, el listado esta en /obras"})
+    try:
+        pagina = pagina_obras(**argumentos_http(parse_qs(url.query)))
+    except ValueError as e:
+        return responder(manejador, 400, {'error': str(e)})
+    responder(manejador, 200, pagina)
+
+
+def servir(host='127.0.0.1', puerto=8000):
+    # http.server se importa aca: tarda mas que el resto de la CLI y solo lo usa este comando
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class ManejadorListado(BaseHTTPRequestHandler):
+        do_GET = atender
+
+    # Un solo hilo y una sola conexion de solo lectura (PRAGMA query_only) para todas las paginas
+    servidor = HTTPServer((host, puerto), ManejadorListado)
+    sqlite_db.connect(reuse_if_open=True)
+    sqlite_db.execute_sql("PRAGMA query_only = ON")
+    print(f"Listado de obras en http://{host}:{servidor.server_port}/obras (solo lectura, Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        # La conexion puede seguir en uso despues (conexion_persistente)
+        sqlite_db.execute_sql("PRAGMA query_only = OFF")
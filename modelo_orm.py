@@ -1,6 +1,21 @@
+import functools
+import threading
+from collections import OrderedDict
 from peewee import *
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.sqlite_ext import FTS5Model, RowIDField, SearchField
+from unidecode import unidecode
 
-sqlite_db = SqliteDatabase('obras_urbanas.db')
+# Pragmas que se aplican en cada conexion (ver GestionarObra.configurar_db para cambiarlos)
+PRAGMAS_SQLITE = {
+    'journal_mode': 'wal',      # lectores y escritor no se bloquean entre si
+    'synchronous': 'normal',    # con WAL es seguro y evita un fsync por transaccion
+    'cache_size': -64000,       # 64 MB de cache de paginas
+    'mmap_size': 268435456,     # 256 MB mapeados en memoria
+    'temp_store': 'memory',     # tablas temporales (DISTINCT, GROUP BY) en memoria
+}
+
+sqlite_db = SqliteDatabase('obras_urbanas.db', pragmas=PRAGMAS_SQLITE)
 
 # Definición de BaseModel
 class BaseModel(Model):
@@ -78,7 +93,78 @@ class Financiamiento(BaseModel):
     FIN DE LAS TABLAS LOOKUP
 '''
 
+# Resolucion de nombres de lookups: dos nombres que solo difieren en acentos, mayusculas o espacios ("Espacio Público"
+# y "Espacio publico ") son la misma fila, la primera que se cargo. La forma canonica se memoiza (el csv repite los
+# mismos nombres en miles de filas) y esta registrada como funcion canonica() de SQLite
+@functools.lru_cache(maxsize=8192)
+def forma_canonica(nombre):
+    if isinstance(nombre, str):
+        return ' '.join(unidecode(nombre).split()).casefold()
+    return nombre
+
+@sqlite_db.func('canonica', num_params=1, deterministic=True)
+def canonica_sql(nombre):
+    return forma_canonica(nombre)
+
+def clave_lookup(clase_lookup, nombre):
+    # db_value antes de canonizar: la comuna 1, 1.0 y "1" son la misma
+    return forma_canonica(clase_lookup.nombre.db_value(nombre))
+
+def coincide_lookup(clase_lookup, nombres):
+    # Condicion sobre la tabla lookup: nombre en `nombres` comparando las formas canonicas
+    claves = [clave_lookup(clase_lookup, nombre) for nombre in nombres]
+    if isinstance(clase_lookup.nombre, CharField):
+        return fn.canonica(clase_lookup.nombre).in_(claves)
+    return clase_lookup.nombre.in_(claves)
+
+class CacheLookups:
+    # (tabla lookup, forma canonica) -> id, con a lo sumo `maximo` entradas (se descartan las menos usadas). Solo se
+    # guardan ids ya confirmados: uno creado dentro de una transaccion podria desaparecer con un rollback
+    def __init__(self, maximo=4096):
+        self.maximo = maximo
+        self.entradas = OrderedDict()
+        self.bloqueo = threading.Lock()
+
+    def obtener(self, clase_lookup, clave):
+        with self.bloqueo:
+            id_ = self.entradas.get((clase_lookup, clave))
+            if id_ is not None:
+                self.entradas.move_to_end((clase_lookup, clave))
+            return id_
+
+    def guardar(self, clase_lookup, ids):
+        # ids: {forma canonica: id}
+        if clase_lookup._meta.database.in_transaction():
+            return
+        with self.bloqueo:
+            for clave, id_ in ids.items():
+                self.entradas[(clase_lookup, clave)] = id_
+                self.entradas.move_to_end((clase_lookup, clave))
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self.bloqueo:
+            self.entradas.clear()
+
+# Compartido por la carga del csv, nueva_obra, importar_obras y las transiciones de Obra
+cache_lookups = CacheLookups()
+
 # Modelo principal para los datos de la obra
+# Ciclo de vida de una obra: transicion -> (etapas desde las que se puede aplicar, etapa en la que queda)
+# None como destino: la obra sigue en su etapa. "En obra" es la variante de "En ejecución" que trae el csv
+ETAPAS_EN_EJECUCION = ("En ejecución", "En obra")
+TRANSICIONES_ETAPA = {
+    'iniciar_contratacion': (("Proyecto",), "En licitación"),
+    'adjudicar_obra': (("En licitación",), "Adjudicada"),
+    'iniciar_obra': (("Adjudicada",), "En ejecución"),
+    'actualizar_porcentaje_avance': (ETAPAS_EN_EJECUCION, None),
+    'incrementar_plazo': (("Adjudicada",) + ETAPAS_EN_EJECUCION, None),
+    'incrementar_mano_obra': (ETAPAS_EN_EJECUCION, None),
+    'finalizar_obra': (ETAPAS_EN_EJECUCION, "Finalizada"),
+    'rescindir_obra': (("En licitación", "Adjudicada") + ETAPAS_EN_EJECUCION, "Rescindida"),
+}
+
 class Obra(BaseModel):
     id = AutoField(primary_key=True)
     entorno = CharField()
@@ -86,21 +172,18 @@ class Obra(BaseModel):
     etapa = ForeignKeyField(Etapa, backref='etapa')
     tipo = ForeignKeyField(Tipo, backref='tipo')
     area_responsable = ForeignKeyField(AreaResponsable, backref='area_responsable')
-    descripcion = TextField()
     monto_contrato = FloatField()
     comuna = ForeignKeyField(Comuna, backref='comuna')
     barrio = ForeignKeyField(Barrio, backref='barrio')
     direccion = CharField()
-    lat = CharField()
-    lng = CharField()
+    lat = FloatField(null=True)
+    lng = FloatField(null=True)
+    # Celda de la grilla espacial (ver celda_de), indexada para busquedas por zona
+    celda = IntegerField(null=True, index=True)
     fecha_inicio = DateField()
     fecha_fin_inicial = DateField()
     plazo_meses = IntegerField()
     porcentaje_avance = FloatField()
-    imagen_1 = CharField()
-    imagen_2 = CharField()
-    imagen_3 = CharField()
-    imagen_4 = CharField()
     licitacion_oferta_empresa = ForeignKeyField(LicitacionEmpresa, backref='licitacion_oferta_empresa')
     licitacion_anio = IntegerField()
     contratacion_tipo = ForeignKeyField(ContratacionTipo, backref='contratacion_tipo')
@@ -108,55 +191,562 @@ class Obra(BaseModel):
     cuit_contratista = CharField()
     beneficiarios = CharField()
     mano_obra = IntegerField()
-    compromiso = TextField()
     destacada = TextField()
     ba_elige = TextField()
-    link_interno = CharField()
-    pliego_descarga = CharField()
     expediente_numero = CharField()
-    estudio_ambiental_descarga = CharField()
     financiamiento = ForeignKeyField(Financiamiento, backref='financiamiento')
+    # Los textos largos y links (CAMPOS_DETALLE) viven en obras_detalles y se leen recien al usarlos, ver ObraDetalle
+    # Textos en memoria de esta instancia y los que se modificaron y falta guardar
+    _detalle = None
+    _detalle_pendiente = None
+    _detalle_cargado = False
     def __str__(self):
         pass
     class Meta:
         db_table = 'obras'
+        # Indices compuestos para los filtros y agrupamientos de los indicadores (ver GestionarObra.verificar_indices)
+        indexes = (
+            (('etapa', 'plazo_meses'), False),
+            (('comuna', 'etapa', 'monto_contrato'), False),
+            (('comuna', 'barrio'), False),
+            (('tipo', 'monto_contrato'), False),
+            (('porcentaje_avance',), False),
+            (('mano_obra',), False),
+            (('monto_contrato',), False),
+            # Claves de orden del listado paginado (listado.py)
+            (('fecha_inicio',), False),
+            (('fecha_fin_inicial',), False),
+            (('plazo_meses',), False),
+        )
+
+    def textos_detalle(self):
+        # Carga perezosa: una sola consulta la primera vez que se lee un campo de detalle
+        if self._detalle is None:
+            self._detalle, self._detalle_pendiente = {}, set()
+        if not self._detalle_cargado and self.id is not None:
+            fila = (ObraDetalle.select(*[getattr(ObraDetalle, campo) for campo in CAMPOS_DETALLE])
+                    .where(ObraDetalle.obra == self.id).tuples().first()) or (None,) * len(CAMPOS_DETALLE)
+            for campo, valor in zip(CAMPOS_DETALLE, fila):
+                # Lo asignado antes de cargar tiene prioridad sobre lo guardado
+                if campo not in self._detalle_pendiente:
+                    self._detalle[campo] = texto_detalle(valor)
+            self._detalle_cargado = True
+        return self._detalle
+
+    def save(self, *args, **kwargs):
+        with self._meta.database.atomic():
+            resultado = super().save(*args, **kwargs)
+            if self._detalle_pendiente:
+                valores = {campo: valor_detalle(self._detalle[campo]) for campo in self._detalle_pendiente}
+                (ObraDetalle.insert(obra=self.id, **valores)
+                 .on_conflict(conflict_target=[ObraDetalle.obra],
+                              preserve=[getattr(ObraDetalle, campo) for campo in valores])
+                 .execute())
+                self._detalle_pendiente.clear()
+        return resultado
 
     def nuevo_proyecto(self, registro):
         # self.etapa = "Proyecto"
-        try:
-            # Intenta obtener la instancia de Etapa con nombre "Proyecto"
-            self.etapa = Etapa.get(Etapa.nombre == "Proyecto")
-        except DoesNotExist:
-            # Si no existe, crea una nueva instancia de Etapa y guárdala
-            self.etapa = Etapa.create(nombre="Proyecto")
-            print(f"Etapa 'Proyecto' creada.")
-            
+        # Obtiene (o crea) la etapa "Proyecto" por forma canonica
+        self.etapa = self.resolver_lookup(Etapa, "Proyecto")
+
         print(f"Obra creada exitosamente.")
         registro.save()
         # print("Elija uno de loas barrios existentes")
         # self.tipo = input("Ingrese el barrio")
         # registro.save()
 
-    def iniciar_contratacion(self):
-        pass
+    # Transiciones del ciclo de vida. Cada una existe en forma masiva (classmethod *_masivo) que aplica a todas las
+    # obras que cumplen `condicion` con un unico UPDATE dentro de una transaccion, y en forma individual sobre self.
+    # Solo se actualizan las obras que estan en una etapa valida para la transicion (ver TRANSICIONES_ETAPA), las
+    # demas se informan como rechazadas. Ejemplos:
+    #   Obra.actualizar_porcentaje_avance_masivo(Obra.comuna.in_(Comuna.select(Comuna.id).where(Comuna.nombre == 3)), 10)
+    #   Obra.finalizar_obra_masivo(Obra.porcentaje_avance >= 100)
+    @classmethod
+    def transicion_masiva(cls, transicion, condicion=None, **valores):
+        etapas_validas, etapa_nueva = TRANSICIONES_ETAPA[transicion]
+        if condicion is None:
+            condicion = SQL('1 = 1')
+        with cls._meta.database.atomic():
+            # Las etapas se resuelven una sola vez: ids validos (por forma canonica, el csv trae
+            # "En ejecución" y "En Ejecución") y el id de la etapa destino
+            ids_validos = Etapa.select(Etapa.id).where(coincide_lookup(Etapa, etapas_validas))
+            if etapa_nueva is not None:
+                valores['etapa'] = cls.resolver_lookup(Etapa, etapa_nueva)
+            rechazadas = cls.select().where(condicion & cls.etapa.not_in(ids_validos)).count()
+            actualizadas = cls.update(**valores).where(condicion & cls.etapa.in_(ids_validos)).execute()
+        if rechazadas:
+            print(f"{transicion}: {rechazadas} obras rechazadas por no estar en etapa {', '.join(etapas_validas)}")
+        return actualizadas
 
-    def adjudicar_obra(self):
-        pass
+    @classmethod
+    def resolver_lookup(cls, clase_lookup, nombre):
+        # Id de la fila con la misma forma canonica que `nombre` (la de menor id si hubiera duplicados viejos); si no
+        # hay ninguna se crea con el nombre tal como vino
+        clave = clave_lookup(clase_lookup, nombre)
+        id_ = cache_lookups.obtener(clase_lookup, clave)
+        if id_ is None:
+            # Primero el nombre exacto (usa el indice unico), si no esta cualquier variante (recorre la tabla)
+            fila = clase_lookup.get_or_none(clase_lookup.nombre == nombre)
+            if fila is None:
+                fila = (clase_lookup.select(clase_lookup.id).where(coincide_lookup(clase_lookup, [nombre]))
+                        .order_by(clase_lookup.id).first())
+            if fila is not None:
+                id_ = fila.id
+            else:
+                try:
+                    with clase_lookup._meta.database.atomic():
+                        id_ = clase_lookup.create(nombre=nombre).id
+                except IntegrityError:
+                    # Otro hilo o proceso la creo entre el SELECT y el INSERT
+                    id_ = clase_lookup.get(clase_lookup.nombre == nombre).id
+            cache_lookups.guardar(clase_lookup, {clave: id_})
+        return id_
 
-    def iniciar_obra(self):
-        pass
+    @classmethod
+    def iniciar_contratacion_masivo(cls, condicion, contratacion_tipo, nro_contratacion=None):
+        valores = {'contratacion_tipo': cls.resolver_lookup(ContratacionTipo, contratacion_tipo)}
+        if nro_contratacion is not None:
+            valores['nro_contratacion'] = nro_contratacion
+        return cls.transicion_masiva('iniciar_contratacion', condicion, **valores)
 
-    def actualizar_porcentaje_avance(self):
-        pass
+    @classmethod
+    def adjudicar_obra_masivo(cls, condicion, empresa, expediente_numero=None):
+        valores = {'licitacion_oferta_empresa': cls.resolver_lookup(LicitacionEmpresa, empresa)}
+        if expediente_numero is not None:
+            valores['expediente_numero'] = expediente_numero
+        return cls.transicion_masiva('adjudicar_obra', condicion, **valores)
 
-    def incrementar_plazo(self):
-        pass
+    @classmethod
+    def iniciar_obra_masivo(cls, condicion, fecha_inicio, fecha_fin_inicial=None, financiamiento=None,
+                            mano_obra=None, destacada=None):
+        valores = {'fecha_inicio': fecha_inicio}
+        if fecha_fin_inicial is not None:
+            valores['fecha_fin_inicial'] = fecha_fin_inicial
+        if financiamiento is not None:
+            valores['financiamiento'] = cls.resolver_lookup(Financiamiento, financiamiento)
+        if mano_obra is not None:
+            valores['mano_obra'] = mano_obra
+        if destacada is not None:
+            valores['destacada'] = destacada
+        return cls.transicion_masiva('iniciar_obra', condicion, **valores)
 
-    def incrementar_mano_obra(self):
-        pass
+    @classmethod
+    def actualizar_porcentaje_avance_masivo(cls, condicion, puntos):
+        # Suma `puntos` al avance, acotado entre 0 y 100
+        return cls.transicion_masiva('actualizar_porcentaje_avance', condicion,
+                                     porcentaje_avance=fn.MAX(0, fn.MIN(100, cls.porcentaje_avance + puntos)))
+
+    @classmethod
+    def incrementar_plazo_masivo(cls, condicion, meses):
+        return cls.transicion_masiva('incrementar_plazo', condicion, plazo_meses=cls.plazo_meses + meses)
+
+    @classmethod
+    def incrementar_mano_obra_masivo(cls, condicion, cantidad):
+        return cls.transicion_masiva('incrementar_mano_obra', condicion, mano_obra=cls.mano_obra + cantidad)
+
+    @classmethod
+    def finalizar_obra_masivo(cls, condicion):
+        return cls.transicion_masiva('finalizar_obra', condicion, porcentaje_avance=100)
+
+    @classmethod
+    def rescindir_obra_masivo(cls, condicion):
+        return cls.transicion_masiva('rescindir_obra', condicion)
+
+    # Forma individual: la misma transicion restringida a esta obra, despues se recargan sus valores
+    def aplicar_transicion(self, metodo_masivo, *args, **kwargs):
+        actualizada = metodo_masivo(type(self).id == self.id, *args, **kwargs) == 1
+        if actualizada:
+            self.__data__.update(type(self).get_by_id(self.id).__data__)
+            self._dirty.clear()
+        return actualizada
+
+    def iniciar_contratacion(self, contratacion_tipo, nro_contratacion=None):
+        return self.aplicar_transicion(self.iniciar_contratacion_masivo, contratacion_tipo, nro_contratacion)
+
+    def adjudicar_obra(self, empresa, expediente_numero=None):
+        return self.aplicar_transicion(self.adjudicar_obra_masivo, empresa, expediente_numero)
+
+    def iniciar_obra(self, fecha_inicio, fecha_fin_inicial=None, financiamiento=None, mano_obra=None, destacada=None):
+        return self.aplicar_transicion(self.iniciar_obra_masivo, fecha_inicio, fecha_fin_inicial, financiamiento,
+                                       mano_obra, destacada)
+
+    def actualizar_porcentaje_avance(self, puntos):
+        return self.aplicar_transicion(self.actualizar_porcentaje_avance_masivo, puntos)
+
+    def incrementar_plazo(self, meses):
+        return self.aplicar_transicion(self.incrementar_plazo_masivo, meses)
+
+    def incrementar_mano_obra(self, cantidad):
+        return self.aplicar_transicion(self.incrementar_mano_obra_masivo, cantidad)
 
     def finalizar_obra(self):
-        pass
+        return self.aplicar_transicion(self.finalizar_obra_masivo)
 
     def rescindir_obra(self):
-        pass
\ No newline at end of file
+        return self.aplicar_transicion(self.rescindir_obra_masivo)
+
+# Particion vertical de obras: los textos largos y links que casi no se leen van a obras_detalles, asi la tabla obras
+# (la que recorren los indicadores) queda con columnas numericas y foreign keys. Los rellenos de "sin dato" se guardan
+# como NULL (no ocupan lugar) y se devuelven como TEXTO_NO_DISPONIBLE al leerlos
+CAMPOS_DETALLE = ['descripcion', 'compromiso', 'imagen_1', 'imagen_2', 'imagen_3', 'imagen_4', 'link_interno',
+                  'pliego_descarga', 'estudio_ambiental_descarga']
+TEXTO_NO_DISPONIBLE = "no disponible"
+# Rellenos conocidos (en minusculas y sin espacios alrededor): el "-" del csv, el de limpiar_datos y los que ponian
+# las versiones anteriores de nueva_obra. limpiar_datos los lleva a TEXTO_NO_DISPONIBLE y obras_detalles a NULL
+RELLENOS = ("", "-", TEXTO_NO_DISPONIBLE, "n/a", "link no disponible", "link de pliego no disponible",
+            "link de estudio ambiental no disponible")
+
+def es_relleno(texto):
+    return texto is None or texto != texto or str(texto).strip().lower() in RELLENOS
+
+def condicion_relleno(columna):
+    # La misma regla que es_relleno en SQL (los rellenos no tienen comillas ni caracteres fuera de ASCII)
+    rellenos = ', '.join(f"'{relleno}'" for relleno in RELLENOS)
+    return f"lower(trim({columna})) IN ({rellenos})"
+
+def valor_detalle(texto):
+    # Texto -> valor guardado en obras_detalles
+    return None if es_relleno(texto) else texto
+
+def texto_detalle(valor):
+    # Valor guardado en obras_detalles -> texto
+    return TEXTO_NO_DISPONIBLE if valor is None else valor
+
+class ObraDetalle(BaseModel):
+    obra = ForeignKeyField(Obra, primary_key=True, backref='+', on_delete='CASCADE')
+    descripcion = TextField(null=True)
+    compromiso = TextField(null=True)
+    imagen_1 = CharField(null=True)
+    imagen_2 = CharField(null=True)
+    imagen_3 = CharField(null=True)
+    imagen_4 = CharField(null=True)
+    link_interno = CharField(null=True)
+    pliego_descarga = CharField(null=True)
+    estudio_ambiental_descarga = CharField(null=True)
+    class Meta:
+        db_table = 'obras_detalles'
+
+def propiedad_detalle(campo):
+    def leer(self):
+        return self.textos_detalle().get(campo, TEXTO_NO_DISPONIBLE)
+    def escribir(self, valor):
+        # Asignar no consulta la base; se guarda con el proximo save()
+        if self._detalle is None:
+            self._detalle, self._detalle_pendiente = {}, set()
+        self._detalle[campo] = valor
+        self._detalle_pendiente.add(campo)
+    return property(leer, escribir)
+
+for campo in CAMPOS_DETALLE:
+    setattr(Obra, campo, propiedad_detalle(campo))
+
+def triggers_detalle():
+    # SQLite no aplica ON DELETE CASCADE sin PRAGMA foreign_keys, el detalle se borra con la obra
+    return {
+        'obras_detalle_delete': f"CREATE TRIGGER IF NOT EXISTS obras_detalle_delete AFTER DELETE ON {Obra._meta.table_name} BEGIN\n"
+                                f"    DELETE FROM {ObraDetalle._meta.table_name} WHERE obra_id = OLD.id;\nEND;",
+    }
+
+# Huella (hash del contenido de la fila del csv) de cada obra, para la sincronizacion incremental
+class ObraHuella(BaseModel):
+    obra = ForeignKeyField(Obra, primary_key=True, backref='huella')
+    huella = CharField()
+    eliminada = BooleanField(default=False)
+    class Meta:
+        db_table = 'obras_huellas'
+
+# Obras con fechas que migrar_fechas no pudo pasar a ISO (por ejemplo vacias): quedan como estaban y no se revisan de
+# nuevo en cada arranque
+class ObraFechaInvalida(BaseModel):
+    obra_id = IntegerField(primary_key=True)
+    class Meta:
+        db_table = 'obras_fechas_invalidas'
+
+# Marca de carga masiva: mientras tiene una fila los triggers por fila de obras (resumenes, version, obras_cambios e
+# indice de texto) no hacen nada y al terminar se rehace todo por conjuntos (ver GestionarObra.carga_sin_triggers)
+class CargaMasiva(BaseModel):
+    id = IntegerField(primary_key=True)
+    class Meta:
+        db_table = 'carga_masiva'
+
+SIN_CARGA_MASIVA = "WHEN NOT EXISTS (SELECT 1 FROM carga_masiva)"
+
+
+'''
+    TABLAS RESUMEN DE LOS INDICADORES
+    Se mantienen con triggers sobre obras (ver RESUMENES) y se reconstruyen con GestionarObra.reconstruir_resumenes
+'''
+
+class ResumenEtapa(BaseModel):
+    etapa = ForeignKeyField(Etapa, primary_key=True, backref='resumen')
+    cantidad_obras = IntegerField(default=0)
+    monto_total = FloatField(default=0)
+    class Meta:
+        db_table = 'resumen_etapas'
+
+class ResumenTipo(BaseModel):
+    tipo = ForeignKeyField(Tipo, primary_key=True, backref='resumen')
+    cantidad_obras = IntegerField(default=0)
+    monto_total = FloatField(default=0)
+    class Meta:
+        db_table = 'resumen_tipos'
+
+class ResumenComuna(BaseModel):
+    comuna = ForeignKeyField(Comuna, backref='resumen', index=False)
+    barrio = ForeignKeyField(Barrio, backref='resumen', index=False)
+    etapa = ForeignKeyField(Etapa, backref='resumen_comunas', index=False)
+    cantidad_obras = IntegerField(default=0)
+    monto_total = FloatField(default=0)
+    class Meta:
+        db_table = 'resumen_comunas'
+        primary_key = CompositeKey('comuna', 'barrio', 'etapa')
+
+class ResumenPlazo(BaseModel):
+    etapa = ForeignKeyField(Etapa, backref='resumen_plazos', index=False)
+    plazo_meses = IntegerField()
+    cantidad_obras = IntegerField(default=0)
+    class Meta:
+        db_table = 'resumen_plazos'
+        primary_key = CompositeKey('etapa', 'plazo_meses')
+
+# Una sola fila (id = 1) con los totales generales
+class ResumenGeneral(BaseModel):
+    id = IntegerField(primary_key=True)
+    cantidad_obras = IntegerField(default=0)
+    cantidad_finalizadas = IntegerField(default=0)
+    total_mano_obra = IntegerField(default=0)
+    total_inversion = FloatField(default=0)
+    class Meta:
+        db_table = 'resumen_general'
+
+# Series de tiempo por comuna y tipo: evento 'inicio' agrupa por fecha_inicio y 'vencimiento' por fecha_fin_inicial
+# (anio y mes en 0 = fecha sin dato o invalida)
+class ResumenMensual(BaseModel):
+    evento = CharField()
+    anio = IntegerField()
+    mes = IntegerField()
+    comuna = ForeignKeyField(Comuna, backref='resumen_mensual', index=False)
+    tipo = ForeignKeyField(Tipo, backref='resumen_mensual', index=False)
+    cantidad_obras = IntegerField(default=0)
+    monto_total = FloatField(default=0)
+    total_mano_obra = IntegerField(default=0)
+    class Meta:
+        db_table = 'resumen_mensual'
+        primary_key = CompositeKey('evento', 'anio', 'mes', 'comuna', 'tipo')
+
+class ResumenAnual(BaseModel):
+    evento = CharField()
+    anio = IntegerField()
+    comuna = ForeignKeyField(Comuna, backref='resumen_anual', index=False)
+    tipo = ForeignKeyField(Tipo, backref='resumen_anual', index=False)
+    cantidad_obras = IntegerField(default=0)
+    monto_total = FloatField(default=0)
+    total_mano_obra = IntegerField(default=0)
+    class Meta:
+        db_table = 'resumen_anual'
+        primary_key = CompositeKey('evento', 'anio', 'comuna', 'tipo')
+
+# Columna de fecha de cada evento de las series
+EVENTOS_FECHA = {'inicio': 'fecha_inicio', 'vencimiento': 'fecha_fin_inicial'}
+
+def claves_periodo(evento, mensual):
+    fecha = '{f}.' + EVENTOS_FECHA[evento]
+    claves = {'evento': f"'{evento}'", 'anio': f"COALESCE(CAST(strftime('%Y', {fecha}) AS INTEGER), 0)"}
+    if mensual:
+        claves['mes'] = f"COALESCE(CAST(strftime('%m', {fecha}) AS INTEGER), 0)"
+    claves.update({'comuna_id': '{f}.comuna_id', 'tipo_id': '{f}.tipo_id'})
+    return claves
+
+VALORES_PERIODO = {'cantidad_obras': '1', 'monto_total': '{f}.monto_contrato', 'total_mano_obra': '{f}.mano_obra'}
+
+# (modelo, claves, valores): cada expresion se evalua sobre la fila de obras ({f} es NEW, OLD u obras)
+# y los valores se suman por clave. De aca salen los triggers y la reconstruccion completa.
+RESUMENES = [
+    (ResumenEtapa, {'etapa_id': '{f}.etapa_id'},
+     {'cantidad_obras': '1', 'monto_total': '{f}.monto_contrato'}),
+    (ResumenTipo, {'tipo_id': '{f}.tipo_id'},
+     {'cantidad_obras': '1', 'monto_total': '{f}.monto_contrato'}),
+    (ResumenComuna, {'comuna_id': '{f}.comuna_id', 'barrio_id': '{f}.barrio_id', 'etapa_id': '{f}.etapa_id'},
+     {'cantidad_obras': '1', 'monto_total': '{f}.monto_contrato'}),
+    (ResumenPlazo, {'etapa_id': '{f}.etapa_id', 'plazo_meses': '{f}.plazo_meses'},
+     {'cantidad_obras': '1'}),
+    (ResumenGeneral, {'id': '1'},
+     {'cantidad_obras': '1', 'cantidad_finalizadas': '({f}.porcentaje_avance = 100)',
+      'total_mano_obra': 'MAX({f}.mano_obra, 0)', 'total_inversion': 'MAX({f}.monto_contrato, 0)'}),
+] + [(modelo, claves_periodo(evento, modelo is ResumenMensual), VALORES_PERIODO)
+     for modelo in (ResumenMensual, ResumenAnual) for evento in EVENTOS_FECHA]
+
+def sentencias_resumen(fila, signo):
+    # Sentencias que suman (signo '+') o restan (signo '-') la fila NEW/OLD en cada tabla resumen
+    sentencias = []
+    for modelo, claves, valores in RESUMENES:
+        tabla = modelo._meta.table_name
+        columnas = list(claves) + list(valores)
+        expresiones = [e.format(f=fila) for e in claves.values()] + \
+                      [f"{signo}({e.format(f=fila)})" for e in valores.values()]
+        acumular = ', '.join(f"{c} = {c} + excluded.{c}" for c in valores)
+        sentencias.append(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(expresiones)}) "
+                          f"ON CONFLICT ({', '.join(claves)}) DO UPDATE SET {acumular};")
+        if signo == '-' and modelo is not ResumenGeneral:
+            # Saco los grupos que quedaron vacios
+            donde = ' AND '.join(f"{c} = {e.format(f=fila)}" for c, e in claves.items())
+            sentencias.append(f"DELETE FROM {tabla} WHERE {donde} AND cantidad_obras <= 0;")
+    return sentencias
+
+def triggers_resumen():
+    tabla = Obra._meta.table_name
+    campos = ('etapa_id, tipo_id, comuna_id, barrio_id, plazo_meses, monto_contrato, porcentaje_avance, mano_obra, '
+              'fecha_inicio, fecha_fin_inicial')
+    cuerpos = {
+        'obras_resumen_insert': (f"AFTER INSERT ON {tabla}", sentencias_resumen('NEW', '+')),
+        'obras_resumen_delete': (f"AFTER DELETE ON {tabla}", sentencias_resumen('OLD', '-')),
+        'obras_resumen_update': (f"AFTER UPDATE OF {campos} ON {tabla}",
+                                 sentencias_resumen('OLD', '-') + sentencias_resumen('NEW', '+')),
+    }
+    return {nombre: f"CREATE TRIGGER IF NOT EXISTS {nombre} {evento} {SIN_CARGA_MASIVA} BEGIN\n    " +
+                    '\n    '.join(cuerpo) + "\nEND;"
+            for nombre, (evento, cuerpo) in cuerpos.items()}
+
+@functools.lru_cache(maxsize=64)
+def sentencia_insercion(modelo, campos, filas, ignorar_repetidas=False):
+    # INSERT de `filas` filas con los campos (nombres de campo del modelo) en ese orden, con un placeholder por valor.
+    # Se arma una vez por forma de lote: insert_many rearma el SQL valor por valor en cada lote
+    columnas = ', '.join(f'"{modelo._meta.fields[campo].column_name}"' for campo in campos)
+    fila = f"({', '.join('?' * len(campos))})"
+    return (f'INSERT {"OR IGNORE " if ignorar_repetidas else ""}INTO "{modelo._meta.table_name}" ({columnas}) '
+            f"VALUES {', '.join([fila] * filas)}")
+
+def consulta_reconstruccion(modelo, claves, valores):
+    # INSERT ... SELECT que recalcula la tabla resumen completa desde obras
+    columnas = list(claves) + list(valores)
+    expresiones = [e.format(f='obras') for e in claves.values()] + \
+                  [f"SUM({e.format(f='obras')})" for e in valores.values()]
+    return (f"INSERT INTO {modelo._meta.table_name} ({', '.join(columnas)}) "
+            f"SELECT {', '.join(expresiones)} FROM {Obra._meta.table_name} AS obras "
+            f"GROUP BY {', '.join(e.format(f='obras') for e in claves.values())}")
+
+
+# Contador de version de los datos (una sola fila, id = 1), lo incrementan triggers en cada escritura
+class VersionDatos(BaseModel):
+    id = IntegerField(primary_key=True)
+    version = IntegerField(default=0)
+    class Meta:
+        db_table = 'version_datos'
+
+# Tablas cuyas escrituras invalidan los resultados cacheados de los indicadores
+TABLAS_VERSIONADAS = [Etapa, Tipo, AreaResponsable, Comuna, Barrio, LicitacionEmpresa, ContratacionTipo, Financiamiento, Obra]
+
+def triggers_version():
+    triggers = {}
+    for modelo in TABLAS_VERSIONADAS:
+        tabla = modelo._meta.table_name
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            nombre = f"{tabla}_version_{evento.lower()}"
+            triggers[nombre] = (f"CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON {tabla} {SIN_CARGA_MASIVA} BEGIN\n"
+                                f"    UPDATE {VersionDatos._meta.table_name} SET version = version + 1 WHERE id = 1;\nEND;")
+    return triggers
+
+# Version en la que cambio por ultima vez cada obra (alta, modificacion o baja); las copias en memoria de obras
+# (ver analitica.py) se refrescan leyendo solo las obras con version mayor a la suya
+class ObraCambio(BaseModel):
+    obra_id = IntegerField(primary_key=True)
+    version = IntegerField(index=True)
+    class Meta:
+        db_table = 'obras_cambios'
+
+def triggers_cambios():
+    tabla = Obra._meta.table_name
+    triggers = {}
+    for evento, fila in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        nombre = f"{tabla}_cambios_{evento.lower()}"
+        # SQLite no asegura el orden entre triggers: con el + 1 la marca nunca queda por debajo de la version
+        # que incrementa el trigger de version_datos (a lo sumo la obra se relee una vez de mas)
+        triggers[nombre] = (f"CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON {tabla} {SIN_CARGA_MASIVA} BEGIN\n"
+                            f"    INSERT INTO {ObraCambio._meta.table_name} (obra_id, version)\n"
+                            f"    VALUES ({fila}.id, (SELECT version FROM {VersionDatos._meta.table_name} WHERE id = 1) + 1)\n"
+                            f"    ON CONFLICT(obra_id) DO UPDATE SET version = excluded.version;\nEND;")
+    return triggers
+
+
+
+# Grilla espacial: celdas de TAMANIO_CELDA grados (~1 km) numeradas fila * COLUMNAS_CELDA + columna
+TAMANIO_CELDA = 0.01
+COLUMNAS_CELDA = 100000
+
+def celda_de(lat, lng):
+    # Igual que EXPRESION_CELDA (lat + 90 y lng + 180 son positivos, int trunca igual que CAST)
+    return int((lat + 90) / TAMANIO_CELDA) * COLUMNAS_CELDA + int((lng + 180) / TAMANIO_CELDA)
+
+EXPRESION_CELDA = (f"CAST(({{f}}.lat + 90) / {TAMANIO_CELDA} AS INTEGER) * {COLUMNAS_CELDA} + "
+                   f"CAST(({{f}}.lng + 180) / {TAMANIO_CELDA} AS INTEGER)")
+
+def triggers_celda():
+    # La carga masiva ya trae la celda calculada, estos triggers cubren el resto de las escrituras
+    tabla = Obra._meta.table_name
+    celda = EXPRESION_CELDA.format(f='NEW')
+    return {
+        'obras_celda_insert': f"CREATE TRIGGER IF NOT EXISTS obras_celda_insert AFTER INSERT ON {tabla} "
+                              f"WHEN NEW.celda IS NULL AND NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL BEGIN\n"
+                              f"    UPDATE {tabla} SET celda = {celda} WHERE id = NEW.id;\nEND;",
+        'obras_celda_update': f"CREATE TRIGGER IF NOT EXISTS obras_celda_update AFTER UPDATE OF lat, lng ON {tabla} BEGIN\n"
+                              f"    UPDATE {tabla} SET celda = CASE WHEN NEW.lat IS NULL OR NEW.lng IS NULL THEN NULL "
+                              f"ELSE {celda} END WHERE id = NEW.id;\nEND;",
+    }
+
+
+
+# Indice de texto completo de obras (rowid = Obra.id), se mantiene con los triggers de triggers_busqueda
+class ObraBusqueda(FTS5Model):
+    rowid = RowIDField()
+    nombre = SearchField()
+    descripcion = SearchField()
+    direccion = SearchField()
+    class Meta:
+        database = sqlite_db
+        db_table = 'obras_busqueda'
+        # remove_diacritics 2: "informacion" encuentra "información"
+        options = {'tokenize': 'unicode61 remove_diacritics 2'}
+
+CAMPOS_BUSQUEDA = ['nombre', 'descripcion', 'direccion']
+
+def texto_busqueda(fila, campo):
+    # El csv trae guiones blandos (char 173) dentro de palabras como "Secretarí­a", que cortarian el token
+    return f"replace({fila}.{campo}, char(173), '')"
+
+def texto_busqueda_obra(fila, campo):
+    # Los campos de detalle se leen de obras_detalles (puede no existir todavia, se completa con su propio trigger)
+    if campo in CAMPOS_DETALLE:
+        return (f"(SELECT {texto_busqueda('d', campo)} FROM {ObraDetalle._meta.table_name} AS d "
+                f"WHERE d.obra_id = {fila}.id)")
+    return texto_busqueda(fila, campo)
+
+def triggers_busqueda():
+    tabla = Obra._meta.table_name
+    detalles = ObraDetalle._meta.table_name
+    busqueda = ObraBusqueda._meta.table_name
+    columnas = ', '.join(CAMPOS_BUSQUEDA)
+    nuevos = ', '.join(texto_busqueda_obra('NEW', campo) for campo in CAMPOS_BUSQUEDA)
+    campos_obra = [campo for campo in CAMPOS_BUSQUEDA if campo not in CAMPOS_DETALLE]
+    campos_detalle = [campo for campo in CAMPOS_BUSQUEDA if campo in CAMPOS_DETALLE]
+    asignaciones = ', '.join(f"{campo} = {texto_busqueda('NEW', campo)}" for campo in campos_obra)
+    asignaciones_detalle = ', '.join(f"{campo} = {texto_busqueda('NEW', campo)}" for campo in campos_detalle)
+    return {
+        'obras_busqueda_insert': f"CREATE TRIGGER IF NOT EXISTS obras_busqueda_insert AFTER INSERT ON {tabla} {SIN_CARGA_MASIVA} BEGIN\n"
+                                 f"    INSERT INTO {busqueda} (rowid, {columnas}) VALUES (NEW.id, {nuevos});\nEND;",
+        'obras_busqueda_delete': f"CREATE TRIGGER IF NOT EXISTS obras_busqueda_delete AFTER DELETE ON {tabla} {SIN_CARGA_MASIVA} BEGIN\n"
+                                 f"    DELETE FROM {busqueda} WHERE rowid = OLD.id;\nEND;",
+        'obras_busqueda_update': f"CREATE TRIGGER IF NOT EXISTS obras_busqueda_update AFTER UPDATE OF {', '.join(campos_obra)} ON {tabla} {SIN_CARGA_MASIVA} BEGIN\n"
+                                 f"    UPDATE {busqueda} SET {asignaciones} WHERE rowid = NEW.id;\nEND;",
+        'obras_detalles_busqueda_insert': f"CREATE TRIGGER IF NOT EXISTS obras_detalles_busqueda_insert AFTER INSERT ON {detalles} {SIN_CARGA_MASIVA} BEGIN\n"
+                                          f"    UPDATE {busqueda} SET {asignaciones_detalle} WHERE rowid = NEW.obra_id;\nEND;",
+        'obras_detalles_busqueda_update': f"CREATE TRIGGER IF NOT EXISTS obras_detalles_busqueda_update AFTER UPDATE OF {', '.join(campos_detalle)} ON {detalles} {SIN_CARGA_MASIVA} BEGIN\n"
+                                          f"    UPDATE {busqueda} SET {asignaciones_detalle} WHERE rowid = NEW.obra_id;\nEND;",
+    }
+
+def consulta_reconstruccion_busqueda():
+    columnas = ', '.join(CAMPOS_BUSQUEDA)
+    textos = ', '.join(texto_busqueda('detalles' if campo in CAMPOS_DETALLE else 'obras', campo) for campo in CAMPOS_BUSQUEDA)
+    return (f"INSERT INTO {ObraBusqueda._meta.table_name} (rowid, {columnas}) "
+            f"SELECT obras.id, {textos} FROM {Obra._meta.table_name} AS obras "
+            f"LEFT JOIN {ObraDetalle._meta.table_name} AS detalles ON detalles.obra_id = obras.id")
@@ -0,0 +1,41 @@
+# Fixtures comunes: un csv sintetico chico (benchmark.generar_csv_sintetico) limpiado una sola vez por sesion y una
+# base nueva en un directorio temporal por test, cargada con ese csv
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generar_csv_sintetico
+from gestionar_obras import GestionarObra
+from modelo_orm import sqlite_db
+
+FILAS = 400
+
+
+class Pruebas(GestionarObra):
+    pass
+
+
+@pytest.fixture(scope='session')
+def csv_sintetico(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp('csv')
+    return generar_csv_sintetico(str(directorio / 'obras.csv'), FILAS, semilla=1)
+
+
+@pytest.fixture(scope='session')
+def datos_limpios(csv_sintetico):
+    Pruebas.archivo_csv = csv_sintetico
+    Pruebas.archivo_limpio = os.path.join(os.path.dirname(csv_sintetico), 'csv_limpiado.csv')
+    return Pruebas.limpiar_datos(Pruebas.extraer_datos())
+
+
+@pytest.fixture
+def base(tmp_path, datos_limpios):
+    # Devuelve la implementacion de GestionarObra apuntando a una base recien cargada
+    ruta_original = sqlite_db.database
+    Pruebas.configurar_db(str(tmp_path / 'obras.db'))
+    Pruebas.mapear_orm()
+    Pruebas.cargar_datos(datos_limpios.copy())
+    yield Pruebas
+    Pruebas.configurar_db(ruta_original, persistente=True)
@@ -0,0 +1,23 @@
+import pytest
+from modelo_orm import Obra
+
+pytest.importorskip('numpy')
+
+
+def test_indicadores_en_memoria_iguales_a_sql(base):
+    motor = base.analitica()
+    assert motor.indicadores() == base.calcular_indicadores()
+    assert motor.indicadores() == base.calcular_indicadores(usar_resumen=False)
+
+
+def test_indicadores_en_memoria_despues_de_cambios(base):
+    base.conectar_db()
+    base.analitica()
+    Obra.update(porcentaje_avance=100).where(Obra.id % 3 == 0).execute()
+    Obra.delete().where(Obra.id % 7 == 0).execute()
+    assert base.analitica().indicadores() == base.calcular_indicadores(usar_resumen=False)
+
+
+def test_indicador_desconocido(base):
+    with pytest.raises(ValueError):
+        base.analitica().indicadores(['no_existe'])
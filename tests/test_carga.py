@@ -0,0 +1,36 @@
+from modelo_orm import Obra, ObraDetalle, Etapa, Barrio, forma_canonica
+
+
+def obras_cargadas():
+    return list(Obra.select(Obra.id, Obra.nombre, Obra.monto_contrato, Obra.plazo_meses, Obra.fecha_inicio)
+                .order_by(Obra.id).tuples())
+
+
+def test_carga_masiva_inserta_todas_las_filas(base, datos_limpios):
+    base.conectar_db()
+    assert Obra.select().count() == ObraDetalle.select().count() == len(datos_limpios)
+    assert sorted(obra_id for (obra_id,) in Obra.select(Obra.id).tuples()) == sorted(datos_limpios['id'].astype(int))
+
+    # Las lookups quedan resueltas a la fila de su forma canonica
+    etapas = {obra_id: nombre for obra_id, nombre in Obra.select(Obra.id, Etapa.nombre).join(Etapa).tuples()}
+    barrios = {obra_id: nombre for obra_id, nombre in Obra.select(Obra.id, Barrio.nombre).join(Barrio).tuples()}
+    for fila in datos_limpios[['id', 'etapa', 'barrio']].itertuples(index=False):
+        assert forma_canonica(etapas[fila.id]) == forma_canonica(fila.etapa)
+        assert forma_canonica(barrios[fila.id]) == forma_canonica(fila.barrio)
+
+
+def test_carga_masiva_no_depende_del_tamanio_de_lote(base, datos_limpios, tmp_path):
+    base.conectar_db()
+    esperadas = obras_cargadas()
+
+    base.configurar_db(str(tmp_path / 'lotes_chicos.db'))
+    base.mapear_orm()
+    base.conectar_db()
+    assert base.cargar_datos_masivo(datos_limpios.copy(), tamanio_lote=7) == len(datos_limpios)
+    assert obras_cargadas() == esperadas
+
+
+def test_carga_masiva_ignora_ids_repetidos(base, datos_limpios):
+    base.conectar_db()
+    assert base.cargar_datos_masivo(datos_limpios.head(20).copy()) == 0
+    assert Obra.select().count() == len(datos_limpios)
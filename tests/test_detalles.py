@@ -0,0 +1,44 @@
+from modelo_orm import sqlite_db, Obra, ObraDetalle, CAMPOS_DETALLE, TEXTO_NO_DISPONIBLE
+
+
+def detalle_guardado(obra_id):
+    return (ObraDetalle.select(*[getattr(ObraDetalle, campo) for campo in CAMPOS_DETALLE])
+            .where(ObraDetalle.obra == obra_id).dicts().get())
+
+
+def test_rellenos_se_guardan_como_null(base, datos_limpios):
+    base.conectar_db()
+    # limpiar_datos deja un solo relleno; el "-" del csv no llega a la base
+    assert not datos_limpios['ba_elige'].astype(str).eq('-').any()
+    assert ObraDetalle.select().where(ObraDetalle.imagen_1 == TEXTO_NO_DISPONIBLE).count() == 0
+
+    obra = Obra.select().first()
+    obra.imagen_1, obra.imagen_2, obra.link_interno = "N/a", "-", "Link no disponible"
+    obra.pliego_descarga = base.valores_por_defecto['pliego_descarga']
+    obra.compromiso = "Si"
+    obra.save()
+
+    guardado = detalle_guardado(obra.id)
+    assert guardado['compromiso'] == "Si"
+    assert all(guardado[campo] is None for campo in ['imagen_1', 'imagen_2', 'link_interno', 'pliego_descarga'])
+    assert Obra.get_by_id(obra.id).imagen_2 == TEXTO_NO_DISPONIBLE
+
+
+def test_migracion_pasa_los_rellenos_viejos_a_null(base):
+    base.conectar_db()
+    obra_id = Obra.select(Obra.id).scalar()
+    # Lo que dejaba nueva_obra antes de la version 3 del esquema
+    (ObraDetalle.update(imagen_1="N/a", link_interno="link no disponible", descripcion="Plaza nueva",
+                        estudio_ambiental_descarga="link de estudio ambiental no disponible")
+     .where(ObraDetalle.obra == obra_id).execute())
+    sqlite_db.pragma('user_version', 2)
+    base.cerrar_db()
+
+    base.mapear_orm()
+
+    base.conectar_db()
+    guardado = detalle_guardado(obra_id)
+    assert guardado['descripcion'] == "Plaza nueva"
+    assert guardado['imagen_1'] is None and guardado['link_interno'] is None
+    assert guardado['estudio_ambiental_descarga'] is None
+    assert sqlite_db.pragma('user_version') == base.version_esquema
@@ -0,0 +1,75 @@
+import threading
+import pytest
+import escritura
+from modelo_orm import Obra, ResumenGeneral
+
+PRODUCTORES = 8
+OBRAS_POR_PRODUCTOR = 25
+
+
+def registros_obra(datos_limpios):
+    df = datos_limpios.drop(columns='id')
+    df.columns = [columna.replace('-', '_') for columna in df.columns]
+    return df.to_dict('records')
+
+
+def test_escritor_no_pierde_escrituras_concurrentes(base, datos_limpios):
+    registros = registros_obra(datos_limpios)
+    base.conectar_db()
+    antes = Obra.select().count()
+    ids, errores = [], []
+    bloqueo = threading.Lock()
+
+    with base.escritor_obras() as escritor:
+        def producir(numero):
+            try:
+                propios = []
+                for i in range(OBRAS_POR_PRODUCTOR):
+                    propios.append(escritor.crear_obra(registros[(numero * OBRAS_POR_PRODUCTOR + i) % len(registros)]))
+                    if i % 5 == 0:
+                        escritor.actualizar_obra(propios[-1].result(), porcentaje_avance=50)
+                with bloqueo:
+                    ids.extend(futuro.result() for futuro in propios)
+            except Exception as e:
+                with bloqueo:
+                    errores.append(e)
+
+        hilos = [threading.Thread(target=producir, args=(numero,)) for numero in range(PRODUCTORES)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+    assert errores == []
+    assert len(ids) == len(set(ids)) == PRODUCTORES * OBRAS_POR_PRODUCTOR
+    en_base = {obra_id for (obra_id,) in Obra.select(Obra.id).tuples()}
+    assert set(ids) <= en_base
+    assert len(en_base) == antes + len(ids)
+    assert ResumenGeneral.select(ResumenGeneral.cantidad_obras).scalar() == len(en_base)
+    assert escritor.confirmadas >= len(ids) and escritor.fallidas == 0
+
+
+def test_escritor_aisla_la_operacion_que_falla(base, datos_limpios):
+    registros = registros_obra(datos_limpios)
+    base.conectar_db()
+    antes = Obra.select().count()
+
+    def alta_que_falla(campos):
+        # Escribe y despues falla: el savepoint tiene que deshacer el alta
+        escritura.insertar_obra(dict(campos, nombre="Alta que falla"))
+        raise ValueError("falla a proposito")
+
+    with base.escritor_obras() as escritor:
+        anterior = escritor.crear_obra(registros[0])
+        fallida = escritor.enviar(alta_que_falla, registros[1])
+        siguiente = escritor.crear_obra(registros[2])
+        inexistente = escritor.actualizar_obra(10 ** 9, porcentaje_avance=10)
+
+    with pytest.raises(ValueError):
+        fallida.result()
+    assert inexistente.result() == 0
+    assert Obra.select().where(Obra.id.in_([anterior.result(), siguiente.result()])).count() == 2
+    assert Obra.select().where(Obra.nombre == "Alta que falla").count() == 0
+    assert Obra.select().count() == antes + 2
+    assert escritor.fallidas == 1
+    assert base.reconstruir_resumenes() == {}
@@ -0,0 +1,121 @@
+import json
+import threading
+import pandas as pd
+import escritura
+from modelo_orm import fn, Obra, ObraDetalle, TEXTO_NO_DISPONIBLE
+
+
+def obras_nuevas(datos_limpios, cantidad):
+    # Solo filas completas: las que tienen algun NaN se rechazarian
+    nuevas = datos_limpios.dropna().head(cantidad).drop(columns='id')
+    nuevas.columns = [columna.replace('-', '_') for columna in nuevas.columns]
+    return nuevas.astype(str).to_dict('records')
+
+
+def test_importar_obras_validas_y_rechazadas(base, datos_limpios, tmp_path):
+    registros = obras_nuevas(datos_limpios, 6)
+    registros[0]['monto_contrato'] = "mucho"
+    registros[1]['nombre'] = ""
+    archivo = tmp_path / 'nuevas.json'
+    archivo.write_text(json.dumps(registros))
+    base.conectar_db()
+    antes = Obra.select().count()
+
+    resultado = base.importar_obras(str(archivo))
+
+    assert resultado['importadas'] == 4 and resultado['rechazadas'] == 2
+    assert Obra.select().count() == antes + 4
+    assert Obra.select().where(Obra.id.in_(resultado['ids'])).count() == 4
+    rechazadas = (tmp_path / 'nuevas_rechazadas.csv').read_text()
+    assert 'monto_contrato' in rechazadas and 'nombre' in rechazadas
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_importar_csv_con_columna_vacia(base, datos_limpios, tmp_path):
+    # Una columna vacia en todos los registros llega como NaN sin texto: se informa, no corta la importacion
+    registros = pd.DataFrame(obras_nuevas(datos_limpios, 4))
+    registros['imagen_1'] = ''
+    registros['beneficiarios'] = ''
+    archivo = tmp_path / 'sin_beneficiarios.csv'
+    registros.to_csv(archivo, sep=';', index=False)
+
+    resultado = base.importar_obras(str(archivo))
+
+    assert resultado['importadas'] == 0 and resultado['rechazadas'] == 4
+    assert 'beneficiarios' in (tmp_path / 'sin_beneficiarios_rechazadas.csv').read_text()
+
+    # Sin beneficiarios vacios importa todo; imagen_1 vacia toma el valor por defecto
+    registros['beneficiarios'] = '100'
+    registros.to_csv(archivo, sep=';', index=False)
+    resultado = base.importar_obras(str(archivo))
+    assert resultado['importadas'] == 4
+    assert {Obra.get_by_id(obra_id).imagen_1 for obra_id in resultado['ids']} == {TEXTO_NO_DISPONIBLE}
+    assert ObraDetalle.select().where(ObraDetalle.obra.in_(resultado['ids']), ObraDetalle.imagen_1.is_null()).count() == 4
+
+
+def test_importar_un_registro_con_un_campo_nulo(base, datos_limpios, tmp_path):
+    registro = obras_nuevas(datos_limpios, 1)[0]
+    registro['direccion'] = None
+    archivo = tmp_path / 'una.json'
+    archivo.write_text(json.dumps([registro]))
+
+    resultado = base.importar_obras(str(archivo))
+
+    assert resultado['importadas'] == 0 and resultado['rechazadas'] == 1
+    assert 'direccion' in (tmp_path / 'una_rechazadas.csv').read_text()
+
+
+def test_enteros_con_la_misma_regla_que_verificando_entero(base, datos_limpios, tmp_path):
+    registros = obras_nuevas(datos_limpios, 4)
+    for registro, plazo in zip(registros, ["1_000", " 12 ", "1.0", "1e3"]):
+        registro['plazo_meses'] = plazo
+    archivo = tmp_path / 'plazos.json'
+    archivo.write_text(json.dumps(registros))
+
+    resultado = base.importar_obras(str(archivo))
+
+    assert resultado['importadas'] == 2
+    assert sorted(Obra.get_by_id(obra_id).plazo_meses for obra_id in resultado['ids']) == [12, 1000]
+    assert base.verificando_entero("1_000") == 1000 and base.verificando_entero(" 12 ") == 12
+
+
+def test_importar_mientras_otro_escritor_da_altas(base, datos_limpios, tmp_path):
+    # El escritor unico tiene un alta sin confirmar cuando empieza la importacion: los ids nuevos no pueden chocar
+    registros = obras_nuevas(datos_limpios, 4)
+    archivo = tmp_path / 'nuevas.json'
+    archivo.write_text(json.dumps(registros[1:]))
+    base.conectar_db()
+    antes = Obra.select().count()
+    empezo, seguir = threading.Event(), threading.Event()
+
+    def alta_lenta(campos):
+        obra_id = escritura.insertar_obra(campos)
+        empezo.set()
+        seguir.wait(5)
+        return obra_id
+
+    with base.escritor_obras() as escritor:
+        futuro = escritor.enviar(alta_lenta, registros[0])
+        assert empezo.wait(5)
+        threading.Timer(0.2, seguir.set).start()
+        resultado = base.importar_obras(str(archivo))
+
+    assert resultado['importadas'] == 3
+    assert futuro.result() not in resultado['ids']
+    assert Obra.select().count() == antes + 4
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_importar_informa_el_lote_que_falla_y_sigue(base, datos_limpios, tmp_path):
+    archivo = tmp_path / 'nuevas.json'
+    archivo.write_text(json.dumps(obras_nuevas(datos_limpios, 3)))
+    base.conectar_db()
+    # Un detalle huerfano ocupa el id que le tocaria a la segunda obra nueva
+    ocupado = Obra.select(fn.MAX(Obra.id)).scalar() + 2
+    ObraDetalle.insert(obra=ocupado).execute()
+
+    resultado = base.importar_obras(str(archivo), tamanio_lote=1)
+
+    assert resultado['importadas'] == 2 and ocupado not in resultado['ids']
+    assert Obra.select().where(Obra.id.in_(resultado['ids'])).count() == 2
+    assert Obra.get_or_none(Obra.id == ocupado) is None
@@ -0,0 +1,108 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+import listado
+from modelo_orm import Obra
+
+# Paginas chicas para que haya muchos cortes de pagina, varios en medio de valores repetidos
+TAMANIO_PAGINA = 7
+
+
+def ids_por_offset(orden, descendente):
+    clave = getattr(Obra, orden)
+    orden_sql = (clave.desc(), Obra.id.desc()) if descendente else (clave, Obra.id)
+    ids = []
+    while True:
+        pagina = [obra_id for (obra_id,) in
+                  Obra.select(Obra.id).order_by(*orden_sql).offset(len(ids)).limit(TAMANIO_PAGINA).tuples()]
+        ids.extend(pagina)
+        if len(pagina) < TAMANIO_PAGINA:
+            return ids
+
+
+@pytest.mark.parametrize('descendente', [False, True])
+@pytest.mark.parametrize('orden', listado.ORDENES)
+def test_keyset_igual_a_offset(base, orden, descendente):
+    base.conectar_db()
+    obras = list(listado.recorrer_obras(['id', orden], orden, descendente, tamanio_pagina=TAMANIO_PAGINA))
+    assert [obra['id'] for obra in obras] == ids_por_offset(orden, descendente)
+
+
+@pytest.mark.parametrize('descendente', [False, True])
+def test_cursor_en_valores_repetidos(base, descendente):
+    # plazo_meses se repite mucho: el cursor tiene que desempatar por id y no saltear ni repetir obras
+    base.conectar_db()
+    vistos, cortes_en_empate, cursor = [], 0, None
+    while True:
+        pagina = base.listar_obras(['id', 'plazo_meses'], orden='plazo_meses', descendente=descendente,
+                                   cursor=cursor, limite=TAMANIO_PAGINA)
+        if vistos and pagina['obras'] and vistos[-1]['plazo_meses'] == pagina['obras'][0]['plazo_meses']:
+            cortes_en_empate += 1
+        vistos.extend(pagina['obras'])
+        cursor = pagina['siguiente']
+        if cursor is None:
+            break
+    assert cortes_en_empate > 0
+    assert [obra['id'] for obra in vistos] == ids_por_offset('plazo_meses', descendente)
+
+
+@pytest.fixture
+def servidor(base):
+    class ManejadorListado(BaseHTTPRequestHandler):
+        do_GET = listado.atender
+
+        def log_message(self, *args):
+            pass
+
+    servidor = HTTPServer(('127.0.0.1', 0), ManejadorListado)
+    hilo = threading.Thread(target=servidor.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def pedir(url):
+    try:
+        with urlopen(url) as respuesta:
+            return respuesta.status, json.loads(respuesta.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_http_devuelve_pagina(servidor):
+    estado, cuerpo = pedir(f"{servidor}/obras?columnas=id,nombre&orden=plazo_meses&limite=5")
+    assert estado == 200
+    assert len(cuerpo['obras']) == 5 and cuerpo['siguiente'] is not None
+    estado, siguiente = pedir(f"{servidor}/obras?columnas=id,nombre&orden=plazo_meses&limite=5"
+                              f"&cursor={cuerpo['siguiente']}")
+    assert estado == 200
+    assert not {obra['id'] for obra in cuerpo['obras']} & {obra['id'] for obra in siguiente['obras']}
+
+
+def cursor_armado(valor, obra_id):
+    # Cursor valido en base64 y JSON pero con tipos que no genera codificar_cursor
+    return base64.urlsafe_b64encode(json.dumps([valor, obra_id]).encode()).decode()
+
+
+@pytest.mark.parametrize('consulta', ['cursor=no-es-un-cursor', 'cursor=' + listado.codificar_cursor(1, 'x'),
+                                      'orden=nombre', 'limite=muchas', 'columnas=id,inexistente',
+                                      'formato=xml',
+                                      'orden=plazo_meses&cursor=' + cursor_armado([1, 2], 5),
+                                      'orden=plazo_meses&cursor=' + cursor_armado({'a': 1}, 5),
+                                      'orden=plazo_meses&cursor=' + cursor_armado(3, [5]),
+                                      'orden=plazo_meses&cursor=' + cursor_armado(3, 5.5),
+                                      'orden=plazo_meses&cursor=' + cursor_armado(True, 5),
+                                      'orden=plazo_meses&cursor=' + base64.urlsafe_b64encode(b'[1, 2, 3]').decode()])
+def test_http_400_con_parametros_invalidos(servidor, consulta):
+    estado, cuerpo = pedir(f"{servidor}/obras?{consulta}")
+    assert estado == 400
+    assert cuerpo['error']
+
+
+def test_http_404_fuera_del_listado(servidor):
+    assert pedir(f"{servidor}/indicadores")[0] == 404
@@ -0,0 +1,63 @@
+from modelo_orm import Obra, Comuna, ResumenGeneral, ResumenEtapa, ResumenMensual, ObraBusqueda, ObraCambio, CargaMasiva
+
+
+def test_resumenes_al_dia_despues_de_altas_cambios_y_bajas(base):
+    base.conectar_db()
+    # Alta copiando una obra existente, cambios en columnas resumidas y bajas
+    obra = Obra.select().first()
+    obra.id = None
+    obra.save(force_insert=True)
+    Obra.update(plazo_meses=Obra.plazo_meses + 3, monto_contrato=Obra.monto_contrato * 2).where(Obra.id % 4 == 0).execute()
+    Obra.update(comuna=Comuna.select(Comuna.id).limit(1)).where(Obra.id % 5 == 0).execute()
+    Obra.delete().where(Obra.id % 9 == 0).execute()
+
+    assert ResumenGeneral.select(ResumenGeneral.cantidad_obras).scalar() == Obra.select().count()
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_reconstruir_resumenes_informa_desvios(base):
+    base.conectar_db()
+    ResumenEtapa.update(cantidad_obras=ResumenEtapa.cantidad_obras + 1).execute()
+    assert base.reconstruir_resumenes() == {'resumen_etapas': 2 * ResumenEtapa.select().count()}
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_carga_masiva_rehace_lo_que_mantienen_los_triggers(base, datos_limpios):
+    # La base del fixture se cargo con carga_sin_triggers: sin marca, resumenes al dia, indice de texto completo y
+    # todas las obras en obras_cambios con la version de la carga
+    base.conectar_db()
+    assert not CargaMasiva.select().exists()
+    assert ObraBusqueda.select().count() == len(datos_limpios)
+    version = base.version_datos()
+    assert version > 0
+    assert ObraCambio.select().where(ObraCambio.version == version).count() == len(datos_limpios)
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_triggers_apagados_durante_la_carga_masiva(base):
+    base.conectar_db()
+    version = base.version_datos()
+    mensual = ResumenMensual.select().count()
+    with base.carga_sin_triggers():
+        Obra.update(monto_contrato=Obra.monto_contrato + 1, fecha_inicio='2030-01-15').where(Obra.id % 2 == 0).execute()
+        # Ninguna tabla derivada se entera hasta el final
+        assert base.version_datos() == version
+        assert ResumenMensual.select().count() == mensual
+    assert base.version_datos() > version
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_mapear_orm_termina_una_carga_masiva_cortada(base):
+    base.conectar_db()
+    CargaMasiva.insert(id=1).execute()
+    Obra.delete().where(Obra.id % 3 == 0).execute()
+    # Los triggers no restaron las bajas
+    assert ResumenGeneral.get_by_id(1).cantidad_obras != Obra.select().count()
+
+    base.mapear_orm()
+
+    base.conectar_db()
+    assert not CargaMasiva.select().exists()
+    assert ResumenGeneral.get_by_id(1).cantidad_obras == Obra.select().count()
+    assert ObraBusqueda.select().count() == Obra.select().count()
+    assert base.reconstruir_resumenes() == {}
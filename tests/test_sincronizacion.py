@@ -0,0 +1,31 @@
+import pandas as pd
+from modelo_orm import sqlite_db, Obra, ObraHuella
+
+
+def test_sincronizar_mismos_datos_no_modifica_filas(base, datos_limpios):
+    base.conectar_db()
+    version = base.version_datos()
+    cambios_antes = sqlite_db.connection().total_changes
+
+    resultado = base.sincronizar_datos(datos_limpios.copy())
+
+    assert resultado == {'nuevas': 0, 'modificadas': 0, 'eliminadas': 0}
+    assert sqlite_db.connection().total_changes == cambios_antes
+    assert base.version_datos() == version
+
+
+def test_sincronizar_detecta_nuevas_modificadas_y_eliminadas(base, datos_limpios):
+    df = datos_limpios.copy()
+    df.loc[df.index[0], 'plazo_meses'] += 1
+    nueva = df.iloc[[1]].copy()
+    nueva['id'] = df['id'].max() + 1
+    df = pd.concat([df.iloc[:-1], nueva])
+
+    base.conectar_db()
+    resultado = base.sincronizar_datos(df)
+
+    assert resultado == {'nuevas': 1, 'modificadas': 1, 'eliminadas': 1}
+    assert Obra.get_by_id(int(df['id'].iloc[0])).plazo_meses == df['plazo_meses'].iloc[0]
+    assert ObraHuella.get_by_id(int(datos_limpios['id'].iloc[-1])).eliminada
+    # Una segunda pasada con los mismos datos ya no escribe nada
+    assert base.sincronizar_datos(df) == {'nuevas': 0, 'modificadas': 0, 'eliminadas': 0}
@@ -0,0 +1,42 @@
+from modelo_orm import Obra, Etapa, forma_canonica
+
+
+def en_etapas(*nombres):
+    canonicas = {forma_canonica(nombre) for nombre in nombres}
+    return Obra.etapa.in_([etapa.id for etapa in Etapa.select() if forma_canonica(etapa.nombre) in canonicas])
+
+
+def test_transiciones_masivas_solo_en_etapas_validas(base):
+    base.conectar_db()
+    en_ejecucion = en_etapas("En ejecución", "En obra")
+    finalizadas = en_etapas("Finalizada")
+    cantidad = Obra.select().where(en_ejecucion).count()
+    avances = dict(Obra.select(Obra.id, Obra.porcentaje_avance).where(en_ejecucion).tuples())
+
+    assert Obra.actualizar_porcentaje_avance_masivo(en_ejecucion, 10) == cantidad > 0
+    for obra_id, avance in Obra.select(Obra.id, Obra.porcentaje_avance).where(en_ejecucion).tuples():
+        assert avance == min(100, avances[obra_id] + 10)
+    # Las finalizadas no estan en una etapa valida: se rechazan sin cambios
+    assert Obra.incrementar_plazo_masivo(finalizadas, 2) == 0
+    assert Obra.finalizar_obra_masivo(en_ejecucion) == cantidad
+    assert Obra.select().where(en_ejecucion).count() == 0
+
+    assert base.reconstruir_resumenes() == {}
+
+
+def test_ciclo_de_vida_individual(base):
+    base.conectar_db()
+    obra = Obra.select().first()
+    obra.etapa = Obra.resolver_lookup(Etapa, "Proyecto")
+    obra.save()
+
+    assert not obra.iniciar_obra("2024-03-01")
+    assert obra.iniciar_contratacion("Licitación Pública")
+    assert obra.adjudicar_obra("Constructora de prueba S.A.")
+    assert obra.iniciar_obra("2024-03-01", "2025-03-01", mano_obra=20)
+    assert obra.actualizar_porcentaje_avance(150)
+    assert obra.porcentaje_avance == 100 and obra.mano_obra == 20
+    assert obra.finalizar_obra()
+    assert obra.etapa.nombre == "Finalizada"
+
+    assert base.reconstruir_resumenes() == {}